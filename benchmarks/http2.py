@@ -0,0 +1,136 @@
+"""
+HTTP/1.1 (aiohttp, the default) against HTTP/2 (HTTP2Transport, h2c) calls to a local
+hypercorn server answering after 10 ms: throughput, latency, gateway-side CPU time
+per call and the number of connections the server saw.
+
+Requires httpx, h2 and hypercorn.
+
+    python benchmarks/http2.py [requests] [concurrency]
+"""
+import asyncio
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+from fastapi_gateway import HTTP2Transport
+from fastapi_gateway.network import make_request
+
+HOST = "127.0.0.1:8010"
+URL = f"http://{HOST}"
+RESPONSE_DELAY = 0.01
+connections = set()
+
+
+async def app(scope, receive, send):
+    """Answers {"ok": true} after RESPONSE_DELAY, /connections - connections seen so far."""
+    if scope["type"] != "http":
+        return
+    if scope["path"] == "/connections":
+        body = json.dumps({"connections": len(connections)}).encode()
+        connections.clear()
+    else:
+        connections.add(scope["client"])
+        await asyncio.sleep(RESPONSE_DELAY)
+        body = b'{"ok": true}'
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", b"application/json")],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+def serve():
+    from hypercorn.asyncio import serve as hypercorn_serve
+    from hypercorn.config import Config
+
+    config = Config()
+    config.bind = [HOST]
+    config.loglevel = "WARNING"
+    # The default 100 concurrent streams per connection would be the bottleneck.
+    config.h2_max_concurrent_streams = 1000
+    # By default a connection is closed after 1000 requests, calls racing that close fail.
+    config.keep_alive_max_requests = 10 ** 9
+    asyncio.run(hypercorn_serve(app, config))
+
+
+async def run(name: str, call, requests: int, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            body, status, _ = await call()
+            latencies.append(time.perf_counter() - started)
+            assert status == 200, status
+
+    await asyncio.gather(*(one() for _ in range(concurrency)))  # warm up
+    latencies.clear()
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    cpu = (time.process_time() - cpu_started) / requests
+    elapsed = time.perf_counter() - started
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{URL}/connections") as response:
+            seen = (await response.json())["connections"]
+    latencies.sort()
+    print(
+        f"{name:<32} {requests / elapsed:7.0f} req/s"
+        f"  p50 {statistics.median(latencies) * 1000:6.1f} ms"
+        f"  p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms"
+        f"  cpu {cpu * 1e6:5.0f} us/call"
+        f"  connections {seen}"
+    )
+
+
+async def main(requests: int, concurrency: int):
+    headers = {"accept": "application/json"}
+    for limit in (100, 0):
+        connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit)
+        async with aiohttp.ClientSession(connector=connector) as session:
+
+            async def call():
+                return await make_request(
+                    session=session, url=f"{URL}/", method="get", headers=headers
+                )
+
+            name = f"aiohttp HTTP/1.1 limit={limit or 'none'}"
+            await run(name, call, requests, concurrency)
+
+    for max_connections in (1, 4):
+        transport = HTTP2Transport(h2c=True, max_connections=max_connections)
+
+        async def call():
+            return await transport.make_request(url=f"{URL}/", method="get", headers=headers)
+
+        name = f"HTTP2Transport h2c connections={max_connections}"
+        await run(name, call, requests, concurrency)
+        await transport.close()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["serve"]:
+        serve()
+        sys.exit()
+
+    server = subprocess.Popen([sys.executable, __file__, "serve"])
+    try:
+        time.sleep(1.5)
+        asyncio.run(
+            main(
+                requests=int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+                concurrency=int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+            )
+        )
+    finally:
+        server.terminate()
+        server.wait()
@@ -0,0 +1,72 @@
+"""
+Encode and decode time of every JSON codec on typical payload shapes.
+
+    python benchmarks/json_codecs.py [iterations]
+"""
+import datetime
+import sys
+import time
+from typing import List
+
+from pydantic import BaseModel
+
+from fastapi_gateway import OrjsonCodec, StdlibJSONCodec, UjsonCodec
+from fastapi_gateway.utils.body import serialize_body_content
+
+
+class Address(BaseModel):
+    city: str
+    street: str
+    building: int
+
+
+class User(BaseModel):
+    id: int
+    name: str
+    email: str
+    created: datetime.datetime
+    addresses: List[Address]
+
+
+def create_user(index: int) -> User:
+    return User(
+        id=index,
+        name=f"пользователь {index}",
+        email=f"user{index}@example.com",
+        created=datetime.datetime(2024, 1, 1, 12, 0),
+        addresses=[
+            Address(city="Moscow", street=f"street {index}", building=building)
+            for building in range(3)
+        ],
+    )
+
+
+PAYLOADS = {
+    "small object": {"id": 1, "name": "foo", "active": True, "score": 1.5},
+    "nested model": create_user(1),
+    "1000 models": [create_user(index).dict() for index in range(1000)],
+    "10000 numbers": list(range(10000)),
+}
+
+
+def measure(function, iterations: int) -> float:
+    function()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def main(iterations: int):
+    print(f"{'payload':<14} {'codec':<6} {'encode us':>10} {'decode us':>10}")
+    for name, payload in PAYLOADS.items():
+        count = iterations if name in ("small object", "nested model") else iterations // 100
+        for codec in (OrjsonCodec(), UjsonCodec(), StdlibJSONCodec()):
+            encoded = serialize_body_content(payload, codec=codec)
+            encode = measure(lambda: serialize_body_content(payload, codec=codec), count)
+            decode = measure(lambda: codec.loads(encoded), count)
+            print(f"{name:<14} {codec.name:<6} {encode:>10.1f} {decode:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,57 @@
+"""
+Cost of a rate limit check with the in-process backend: the bucket update alone
+and the whole gateway-wide middleware around an empty ASGI app.
+
+    python benchmarks/rate_limit.py [iterations]
+"""
+import asyncio
+import sys
+import time
+
+from fastapi_gateway import RateLimit, RateLimitMiddleware
+
+SCOPE = {
+    "type": "http",
+    "method": "GET",
+    "path": "/",
+    "headers": [(b"x-api-key", b"key")],
+    "client": ("10.0.0.1", 50000),
+}
+
+
+async def empty_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def measure(name: str, function, iterations: int):
+    await function()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await function()
+    elapsed = (time.perf_counter() - started) / iterations
+    print(f"{name}: {elapsed * 1e6:5.2f} us per request")
+
+
+async def main(iterations: int):
+    rate_limit = RateLimit(rate=10 ** 9, header="x-api-key")
+    middleware = RateLimitMiddleware(empty_app, rate_limit=rate_limit)
+
+    async def check():
+        rate_limit.raw_headers(await rate_limit.hit("key"))
+
+    await measure("bucket check + headers", check, iterations)
+    await measure("empty app             ", lambda: empty_app(SCOPE, receive, send), iterations)
+    await measure("middleware + empty app", lambda: middleware(SCOPE, receive, send), iterations)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000))
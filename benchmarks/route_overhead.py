@@ -0,0 +1,140 @@
+"""
+Gateway overhead of one proxied call: everything route() does per request
+except the network, the microservice is replaced by a stub.
+
+    python benchmarks/route_overhead.py [iterations] [metrics] [tracing|unsampled]
+
+With "metrics" the gateway client collects Prometheus metrics, with "tracing"
+it records OpenTelemetry spans (an SDK tracer provider without exporters),
+with "unsampled" the tracer provider samples nothing.
+"""
+import asyncio
+import sys
+import time
+from typing import Optional
+from unittest import mock
+
+from fastapi import APIRouter, FastAPI
+from multidict import CIMultiDict
+from pydantic import BaseModel
+from starlette.requests import Request
+from starlette.responses import Response
+
+from fastapi_gateway import (
+    GatewayClient,
+    GatewayMetrics,
+    GatewayTracing,
+    core,
+    route,
+    setup_gateway,
+)
+
+app = FastAPI()
+router = APIRouter()
+UPSTREAM_BODY = b'{"foo": "bar", "path": 1}'
+UPSTREAM_HEADERS = CIMultiDict({"content-type": "application/json", "server": "uvicorn"})
+
+
+class FooModel(BaseModel):
+    example_int: int
+    example_str: str
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router.post,
+    service_url="http://microservice:8000",
+    gateway_path="/items/{item_id}",
+    service_path="/v1/items/{item_id}",
+    query_params=["query_int", "query_str"],
+    body_params=["body"],
+)
+async def proxied(
+    item_id: int,
+    query_int: int,
+    query_str: str,
+    body: FooModel,
+    request: Request,
+    response: Response,
+):
+    pass
+
+
+async def fake_make_request(**kwargs):
+    return UPSTREAM_BODY, 200, UPSTREAM_HEADERS
+
+
+def create_request() -> Request:
+    return Request(
+        {
+            "type": "http",
+            "app": app,
+            "method": "POST",
+            "path": "/items/1",
+            "path_params": {"item_id": 1},
+            "route": router.routes[0],
+            "headers": [
+                (b"host", b"gateway.example.com"),
+                (b"content-type", b"application/json"),
+                (b"accept-encoding", b"gzip"),
+                (b"user-agent", b"benchmark"),
+                (b"x-api-key", b"secret"),
+            ],
+            "query_string": b"query_int=1&query_str=foo",
+        }
+    )
+
+
+async def main(iterations: int, metrics: bool, tracing: Optional[str]):
+    client = None
+    if metrics or tracing:
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.sampling import ALWAYS_OFF, ALWAYS_ON
+        from prometheus_client import CollectorRegistry
+
+        client = setup_gateway(
+            app,
+            client=GatewayClient(
+                metrics=GatewayMetrics(registry=CollectorRegistry()) if metrics else None,
+                tracing=GatewayTracing(
+                    tracer_provider=TracerProvider(
+                        sampler=ALWAYS_OFF if tracing == "unsampled" else ALWAYS_ON
+                    )
+                )
+                if tracing
+                else None,
+            ),
+        )
+    endpoint = router.routes[0].endpoint
+    kwargs = dict(
+        item_id=1,
+        query_int=1,
+        query_str="foo",
+        body=FooModel(example_int=1, example_str="foo"),
+    )
+    with mock.patch.object(core, "make_request", fake_make_request):
+        for _ in range(1000):
+            await endpoint(request=create_request(), response=Response(), **kwargs)
+
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await endpoint(request=create_request(), response=Response(), **kwargs)
+        elapsed = time.perf_counter() - started
+    if client:
+        await client.shutdown()
+
+    mode = " + ".join(name for name in ("metrics" if metrics else None, tracing) if name)
+    mode = mode or "plain"
+    print(f"route overhead ({mode}): {elapsed / iterations * 1e6:.1f} us per call ({iterations} calls)")
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            iterations=int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+            metrics="metrics" in sys.argv[2:],
+            tracing=next(
+                (mode for mode in ("tracing", "unsampled") if mode in sys.argv[2:]), None
+            ),
+        )
+    )
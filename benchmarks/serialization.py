@@ -0,0 +1,80 @@
+"""
+Body serialization of one proxied call: the previous serialize_response
+(jsonable_encoder) + ujson path against the direct model JSON export.
+
+    python benchmarks/serialization.py [iterations]
+"""
+import asyncio
+import datetime
+import sys
+import time
+from typing import List
+
+import ujson
+from fastapi.routing import serialize_response
+from pydantic import BaseModel
+
+from fastapi_gateway.utils.body import unzip_body_object
+
+
+class Address(BaseModel):
+    city: str
+    street: str
+    building: int
+
+
+class User(BaseModel):
+    id: int
+    name: str
+    email: str
+    created: datetime.datetime
+    addresses: List[Address]
+
+
+class Users(BaseModel):
+    users: List[User]
+
+
+def create_user(index: int) -> User:
+    return User(
+        id=index,
+        name=f"user {index}",
+        email=f"user{index}@example.com",
+        created=datetime.datetime(2024, 1, 1, 12, 0),
+        addresses=[
+            Address(city="Moscow", street=f"street {index}", building=building)
+            for building in range(3)
+        ],
+    )
+
+
+async def previous_path(value) -> bytes:
+    return ujson.dumps(await serialize_response(response_content=value)).encode()
+
+
+async def current_path(value) -> bytes:
+    payload = await unzip_body_object(all_params={"body": value}, necessary_params=["body"])
+    return payload.body
+
+
+async def measure(name: str, function, value, iterations: int):
+    await function(value)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        await function(value)
+    elapsed = (time.perf_counter() - started) / iterations
+    print(f"{name}: {elapsed * 1e6:9.1f} us per body")
+
+
+async def main(iterations: int):
+    cases = [
+        ("nested model ", create_user(1), iterations),
+        ("list of 1000 ", Users(users=[create_user(index) for index in range(1000)]), 20),
+    ]
+    for case, value, case_iterations in cases:
+        await measure(f"{case} previous", previous_path, value, case_iterations)
+        await measure(f"{case} current ", current_path, value, case_iterations)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
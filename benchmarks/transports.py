@@ -0,0 +1,106 @@
+"""
+Transports to the same small FastAPI app: aiohttp over TCP loopback, over a Unix domain
+socket (both to a uvicorn server in another process) and the in-process ASGI transport.
+Latency of sequential calls, then throughput and gateway-side CPU time per call.
+
+    python benchmarks/transports.py [requests] [concurrency]
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from fastapi import FastAPI
+
+from fastapi_gateway import AiohttpTransport, ASGITransport, UnixSocketTransport
+
+HOST, PORT = "127.0.0.1", 8011
+SOCKET_PATH = "/tmp/fastapi_gateway_benchmark.sock"
+URL = f"http://{HOST}:{PORT}/v1/item/1"
+
+app = FastAPI()
+
+
+@app.get("/v1/item/{item_id}")
+async def get_item(item_id: int, q: str = ""):
+    return {"item_id": item_id, "q": q, "tags": ["a", "b"]}
+
+
+def serve(**kwargs):
+    import uvicorn
+
+    uvicorn.run(app, log_level="warning", access_log=False, **kwargs)
+
+
+async def run(name: str, transport, requests: int, concurrency: int):
+    headers = {"accept": "application/json"}
+
+    async def one():
+        body, status, _ = await transport.make_request(
+            url=URL, method="get", headers=headers, query={"q": "x"}
+        )
+        assert status == 200, (status, body)
+
+    for _ in range(200):  # warm up
+        await one()
+    latencies = []
+    for _ in range(min(requests, 5000)):
+        started = time.perf_counter()
+        await one()
+        latencies.append(time.perf_counter() - started)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            await one()
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(limited() for _ in range(requests)))
+    cpu = (time.process_time() - cpu_started) / requests
+    elapsed = time.perf_counter() - started
+    await transport.close()
+
+    latencies.sort()
+    print(
+        f"{name:<22} p50 {statistics.median(latencies) * 1e6:6.0f} us"
+        f"  p99 {latencies[int(len(latencies) * 0.99)] * 1e6:6.0f} us"
+        f"  {requests / elapsed:6.0f} req/s  cpu {cpu * 1e6:5.0f} us/call"
+    )
+
+
+async def main(requests: int, concurrency: int):
+    await run("aiohttp TCP loopback", AiohttpTransport(), requests, concurrency)
+    await run("aiohttp Unix socket", UnixSocketTransport(path=SOCKET_PATH), requests, concurrency)
+    await run("ASGI in-process", ASGITransport(app=app), requests, concurrency)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["serve-tcp"]:
+        serve(host=HOST, port=PORT)
+        sys.exit()
+    if sys.argv[1:] == ["serve-uds"]:
+        serve(uds=SOCKET_PATH)
+        sys.exit()
+
+    if os.path.exists(SOCKET_PATH):
+        os.remove(SOCKET_PATH)
+    servers = [
+        subprocess.Popen([sys.executable, __file__, "serve-tcp"]),
+        subprocess.Popen([sys.executable, __file__, "serve-uds"]),
+    ]
+    try:
+        time.sleep(3)
+        asyncio.run(
+            main(
+                requests=int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+                concurrency=int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+            )
+        )
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,84 @@
+"""
+Peak RSS of forwarding one large file upload to a microservice.
+
+    python benchmarks/upload_rss.py stream 500
+    python benchmarks/upload_rss.py read 500
+
+"stream" uses CustomFormData (chunked part read from the spooled file),
+"read" reproduces the old behaviour - the whole file read into memory first.
+Run every mode in its own process, ru_maxrss never goes down.
+"""
+import asyncio
+import resource
+import sys
+from tempfile import SpooledTemporaryFile
+
+import aiohttp
+from aiohttp import web
+from starlette.datastructures import UploadFile
+
+from fastapi_gateway.utils.form import CustomFormData
+
+MB = 1024 * 1024
+
+
+def peak_rss_mb() -> float:
+    # Linux reports kilobytes, macOS - bytes.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (MB if sys.platform == "darwin" else 1024)
+
+
+async def drain(request: web.Request) -> web.Response:
+    size = 0
+    async for chunk in request.content.iter_chunked(MB):
+        size += len(chunk)
+    return web.json_response({"size": size})
+
+
+def create_upload_file(size_mb: int) -> UploadFile:
+    file = SpooledTemporaryFile(max_size=MB)
+    chunk = b"x" * MB
+    for _ in range(size_mb):
+        file.write(chunk)
+    file.seek(0)
+    return UploadFile(filename="big.bin", file=file)
+
+
+async def main(mode: str, size_mb: int):
+    app = web.Application(client_max_size=0)
+    app.router.add_post("/upload", drain)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    upload_file = create_upload_file(size_mb=size_mb)
+    baseline = peak_rss_mb()
+
+    form = CustomFormData()
+    if mode == "read":
+        form.add_multipart_form(
+            name="file", filename=upload_file.filename, value=await upload_file.read()
+        )
+    else:
+        await form.upload(key="file", value=upload_file)
+
+    async with aiohttp.ClientSession() as session:
+        async with session.post(f"http://127.0.0.1:{port}/upload", data=form) as resp:
+            received = (await resp.json())["size"]
+
+    await runner.cleanup()
+    print(
+        f"mode={mode} upload={size_mb}MB received={received / MB:.0f}MB "
+        f"peak_rss={peak_rss_mb():.1f}MB (+{peak_rss_mb() - baseline:.1f}MB)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(
+        main(
+            mode=sys.argv[1] if len(sys.argv) > 1 else "stream",
+            size_mb=int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+        )
+    )
@@ -1,3 +1,85 @@
+from .aggregate import Leg, aggregate
+from .batch import BatchPolicy
+from .balancing import (
+    ConsistentHash,
+    LeastOutstanding,
+    PowerOfTwoChoices,
+    RoundRobin,
+    UpstreamPool,
+)
+from .breaker import CircuitBreaker, CircuitState, circuit_states
+from .cache import CacheBackend, CachePolicy, MemoryCache, RedisCache
+from .client import GatewayClient, setup_gateway
+from .codec import JSONCodec, OrjsonCodec, StdlibJSONCodec, UjsonCodec
+from .health import HealthCheck, OutlierDetection
+from .hedging import HedgePolicy
 from .core import route
+from .limits import AdaptiveLimit, ConcurrencyLimit
+from .metrics import GatewayMetrics
+from .tracing import GatewayTracing
+from .transports import (
+    AiohttpTransport,
+    ASGITransport,
+    HTTP2Transport,
+    Transport,
+    UnixSocketTransport,
+)
+from .ratelimit import (
+    MemoryRateLimitBackend,
+    RateLimit,
+    RateLimitBackend,
+    RateLimitMiddleware,
+    RedisRateLimitBackend,
+)
+from .retry import RetryBudget, RetryPolicy
+from .singleflight import CoalescePolicy
+from .timeouts import RequestArrivalMiddleware, Timeouts
+from .transforms import unquote_fields
 
-__all__ = "route"
+__all__ = (
+    "route",
+    "aggregate",
+    "Leg",
+    "GatewayClient",
+    "setup_gateway",
+    "BatchPolicy",
+    "JSONCodec",
+    "UjsonCodec",
+    "OrjsonCodec",
+    "StdlibJSONCodec",
+    "UpstreamPool",
+    "RoundRobin",
+    "LeastOutstanding",
+    "PowerOfTwoChoices",
+    "ConsistentHash",
+    "HealthCheck",
+    "OutlierDetection",
+    "CircuitBreaker",
+    "CircuitState",
+    "circuit_states",
+    "CachePolicy",
+    "CacheBackend",
+    "MemoryCache",
+    "RedisCache",
+    "CoalescePolicy",
+    "RetryPolicy",
+    "RetryBudget",
+    "HedgePolicy",
+    "Timeouts",
+    "ConcurrencyLimit",
+    "AdaptiveLimit",
+    "RateLimit",
+    "RateLimitBackend",
+    "MemoryRateLimitBackend",
+    "RedisRateLimitBackend",
+    "RateLimitMiddleware",
+    "RequestArrivalMiddleware",
+    "GatewayMetrics",
+    "GatewayTracing",
+    "Transport",
+    "AiohttpTransport",
+    "ASGITransport",
+    "UnixSocketTransport",
+    "HTTP2Transport",
+    "unquote_fields",
+)
@@ -0,0 +1,480 @@
+import asyncio
+import functools
+import inspect
+import time
+from string import Formatter
+from typing import Any, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, Type, Union
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request, Response, params, status
+from starlette.datastructures import MutableHeaders
+
+from .balancing import ServiceURL, create_pool
+from .client import GatewayClient, get_gateway_client
+from .core import CONNECT_ERRORS, call_upstream_instance
+from .exceptions import (
+    ConcurrencyLimitError,
+    NoAvailableUpstreamError,
+    UpstreamContentTypeError,
+)
+from .metrics import RequestTimer, RouteMetrics
+from .timeouts import TimeoutValue, Timeouts, create_timeouts
+from .transports import Transport, register_transport
+from .utils.body import unzip_body_object
+from .utils.headers import generate_headers_for_microservice
+from .utils.query import unzip_query_params
+from .utils.response import load_json_body
+
+UPSTREAM_ERRORS = CONNECT_ERRORS + (asyncio.TimeoutError,)
+
+Merge = Callable[[Dict[str, Any]], Any]
+# A value taken from an endpoint parameter ("user_id") or a field of a leg result ("user.team.id").
+Reference = Tuple[Optional[str], Tuple[str, ...]]
+
+
+class Leg:
+    """
+    One microservice call of an aggregate route.
+
+    :param name: key of the leg result in the merged response
+    :param service_url: url or UpstreamPool of the microservice
+    :param service_path: path template, "{user_id}" is an endpoint parameter and
+        "{user.team_id}" a field of the result of the leg named user
+    :param method: request method of the call
+    :param query_params: endpoint parameters sent as the query, or a mapping of query
+        names to endpoint parameters and leg result fields ({"team": "user.team_id"})
+    :param body_params: endpoint parameters sent as the JSON body
+    :param depends_on: legs to wait for, legs referenced by the path or query are added
+    :param timeout: max seconds of the call or Timeouts, the timeouts of the pool by default
+    :param required: a failed required leg fails the request, a failed optional one
+        is replaced by default
+    :param default: result of a failed optional leg
+    :param transport: how the call reaches the microservice, like route(transport=...)
+    """
+
+    def __init__(
+        self,
+        name: str,
+        service_url: ServiceURL,
+        service_path: str,
+        method: str = "GET",
+        query_params: Union[Sequence[str], Mapping[str, str], None] = None,
+        body_params: Optional[Sequence[str]] = None,
+        depends_on: Sequence[str] = (),
+        timeout: TimeoutValue = None,
+        required: bool = True,
+        default: Any = None,
+        transport: Optional[Transport] = None,
+    ):
+        self.name = name
+        self.upstream_pool = create_pool(service_url=service_url)
+        self.service_path = service_path
+        self.method = method.lower()
+        if isinstance(query_params, Mapping):
+            self.query_params = dict(query_params)
+        else:
+            self.query_params = {param: param for param in query_params or ()}
+        self.body_params = list(body_params or ())
+        self.depends_on = tuple(depends_on)
+        if timeout is None:
+            self.timeouts = self.upstream_pool.timeouts or Timeouts()
+        else:
+            self.timeouts = create_timeouts(timeout)
+        self.required = required
+        self.default = default
+        self.transport = transport or self.upstream_pool.transport
+        if transport:
+            register_transport(transport)
+
+    def __repr__(self):
+        return f"Leg(name={self.name!r}, service_path={self.service_path!r})"
+
+
+class LegPlan:
+    """References of a leg resolved against the other legs once at decoration time."""
+
+    def __init__(self, leg: Leg, leg_names: Sequence[str]):
+        self.leg = leg
+        self.path: List[Tuple[str, Optional[Reference]]] = [
+            (literal, parse_reference(field, leg_names) if field is not None else None)
+            for literal, field, _, _ in Formatter().parse(leg.service_path)
+        ]
+        self.query = {
+            name: parse_reference(source, leg_names)
+            for name, source in leg.query_params.items()
+        }
+        references = [reference for _, reference in self.path if reference]
+        references += self.query.values()
+        self.dependencies = tuple(
+            dict.fromkeys(
+                [*leg.depends_on, *(name for name, _ in references if name is not None)]
+            )
+        )
+        for dependency in self.dependencies:
+            if dependency not in leg_names:
+                raise ValueError(f"Leg {leg.name!r} depends on an unknown leg {dependency!r}.")
+
+
+def parse_reference(source: str, leg_names: Sequence[str]) -> Reference:
+    name, *fields = source.split(".")
+    if name in leg_names:
+        return name, tuple(fields)
+    if fields:
+        raise ValueError(f"{source!r} does not reference a leg.")
+    return None, (name,)
+
+
+def resolve_reference(
+    reference: Reference, kwargs: Mapping[str, Any], results: Mapping[str, Any]
+) -> Any:
+    name, fields = reference
+    if name is None:
+        return kwargs[fields[0]]
+    value = results[name]
+    for field in fields:
+        value = value[int(field)] if isinstance(value, list) else value[field]
+    return value
+
+
+def order_legs(plans: Sequence[LegPlan]) -> List[LegPlan]:
+    """Dependencies first, raises ValueError on a cycle."""
+    by_name = {plan.leg.name: plan for plan in plans}
+    ordered: List[LegPlan] = []
+    visiting = set()
+
+    def visit(plan: LegPlan):
+        if plan in ordered:
+            return
+        if plan.leg.name in visiting:
+            raise ValueError(f"Legs depend on each other in a cycle: {plan.leg.name!r}.")
+        visiting.add(plan.leg.name)
+        for dependency in plan.dependencies:
+            visit(by_name[dependency])
+        ordered.append(plan)
+
+    for plan in plans:
+        visit(plan)
+    return ordered
+
+
+class LegFailure:
+    """Result of a failed optional leg, its dependents fail with the same error."""
+
+    __slots__ = ("error",)
+
+    def __init__(self, error: HTTPException):
+        self.error = error
+
+
+def upstream_error_response(leg: Leg, status_code: int, data: Any) -> HTTPException:
+    # Client errors (like a missing user) are passed on, server errors are the gateway's.
+    if status_code < 500:
+        detail = data.get("detail", data) if isinstance(data, dict) else data
+        return HTTPException(status_code=status_code, detail=detail)
+    return HTTPException(
+        status_code=status.HTTP_502_BAD_GATEWAY, detail=f"Service error in {leg.name}."
+    )
+
+
+def aggregate(
+    request_method,
+    gateway_path: str,
+    legs: Sequence[Leg],
+    merge: Optional[Merge] = None,
+    response_model: Optional[Type[Any]] = None,
+    status_code: Optional[int] = None,
+    tags: Optional[List[str]] = None,
+    dependencies: Optional[Sequence[params.Depends]] = None,
+    summary: Optional[str] = None,
+    description: Optional[str] = None,
+    response_description: str = "Successful Response",
+    responses: Optional[Dict[Union[int, str], Dict[str, Any]]] = None,
+    deprecated: Optional[bool] = None,
+    operation_id: Optional[str] = None,
+    include_in_schema: bool = True,
+    name: Optional[str] = None,
+    timeout: Optional[float] = None,
+    partial_header: Optional[str] = "x-gateway-partial",
+):
+    """
+    A route calling several microservices concurrently and merging their results.
+    Legs run as soon as the legs they depend on are done, the first failed required leg
+    cancels the others.
+
+    :param gateway_path: is the path to bind gateway.
+    :param request_method: is a callable (like app.get, app.post and so on.)
+    :param legs: the microservice calls
+    :param merge: builds the response from the results by leg name,
+        by default the response is {leg name: result}
+    :param response_model: shows return type and details on api docs
+    :param status_code: expected HTTP(status.HTTP_200_OK) status code
+    :param timeout: max seconds for all of the legs, a leg never waits longer, optional legs
+        still running then are cancelled and failed, a running required leg fails with 504
+    :param partial_header: response header listing the failed optional legs (None - not sent)
+
+    Other parameters are passed to request_method, see the FastAPI documentation.
+
+    :return: the merged results
+    """
+
+    leg_names = [leg.name for leg in legs]
+    if len(set(leg_names)) != len(leg_names):
+        raise ValueError("Leg names of an aggregate route must be unique.")
+    plans = order_legs([LegPlan(leg=leg, leg_names=leg_names) for leg in legs])
+
+    register_endpoint = request_method(
+        path=gateway_path,
+        response_model=response_model,
+        status_code=status_code,
+        tags=tags,
+        dependencies=dependencies,
+        summary=summary,
+        description=description,
+        response_description=response_description,
+        responses=responses,
+        deprecated=deprecated,
+        operation_id=operation_id,
+        include_in_schema=include_in_schema,
+        name=name,
+    )
+
+    async def call_leg(
+        request: Request,
+        client: GatewayClient,
+        plan: LegPlan,
+        headers: MutableHeaders,
+        kwargs: Dict[str, Any],
+        results: Dict[str, Any],
+        deadline: Optional[float],
+        route_metrics: Optional[RouteMetrics],
+        timer: Optional[RequestTimer],
+    ) -> Any:
+        leg = plan.leg
+        upstream_pool = leg.upstream_pool
+        try:
+            path = "".join(
+                literal
+                + (
+                    quote(str(resolve_reference(reference, kwargs, results)), safe="")
+                    if reference
+                    else ""
+                )
+                for literal, reference in plan.path
+            )
+            query = None
+            if plan.query:
+                query = await unzip_query_params(
+                    all_params={
+                        name: resolve_reference(reference, kwargs, results)
+                        for name, reference in plan.query.items()
+                    },
+                    necessary_params=list(plan.query),
+                )
+        except (KeyError, IndexError, TypeError, ValueError):
+            # A dependency answered without a field the leg needs.
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Service error in {leg.name}.",
+            )
+        data = None
+        if leg.body_params:
+            data = await unzip_body_object(
+                necessary_params=leg.body_params,
+                all_params=kwargs,
+                codec=client.json_codec,
+            )
+
+        try:
+            instance = upstream_pool.select(request=request)
+        except NoAvailableUpstreamError:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Service is unavailable.",
+            )
+        request_kwargs: Dict[str, Any] = dict(
+            method=leg.method, headers=headers, query=query, data=data
+        )
+        try:
+            call_timeouts = leg.timeouts.until(deadline)
+            upstream_result, status_code_from_service, _ = await call_upstream_instance(
+                client,
+                upstream_pool,
+                instance,
+                leg.transport,
+                f"{instance.base_url}{path}",
+                request_kwargs,
+                call_timeouts,
+                route_metrics,
+                timer,
+                UPSTREAM_ERRORS,
+                # Legs share the headers, each one sends its own span.
+                copy_headers=True,
+            )
+        except ConcurrencyLimitError as error:
+            if route_metrics:
+                route_metrics.reject("service")
+            raise HTTPException(
+                status_code=error.limit.status_code, detail="Service is overloaded."
+            )
+        except CONNECT_ERRORS:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Service is unavailable.",
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Service timeout."
+            )
+
+        body, _, service_headers = upstream_result
+        try:
+            result = load_json_body(
+                body=body, headers=service_headers, codec=client.json_codec
+            )
+        except UpstreamContentTypeError as error:
+            if route_metrics:
+                route_metrics.error(error)
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail=f"Service error in {leg.name}.",
+            )
+        if status_code_from_service >= 400:
+            raise upstream_error_response(leg, status_code_from_service, result)
+        return result
+
+    async def run_legs(
+        request: Request,
+        response: Response,
+        client: GatewayClient,
+        kwargs: Dict[str, Any],
+        route_metrics: Optional[RouteMetrics],
+        timer: Optional[RequestTimer],
+    ):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        headers = generate_headers_for_microservice(headers=request.headers)
+        results: Dict[str, Any] = {}
+        tasks: Dict[str, "asyncio.Future[Any]"] = {}
+
+        async def run_leg(plan: LegPlan) -> Any:
+            leg = plan.leg
+            for dependency in plan.dependencies:
+                result = await tasks[dependency]
+                if isinstance(result, LegFailure):
+                    if leg.required:
+                        raise result.error
+                    return result
+            try:
+                result = await call_leg(
+                    request,
+                    client,
+                    plan,
+                    headers,
+                    kwargs,
+                    results,
+                    deadline,
+                    route_metrics,
+                    timer,
+                )
+            except HTTPException as error:
+                if leg.required:
+                    raise
+                return LegFailure(error=error)
+            results[leg.name] = result
+            return result
+
+        for plan in plans:
+            tasks[plan.leg.name] = asyncio.ensure_future(run_leg(plan))
+        try:
+            done, pending = await asyncio.wait(
+                tasks.values(),
+                timeout=None if deadline is None else deadline - time.monotonic(),
+                return_when=asyncio.FIRST_EXCEPTION,
+            )
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+            # Optional legs still running at the deadline fail, required ones fail the request.
+            if any(tasks[plan.leg.name] in pending for plan in plans if plan.leg.required):
+                raise HTTPException(
+                    status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Service timeout."
+                )
+        finally:
+            for task in tasks.values():
+                task.cancel()
+            # Failures of the other legs are retrieved, only the first one is raised.
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        failed = []
+        merged = {}
+        for leg in legs:
+            task = tasks[leg.name]
+            if task in pending:
+                result = LegFailure(
+                    error=HTTPException(
+                        status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="Service timeout."
+                    )
+                )
+            else:
+                result = task.result()
+            if isinstance(result, LegFailure):
+                failed.append(leg.name)
+                result = leg.default
+            merged[leg.name] = result
+        if failed and partial_header:
+            response.headers[partial_header] = ",".join(failed)
+        return merge(merged) if merge else merged
+
+    async def measure(
+        request: Request,
+        response: Response,
+        client: GatewayClient,
+        kwargs: Dict[str, Any],
+    ):
+        if client.metrics is None:
+            return await run_legs(request, response, client, kwargs, None, None)
+
+        route_metrics = client.metrics.route(request.scope["route"].path)
+        timer = RequestTimer()
+        status_code_to_client = status.HTTP_500_INTERNAL_SERVER_ERROR
+        route_metrics.in_flight += 1
+        try:
+            result = await run_legs(request, response, client, kwargs, route_metrics, timer)
+            status_code_to_client = response.status_code or status_code or 200
+            return result
+        except HTTPException as error:
+            status_code_to_client = error.status_code
+            raise
+        finally:
+            route_metrics.in_flight -= 1
+            route_metrics.observe_request(
+                method=request.scope["method"],
+                status_code=status_code_to_client,
+                duration=time.perf_counter() - timer.started,
+                upstream_duration=timer.upstream,
+            )
+
+    def wrapper(f):
+        endpoint_params = inspect.signature(f).parameters
+        for plan in plans:
+            references = [reference for _, reference in plan.path if reference]
+            references += plan.query.values()
+            references += [(None, (param,)) for param in plan.leg.body_params]
+            for name, fields in references:
+                if name is None and fields[0] not in endpoint_params:
+                    raise ValueError(
+                        f"Leg {plan.leg.name!r} uses {fields[0]!r}, which is neither "
+                        f"a leg nor a parameter of {f.__name__}."
+                    )
+
+        @register_endpoint
+        @functools.wraps(f)
+        async def inner(request: Request, response: Response, **kwargs):
+            client = get_gateway_client(request=request)
+            if client.tracing is None:
+                return await measure(request, response, client, kwargs)
+
+            span_name = f'{request.scope["method"]} {request.scope["route"].path}'
+            with client.tracing.request_span(name=span_name, headers=request.headers):
+                return await measure(request, response, client, kwargs)
+
+    return wrapper
@@ -0,0 +1,276 @@
+import bisect
+import hashlib
+import itertools
+import random
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from starlette.requests import Request
+
+from .exceptions import NoAvailableUpstreamError
+from .health import HealthCheck, OutlierDetection
+from .limits import ConcurrencyLimit
+from .timeouts import Timeouts
+from .transports import Transport
+
+LATENCY_SMOOTHING = 0.3
+UNIX_SCHEME = "unix://"
+# Requests over a Unix socket still need an http url, its host only fills the Host header.
+UNIX_BASE_URL = "http://localhost"
+
+
+def unix_socket_path(url: str) -> Optional[str]:
+    """Path of a unix:///path/to/sock url, None for http(s) urls."""
+    if url.startswith(UNIX_SCHEME):
+        return url[len(UNIX_SCHEME):]
+    return None
+
+
+class UpstreamInstance:
+    def __init__(self, url: str):
+        self.url = url
+        self.in_flight = 0
+        self.latency = 0.0
+        self.requests = 0
+        self.healthy = True
+        self.ejected_until = 0.0
+        self.consecutive_errors = 0
+        self.consecutive_5xx = 0
+        self.probe_successes = 0
+        self.probe_failures = 0
+
+    def __repr__(self):
+        return f"UpstreamInstance(url={self.url!r}, in_flight={self.in_flight})"
+
+    @property
+    def base_url(self) -> str:
+        """Where request paths are appended, the url itself for http(s) instances."""
+        if self.url.startswith(UNIX_SCHEME):
+            return UNIX_BASE_URL
+        return self.url
+
+    def is_available(self, now: float) -> bool:
+        return self.healthy and self.ejected_until <= now
+
+    def observe_latency(self, latency: float):
+        if self.requests:
+            self.latency += LATENCY_SMOOTHING * (latency - self.latency)
+        else:
+            self.latency = latency
+        self.requests += 1
+
+    @contextmanager
+    def track(self, failure_latency: Optional[float] = None) -> Iterator["UpstreamInstance"]:
+        """
+        Counts a call in flight and observes its latency.
+        A failed call counts as taking failure_latency (the timeout of the call), so an
+        instance refusing connections does not look like the fastest one. Without
+        failure_latency, and for cancelled calls, only completed calls are observed.
+        """
+        self.in_flight += 1
+        started = time.monotonic()
+        try:
+            yield self
+        except Exception:
+            if failure_latency is not None:
+                self.observe_latency(max(time.monotonic() - started, failure_latency))
+            raise
+        else:
+            self.observe_latency(time.monotonic() - started)
+        finally:
+            self.in_flight -= 1
+
+
+class BalancingStrategy(ABC):
+    @abstractmethod
+    def select(
+        self, candidates: Sequence[UpstreamInstance], request: Optional[Request]
+    ) -> UpstreamInstance:
+        pass
+
+
+class RoundRobin(BalancingStrategy):
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def select(self, candidates, request):
+        return candidates[next(self._counter) % len(candidates)]
+
+
+class LeastOutstanding(BalancingStrategy):
+    def select(self, candidates, request):
+        return min(candidates, key=lambda instance: (instance.in_flight, instance.latency))
+
+
+def load_score(instance: UpstreamInstance) -> float:
+    # An idle fast node wins over an idle slow one, a busy node loses to both.
+    return (instance.in_flight + 1) * (instance.latency or 1e-6)
+
+
+class PowerOfTwoChoices(BalancingStrategy):
+    def select(self, candidates, request):
+        if len(candidates) < 2:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if load_score(first) <= load_score(second) else second
+
+
+def hash_key(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class ConsistentHash(BalancingStrategy):
+    """
+    Sends requests with the same header or path param value to the same instance.
+
+    :param header: request header used as the hash key
+    :param path_param: path parameter used as the hash key (if header is not set or missing)
+    :param replicas: virtual nodes per instance, more - more even distribution
+    """
+
+    def __init__(
+        self,
+        header: Optional[str] = None,
+        path_param: Optional[str] = None,
+        replicas: int = 100,
+    ):
+        if not header and not path_param:
+            raise ValueError("ConsistentHash requires a header or a path_param.")
+        self.header = header
+        self.path_param = path_param
+        self.replicas = replicas
+        self._fallback = RoundRobin()
+        self._ring_urls: Tuple[str, ...] = ()
+        self._ring: List[Tuple[int, UpstreamInstance]] = []
+        self._ring_hashes: List[int] = []
+
+    def get_key(self, request: Optional[Request]) -> Optional[str]:
+        if request is None:
+            return None
+        if self.header and self.header in request.headers:
+            return request.headers[self.header]
+        if self.path_param and self.path_param in request.path_params:
+            return str(request.path_params[self.path_param])
+        return None
+
+    def build_ring(self, candidates: Sequence[UpstreamInstance]):
+        self._ring = sorted(
+            (hash_key(f"{instance.url}#{replica}"), instance)
+            for instance in candidates
+            for replica in range(self.replicas)
+        )
+        self._ring_hashes = [point for point, _ in self._ring]
+        self._ring_urls = tuple(instance.url for instance in candidates)
+
+    def select(self, candidates, request):
+        key = self.get_key(request)
+        if key is None:
+            return self._fallback.select(candidates, request)
+
+        if tuple(instance.url for instance in candidates) != self._ring_urls:
+            self.build_ring(candidates)
+        position = bisect.bisect(self._ring_hashes, hash_key(key)) % len(self._ring)
+        return self._ring[position][1]
+
+
+class UpstreamPool:
+    """
+    Several instances of one microservice, can be passed as route service_url.
+
+    :param urls: instance urls (like ["http://10.0.0.1:8000", "http://10.0.0.2:8000"]),
+        unix:///path/to/sock for a service listening on a Unix domain socket
+    :param strategy: how an instance is chosen for a request, RoundRobin by default
+    :param health_check: background probes marking instances unhealthy and back
+    :param outlier_detection: ejects instances after consecutive errors or 5xx responses
+    :param name: service name used by circuit breakers and logs, the urls by default
+    :param timeouts: timeouts of routes to the service that do not set their own
+    :param concurrency_limit: max calls to the service at once, from all of its routes
+    :param transport: how calls reach the instances (like HTTP2Transport),
+        the pooled aiohttp sessions of the GatewayClient by default
+    """
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        strategy: Optional[BalancingStrategy] = None,
+        health_check: Optional[HealthCheck] = None,
+        outlier_detection: Optional[OutlierDetection] = None,
+        name: Optional[str] = None,
+        timeouts: Optional[Timeouts] = None,
+        concurrency_limit: Optional[ConcurrencyLimit] = None,
+        transport: Optional[Transport] = None,
+    ):
+        if not urls:
+            raise ValueError("UpstreamPool requires at least one url.")
+        self.name = name or ",".join(urls)
+        self.instances = [UpstreamInstance(url=url) for url in urls]
+        self.strategy = strategy or RoundRobin()
+        self.health_check = health_check
+        self.outlier_detection = outlier_detection
+        self.timeouts = timeouts
+        self.concurrency_limit = concurrency_limit
+        self.transport = transport
+
+    def __repr__(self):
+        return f"UpstreamPool(name={self.name!r})"
+
+    def candidates(
+        self, exclude: Sequence[UpstreamInstance] = ()
+    ) -> List[UpstreamInstance]:
+        now = time.monotonic()
+        return [
+            instance
+            for instance in self.instances
+            if instance.is_available(now) and instance not in exclude
+        ]
+
+    def select(
+        self,
+        request: Optional[Request] = None,
+        exclude: Sequence[UpstreamInstance] = (),
+    ) -> UpstreamInstance:
+        if len(self.instances) == 1 and not exclude:
+            instance = self.instances[0]
+            if instance.is_available(time.monotonic()):
+                return instance
+            raise NoAvailableUpstreamError(pool=self)
+
+        candidates = self.candidates(exclude=exclude)
+        if not candidates:
+            raise NoAvailableUpstreamError(pool=self)
+        return self.strategy.select(candidates, request)
+
+    def report(self, instance: UpstreamInstance, status_code: Optional[int]):
+        """status_code is None when the instance could not be reached at all."""
+        if self.outlier_detection:
+            self.outlier_detection.record(
+                instance=instance,
+                status_code=status_code,
+                health_check=self.health_check,
+            )
+
+
+ServiceURL = Union[str, UpstreamPool]
+
+_pools: Dict[str, UpstreamPool] = {}
+_registered_pools: List[UpstreamPool] = []
+
+
+def create_pool(service_url: ServiceURL) -> UpstreamPool:
+    # Routes pointing at the same url share one pool and its statistics.
+    if isinstance(service_url, UpstreamPool):
+        pool = service_url
+    elif service_url in _pools:
+        pool = _pools[service_url]
+    else:
+        pool = _pools[service_url] = UpstreamPool(urls=[service_url])
+
+    if pool not in _registered_pools:
+        _registered_pools.append(pool)
+    return pool
+
+
+def registered_pools() -> List[UpstreamPool]:
+    return list(_registered_pools)
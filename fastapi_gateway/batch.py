@@ -0,0 +1,213 @@
+import asyncio
+import base64
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import ClientConnectionError
+from fastapi import Body, HTTPException, Request, status
+from pydantic import BaseModel, Field
+from starlette.responses import Response, StreamingResponse
+
+from .codec import JSONCodec
+from .transports import ASGITransport
+from .utils.body import JSONBytesPayload
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+# The headers of the batch request describe its own body, not the ones of the calls.
+NOT_FORWARDED_HEADERS = frozenset(
+    {"host", "content-type", "content-length", "accept", "accept-encoding"}
+)
+# A call with a body is sent as JSON, its own headers can not describe it otherwise.
+BODY_HEADERS = frozenset({"content-type", "content-length"})
+TEXT_CONTENT_TYPES = frozenset(
+    {
+        "application/json",
+        "application/javascript",
+        "application/xml",
+        "application/x-www-form-urlencoded",
+    }
+)
+
+
+class BatchCall(BaseModel):
+    method: str = "GET"
+    path: str = Field(..., regex="^/")
+    query: Optional[Dict[str, Any]] = None
+    headers: Optional[Dict[str, str]] = None
+    body: Any = None
+
+
+class BatchPolicy:
+    """
+    An endpoint taking many gateway calls in one request, setup_gateway(batch=...) adds it.
+    Every call goes through the app like a request of its own (middlewares, dependencies,
+    route() and its policies) without sockets.
+
+    :param path: where the endpoint is exposed
+    :param max_calls: calls allowed in one batch, more are rejected with 413
+    :param max_concurrency: calls of one batch handled at once
+    :param timeout: max seconds of one call, a late call gets 504
+    :param forward_headers: calls get the headers of the batch request (like authorization),
+        their own headers override them
+    """
+
+    def __init__(
+        self,
+        path: str = "/batch",
+        max_calls: int = 50,
+        max_concurrency: int = 8,
+        timeout: Optional[float] = 30,
+        forward_headers: bool = True,
+    ):
+        self.path = path
+        self.max_calls = max_calls
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.forward_headers = forward_headers
+
+    def __repr__(self):
+        return f"BatchPolicy(path={self.path!r}, max_calls={self.max_calls})"
+
+
+def decode_body(
+    body: bytes, content_type: str, codec: JSONCodec
+) -> Tuple[Any, Optional[str]]:
+    """
+    The body of a call result and its encoding: None for JSON and text bodies,
+    "base64" for binary ones (and text that is not in its charset).
+    """
+    if not body:
+        return None, None
+    media_type, *params = content_type.split(";")
+    media_type = media_type.strip().lower()
+    if media_type == "application/json" or media_type.endswith("+json"):
+        try:
+            return codec.loads(body), None
+        except ValueError:
+            pass
+    if (
+        media_type.startswith("text/")
+        or media_type in TEXT_CONTENT_TYPES
+        or media_type.endswith(("+json", "+xml"))
+    ):
+        charset = "utf-8"
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "charset":
+                charset = value.strip().strip('"')
+        try:
+            return body.decode(charset), None
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return base64.b64encode(body).decode("ascii"), "base64"
+
+
+def error_result(index: int, status_code: int, detail: str) -> Dict[str, Any]:
+    return {"index": index, "status": status_code, "headers": {}, "body": {"detail": detail}}
+
+
+def create_batch_endpoint(
+    policy: BatchPolicy, codec: JSONCodec
+) -> Callable[..., Awaitable[Response]]:
+    async def dispatch(
+        transport: ASGITransport,
+        semaphore: asyncio.Semaphore,
+        base_url: str,
+        headers: Dict[str, str],
+        index: int,
+        call: BatchCall,
+    ) -> Dict[str, Any]:
+        if call.path.split("?")[0] == policy.path:
+            return error_result(
+                index, status.HTTP_400_BAD_REQUEST, "Batches can not be nested."
+            )
+        data = None
+        # Forwarded headers are lowercase, so are the ones of the call replacing them.
+        call_headers = {key.lower(): value for key, value in (call.headers or {}).items()}
+        if call.body is not None:
+            data = JSONBytesPayload(codec.dumps(call.body))
+            call_headers = {
+                key: value
+                for key, value in call_headers.items()
+                if key not in BODY_HEADERS
+            }
+        async with semaphore:
+            try:
+                body, status_code, response_headers = await transport.make_request(
+                    url=f"{base_url}{call.path}",
+                    method=call.method,
+                    headers={**headers, **call_headers},
+                    query=call.query,
+                    data=data,
+                    timeout=policy.timeout,
+                )
+            except asyncio.TimeoutError:
+                return error_result(
+                    index, status.HTTP_504_GATEWAY_TIMEOUT, "Service timeout."
+                )
+            except ClientConnectionError:
+                # The call failed after its response had started.
+                return error_result(index, status.HTTP_502_BAD_GATEWAY, "Service error.")
+        result_body, encoding = decode_body(
+            body, response_headers.get("content-type", ""), codec=codec
+        )
+        result = {
+            "index": index,
+            "status": status_code,
+            "headers": dict(response_headers),
+            "body": result_body,
+        }
+        if encoding:
+            result["encoding"] = encoding
+        return result
+
+    async def stream_results(
+        tasks: List["asyncio.Future[Dict[str, Any]]"],
+    ) -> AsyncIterator[bytes]:
+        try:
+            for result in asyncio.as_completed(tasks):
+                yield codec.dumps(await result) + b"\n"
+        finally:
+            # The client went away, the calls it does not wait for are cancelled.
+            for task in tasks:
+                task.cancel()
+
+    async def batch(request: Request, calls: List[BatchCall] = Body(...)) -> Response:
+        """
+        Runs the calls concurrently, the results are a JSON array in the order of the calls,
+        or NDJSON lines (with the index of the call) as they complete for
+        Accept: application/x-ndjson.
+        """
+        if len(calls) > policy.max_calls:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {policy.max_calls} calls in a batch.",
+            )
+        headers = {}
+        if policy.forward_headers:
+            headers = {
+                key: value
+                for key, value in request.headers.items()
+                if key not in NOT_FORWARDED_HEADERS
+            }
+        transport = ASGITransport(
+            app=request.app, client=tuple(request.client or ("127.0.0.1", 0))
+        )
+        base_url = f"{request.url.scheme}://{request.url.netloc}"
+        semaphore = asyncio.Semaphore(policy.max_concurrency)
+        tasks = [
+            asyncio.ensure_future(
+                dispatch(transport, semaphore, base_url, headers, index, call)
+            )
+            for index, call in enumerate(calls)
+        ]
+
+        if NDJSON_CONTENT_TYPE in request.headers.get("accept", ""):
+            return StreamingResponse(stream_results(tasks), media_type=NDJSON_CONTENT_TYPE)
+        try:
+            results = await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+        return Response(content=codec.dumps(results), media_type="application/json")
+
+    return batch
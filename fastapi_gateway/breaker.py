@@ -0,0 +1,194 @@
+import inspect
+import math
+import time
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+from fastapi import HTTPException
+from starlette import status
+from starlette.requests import Request
+
+from .exceptions import CircuitOpenError
+
+Fallback = Callable[[Request], Union[Any, Awaitable[Any]]]
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class RollingWindow:
+    def __init__(self, window: float, buckets: int):
+        self.bucket_size = window / buckets
+        self.buckets = buckets
+        self._calls = [0] * buckets
+        self._failures = [0] * buckets
+        self._slow = [0] * buckets
+        self._bucket_ids = [-1] * buckets
+
+    def _bucket(self, now: float) -> int:
+        bucket_id = int(now / self.bucket_size)
+        index = bucket_id % self.buckets
+        if self._bucket_ids[index] != bucket_id:
+            self._bucket_ids[index] = bucket_id
+            self._calls[index] = self._failures[index] = self._slow[index] = 0
+        return index
+
+    def add(self, now: float, failure: bool, slow: bool):
+        index = self._bucket(now)
+        self._calls[index] += 1
+        self._failures[index] += failure
+        self._slow[index] += slow
+
+    def totals(self, now: float):
+        oldest = int(now / self.bucket_size) - self.buckets
+        calls = failures = slow = 0
+        for index, bucket_id in enumerate(self._bucket_ids):
+            if bucket_id > oldest:
+                calls += self._calls[index]
+                failures += self._failures[index]
+                slow += self._slow[index]
+        return calls, failures, slow
+
+    def reset(self):
+        self._bucket_ids = [-1] * self.buckets
+
+
+class Circuit:
+    def __init__(self, name: str, breaker: "CircuitBreaker"):
+        self.name = name
+        self.breaker = breaker
+        self.state = CircuitState.CLOSED
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.half_open_successes = 0
+        self.window = RollingWindow(window=breaker.window, buckets=breaker.window_buckets)
+
+    def before_call(self):
+        if self.state is CircuitState.OPEN:
+            if time.monotonic() - self.opened_at < self.breaker.open_duration:
+                raise CircuitOpenError(name=self.name)
+            self.state = CircuitState.HALF_OPEN
+            self.half_open_calls = self.half_open_successes = 0
+
+        if self.state is CircuitState.HALF_OPEN:
+            if self.half_open_calls >= self.breaker.half_open_max_calls:
+                raise CircuitOpenError(name=self.name)
+            self.half_open_calls += 1
+
+    def release(self):
+        """Gives back the trial slot of a call that ended without an outcome to record."""
+        if self.state is CircuitState.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record(self, failure: bool, duration: float):
+        now = time.monotonic()
+        slow = duration >= self.breaker.slow_call_duration
+
+        if self.state is CircuitState.HALF_OPEN:
+            if failure or slow:
+                self.open(now=now)
+                return
+            self.half_open_successes += 1
+            if self.half_open_successes >= self.breaker.half_open_max_calls:
+                self.close()
+            return
+
+        if self.state is CircuitState.OPEN:
+            return
+
+        self.window.add(now=now, failure=failure, slow=slow)
+        calls, failures, slow_calls = self.window.totals(now=now)
+        if calls < self.breaker.minimum_calls:
+            return
+        if (
+            failures / calls >= self.breaker.failure_rate_threshold
+            or slow_calls / calls >= self.breaker.slow_call_rate_threshold
+        ):
+            self.open(now=now)
+
+    def open(self, now: float):
+        self.state = CircuitState.OPEN
+        self.opened_at = now
+
+    def close(self):
+        self.state = CircuitState.CLOSED
+        self.window.reset()
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing microservice for a while and answers at once instead.
+    One breaker can be shared by many routes, the state is kept per service url.
+
+    :param failure_rate_threshold: share of failed calls (errors, timeouts, 5xx) to open
+    :param slow_call_rate_threshold: share of calls slower than slow_call_duration to open
+    :param slow_call_duration: seconds after which a call is counted as slow
+    :param window: seconds of calls the rates are calculated over
+    :param window_buckets: the window moves by window / window_buckets seconds
+    :param minimum_calls: calls in the window needed before the rates are checked
+    :param open_duration: seconds the circuit stays open before trial calls
+    :param half_open_max_calls: trial calls that must succeed to close the circuit
+    :param status_code: response status while the circuit is open
+    :param fallback: called with the request instead of failing, its result is returned
+    """
+
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        slow_call_rate_threshold: float = 1.0,
+        slow_call_duration: float = math.inf,
+        window: float = 10.0,
+        window_buckets: int = 10,
+        minimum_calls: int = 20,
+        open_duration: float = 30.0,
+        half_open_max_calls: int = 1,
+        status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE,
+        fallback: Optional[Fallback] = None,
+    ):
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.window = window
+        self.window_buckets = window_buckets
+        self.minimum_calls = minimum_calls
+        self.open_duration = open_duration
+        self.half_open_max_calls = half_open_max_calls
+        self.status_code = status_code
+        self.fallback = fallback
+        self.circuits: Dict[str, Circuit] = {}
+        _breakers.append(self)
+
+    def circuit(self, name: str) -> Circuit:
+        circuit = self.circuits.get(name)
+        if circuit is None:
+            circuit = self.circuits[name] = Circuit(name=name, breaker=self)
+        return circuit
+
+    def states(self) -> Dict[str, CircuitState]:
+        return {name: circuit.state for name, circuit in self.circuits.items()}
+
+
+_breakers: List[CircuitBreaker] = []
+
+
+def circuit_states() -> Dict[str, CircuitState]:
+    """State of every circuit of every breaker, for monitoring."""
+    states = {}
+    for breaker in _breakers:
+        states.update(breaker.states())
+    return states
+
+
+async def circuit_open_response(breaker: CircuitBreaker, request: Request) -> Any:
+    if breaker.fallback is None:
+        raise HTTPException(
+            status_code=breaker.status_code,
+            detail="Service is unavailable.",
+        )
+    result = breaker.fallback(request)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
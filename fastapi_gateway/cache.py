@@ -0,0 +1,333 @@
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple
+
+import ujson
+from multidict import CIMultiDict
+
+from .singleflight import SingleFlight, UpstreamResult
+from .utils.headers import HOP_BY_HOP_HEADERS, hop_by_hop_headers
+from .utils.request import create_request_key
+
+NOT_STORED_HEADERS = HOP_BY_HOP_HEADERS.union(
+    {
+        "content-length",
+        "content-encoding",
+        "date",
+        "age",
+    }
+)
+
+
+class CacheEntry:
+    __slots__ = ("body", "status_code", "headers", "expires_at", "etag")
+
+    def __init__(
+        self,
+        body: bytes,
+        status_code: int,
+        headers: List[Tuple[str, str]],
+        expires_at: float,
+        etag: Optional[str] = None,
+    ):
+        self.body = body
+        self.status_code = status_code
+        self.headers = headers
+        self.expires_at = expires_at
+        self.etag = etag
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(key) + len(value) for key, value in self.headers)
+
+    def is_fresh(self, now: float) -> bool:
+        return now < self.expires_at
+
+    def as_result(self) -> UpstreamResult:
+        return self.body, self.status_code, CIMultiDict(self.headers)
+
+    def dumps(self) -> bytes:
+        meta = ujson.dumps(
+            [self.status_code, self.headers, self.expires_at, self.etag]
+        ).encode()
+        return meta + b"\n" + self.body
+
+    @classmethod
+    def loads(cls, data: bytes) -> "CacheEntry":
+        meta, body = data.split(b"\n", 1)
+        status_code, headers, expires_at, etag = ujson.loads(meta)
+        return cls(
+            body=body,
+            status_code=status_code,
+            headers=[tuple(header) for header in headers],
+            expires_at=expires_at,
+            etag=etag,
+        )
+
+
+class CacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        pass
+
+    @abstractmethod
+    async def set(self, key: str, entry: CacheEntry, ttl: float):
+        pass
+
+    @abstractmethod
+    async def delete(self, key: str):
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """
+    In-process LRU cache bounded by the total size of stored responses.
+
+    :param max_bytes: when exceeded, least recently used responses are evicted
+    :param max_entries: optional limit of stored responses
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: Optional[int] = None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries: "OrderedDict[str, Tuple[CacheEntry, float]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get(self, key):
+        stored = self._entries.get(key)
+        if stored is None:
+            return None
+        entry, delete_at = stored
+        if delete_at <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key, entry, ttl):
+        if entry.size > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (entry, time.time() + ttl)
+        self.size += entry.size
+        while self.size > self.max_bytes or (
+            self.max_entries is not None and len(self._entries) > self.max_entries
+        ):
+            self._remove(next(iter(self._entries)))
+
+    async def delete(self, key):
+        self._remove(key)
+
+    def _remove(self, key: str):
+        stored = self._entries.pop(key, None)
+        if stored is not None:
+            self.size -= stored[0].size
+
+
+class RedisCache(CacheBackend):
+    """
+    Cache shared by gateway workers, for a redis.asyncio.Redis compatible client.
+    """
+
+    def __init__(self, redis: Any, prefix: str = "fastapi_gateway:cache:"):
+        self.redis = redis
+        self.prefix = prefix
+
+    async def get(self, key):
+        data = await self.redis.get(self.prefix + key)
+        if data is None:
+            return None
+        return CacheEntry.loads(data)
+
+    async def set(self, key, entry, ttl):
+        await self.redis.set(self.prefix + key, entry.dumps(), px=max(int(ttl * 1000), 1))
+
+    async def delete(self, key):
+        await self.redis.delete(self.prefix + key)
+
+
+def parse_cache_control(value: Optional[str]) -> Dict[str, Optional[str]]:
+    directives = {}
+    if not value:
+        return directives
+    for directive in value.split(","):
+        name, _, argument = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') or None
+    return directives
+
+
+def max_age(directives: Mapping[str, Optional[str]]) -> Optional[int]:
+    for name in ("s-maxage", "max-age"):
+        value = directives.get(name)
+        if value is not None and value.isdigit():
+            return int(value)
+    return None
+
+
+class CachePolicy:
+    """
+    Caches microservice responses of the route.
+
+    :param ttl: seconds a response is fresh, unless the microservice sends Cache-Control max-age
+    :param vary: request headers that are part of the cache key, by default responses
+        to different users (authorization, cookie) are never shared
+    :param backend: where responses are stored, shared in-process MemoryCache by default
+    :param stale_ttl: seconds an expired response with ETag is kept for revalidation
+        with If-None-Match, ttl by default
+    :param methods: cached request methods
+    :param statuses: cached response statuses
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        vary: Sequence[str] = ("authorization", "cookie"),
+        backend: Optional[CacheBackend] = None,
+        stale_ttl: Optional[float] = None,
+        methods: Sequence[str] = ("GET", "HEAD"),
+        statuses: Sequence[int] = (200,),
+    ):
+        self.ttl = ttl
+        self.vary = tuple(header.lower() for header in vary)
+        self.backend = backend or default_backend
+        self.stale_ttl = ttl if stale_ttl is None else stale_ttl
+        self.methods = frozenset(method.upper() for method in methods)
+        self.statuses = frozenset(statuses)
+        self.single_flight = SingleFlight()
+
+    def is_cacheable_request(self, method: str) -> bool:
+        return method.upper() in self.methods
+
+    def create_key(
+        self,
+        method: str,
+        service: str,
+        path: str,
+        query: Optional[Mapping[str, Any]],
+        headers: Mapping[str, str],
+    ) -> str:
+        return create_request_key(
+            method=method,
+            service=service,
+            path=path,
+            query=query,
+            headers=headers,
+            vary=self.vary,
+        )
+
+    def create_entry(
+        self,
+        body: bytes,
+        status_code: int,
+        headers: Mapping[str, str],
+        now: float,
+        authorized: bool = False,
+    ) -> Optional[CacheEntry]:
+        """
+        :param authorized: the request had an Authorization header, its response is only
+            stored when the microservice marks it public or sets s-maxage (RFC 9111 3.5)
+        """
+        if status_code not in self.statuses or "set-cookie" in headers:
+            return None
+
+        directives = parse_cache_control(headers.get("cache-control"))
+        if "no-store" in directives or "private" in directives:
+            return None
+        if authorized and "public" not in directives and "s-maxage" not in directives:
+            return None
+        vary = {
+            header.strip().lower()
+            for header in headers.get("vary", "").split(",")
+            if header.strip()
+        }
+        if "*" in vary or not vary.issubset(self.vary):
+            return None
+
+        ttl = max_age(directives)
+        if ttl is None:
+            ttl = self.ttl
+        if "no-cache" in directives:
+            ttl = 0
+        not_stored = NOT_STORED_HEADERS.union(hop_by_hop_headers(headers))
+        return CacheEntry(
+            body=body,
+            status_code=status_code,
+            headers=[
+                (key, value)
+                for key, value in headers.items()
+                if key.lower() not in not_stored
+            ],
+            expires_at=now + ttl,
+            etag=headers.get("etag"),
+        )
+
+    def storage_ttl(self, entry: CacheEntry, now: float) -> float:
+        ttl = entry.expires_at - now
+        if entry.etag:
+            ttl += self.stale_ttl
+        return ttl
+
+    async def store(self, key: str, entry: CacheEntry, now: float):
+        ttl = self.storage_ttl(entry=entry, now=now)
+        if ttl > 0:
+            await self.backend.set(key=key, entry=entry, ttl=ttl)
+
+    async def refresh(
+        self,
+        key: str,
+        entry: Optional[CacheEntry],
+        fetch: Callable[[Optional[str]], Awaitable[UpstreamResult]],
+        authorized: bool = False,
+    ) -> UpstreamResult:
+        etag = entry.etag if entry else None
+        body, status_code, headers = await fetch(etag)
+        now = time.time()
+
+        if status_code == 304 and entry is not None:
+            directives = parse_cache_control(headers.get("cache-control"))
+            ttl = max_age(directives)
+            entry.expires_at = now + (self.ttl if ttl is None else ttl)
+            await self.store(key=key, entry=entry, now=now)
+            return entry.as_result()
+
+        new_entry = self.create_entry(
+            body=body,
+            status_code=status_code,
+            headers=headers,
+            now=now,
+            authorized=authorized,
+        )
+        if new_entry is not None:
+            await self.store(key=key, entry=new_entry, now=now)
+        return body, status_code, headers
+
+    async def fetch(
+        self,
+        key: str,
+        fetch: Callable[[Optional[str]], Awaitable[UpstreamResult]],
+        authorized: bool = False,
+    ) -> UpstreamResult:
+        """
+        Returns a fresh cached response or calls fetch (with the ETag of a stale one).
+        Concurrent misses of one key share a single fetch.
+
+        :param authorized: the request has an Authorization header
+        """
+        entry = await self.backend.get(key)
+        if entry is not None and entry.is_fresh(time.time()):
+            return entry.as_result()
+        body, status_code, headers = await self.single_flight.do(
+            key,
+            lambda: self.refresh(
+                key=key, entry=entry, fetch=fetch, authorized=authorized
+            ),
+        )
+        return body, status_code, CIMultiDict(headers)
+
+
+default_backend = MemoryCache()
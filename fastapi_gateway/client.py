@@ -0,0 +1,166 @@
+import asyncio
+import ssl
+from typing import Dict, List, Optional, Tuple, Union
+
+import aiohttp
+from fastapi import FastAPI
+from starlette.requests import Request
+
+from .balancing import registered_pools, unix_socket_path
+from .batch import BatchPolicy, create_batch_endpoint
+from .codec import JSONCodec, default_codec
+from .metrics import GatewayMetrics
+from .health import run_health_checks
+from .ratelimit import RateLimit, RateLimitMiddleware
+from .timeouts import RequestArrivalMiddleware
+from .tracing import GatewayTracing
+from .transports import close_stale, cookieless_jar, registered_transports
+
+SSLContext = Union[ssl.SSLContext, bool, None]
+
+
+class GatewayClient:
+    """
+    Keeps one pooled aiohttp session (and so one TCPConnector) per microservice,
+    so proxied calls reuse keep-alive connections instead of dialing every time.
+    Services at unix:///path/to/sock urls get a pooled UnixConnector instead.
+
+    :param limit_per_host: max simultaneous connections to one service (0 - no limit)
+    :param keepalive_timeout: seconds an idle connection is kept in the pool
+    :param ttl_dns_cache: seconds resolved addresses are cached (None - forever)
+    :param ssl_context: TLS context for https services (False disables verification)
+    :param json_codec: encodes request bodies and decodes microservice responses,
+        UjsonCodec by default (OrjsonCodec, StdlibJSONCodec)
+    :param metrics: Prometheus metrics of the proxied calls, off by default
+    :param tracing: OpenTelemetry spans of the proxied calls, off by default
+    """
+
+    def __init__(
+        self,
+        limit_per_host: int = 100,
+        keepalive_timeout: float = 15,
+        ttl_dns_cache: Optional[int] = 10,
+        ssl_context: SSLContext = None,
+        json_codec: Optional[JSONCodec] = None,
+        metrics: Optional[GatewayMetrics] = None,
+        tracing: Optional[GatewayTracing] = None,
+    ):
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.ssl_context = ssl_context
+        self.json_codec = json_codec or default_codec
+        self.metrics = metrics
+        if metrics:
+            metrics.bind(self)
+        self.tracing = tracing
+        self._sessions: Dict[
+            str, Tuple[asyncio.AbstractEventLoop, aiohttp.ClientSession]
+        ] = {}
+        self._background_tasks: List[asyncio.Task] = []
+
+    def create_connector(self, socket_path: Optional[str] = None) -> aiohttp.BaseConnector:
+        if socket_path:
+            return aiohttp.UnixConnector(
+                path=socket_path,
+                limit=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+        return aiohttp.TCPConnector(
+            limit=self.limit_per_host,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            ssl=self.ssl_context,
+        )
+
+    def create_session(self, socket_path: Optional[str] = None) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=self.create_connector(socket_path=socket_path),
+            cookie_jar=cookieless_jar(),
+            trace_configs=[
+                hooks.trace_config for hooks in (self.metrics, self.tracing) if hooks
+            ]
+            or None,
+        )
+
+    def session(self, service_url: str) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        pooled = self._sessions.get(service_url)
+        if pooled:
+            session_loop, session = pooled
+            if session_loop is loop and not session.closed:
+                return session
+            if session_loop is not loop and not session.closed:
+                close_stale(session_loop, session, session.close)
+
+        session = self.create_session(socket_path=unix_socket_path(service_url))
+        self._sessions[service_url] = (loop, session)
+        return session
+
+    async def startup(self):
+        for pool in registered_pools():
+            if pool.health_check:
+                task = asyncio.ensure_future(run_health_checks(pool=pool, client=self))
+                self._background_tasks.append(task)
+
+    async def shutdown(self):
+        tasks, self._background_tasks = self._background_tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        sessions, self._sessions = self._sessions, {}
+        loop = asyncio.get_running_loop()
+        for session_loop, session in sessions.values():
+            if session_loop is loop:
+                await session.close()
+            elif not session.closed:
+                close_stale(session_loop, session, session.close)
+        # Transports reopen their connections lazily, other clients may still use them.
+        transports = registered_transports()
+        for pool in registered_pools():
+            if pool.transport and pool.transport not in transports:
+                transports.append(pool.transport)
+        for transport in transports:
+            await transport.close()
+
+
+default_client = GatewayClient()
+
+
+def setup_gateway(
+    app: FastAPI,
+    client: Optional[GatewayClient] = None,
+    rate_limit: Optional[RateLimit] = None,
+    metrics_path: Optional[str] = "/metrics",
+    batch: Optional[BatchPolicy] = None,
+) -> GatewayClient:
+    """
+    :param client: pooled sessions and settings of the gateway, a new GatewayClient by default
+    :param rate_limit: limit of all requests to the app (per client ip by default)
+    :param metrics_path: where the metrics of the client are exposed (None - nowhere)
+    :param batch: adds an endpoint running many calls to the gateway in one request
+    """
+    client = client or GatewayClient()
+    if client.metrics and metrics_path:
+        app.add_route(metrics_path, client.metrics.endpoint, include_in_schema=False)
+    if batch:
+        app.add_api_route(
+            batch.path,
+            create_batch_endpoint(policy=batch, codec=client.json_codec),
+            methods=["POST"],
+            tags=["Batch"],
+        )
+    if rate_limit:
+        app.add_middleware(RateLimitMiddleware, rate_limit=rate_limit)
+    # Added last, so it is the outermost middleware.
+    app.add_middleware(RequestArrivalMiddleware)
+    app.state.gateway_client = client
+    app.add_event_handler("startup", client.startup)
+    app.add_event_handler("shutdown", client.shutdown)
+    return client
+
+
+def get_gateway_client(request: Request) -> GatewayClient:
+    return getattr(request.app.state, "gateway_client", None) or default_client
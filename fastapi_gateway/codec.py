@@ -0,0 +1,74 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Optional, Union
+
+import ujson
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+Default = Optional[Callable[[Any], Any]]
+
+
+class JSONCodec(ABC):
+    """
+    Encodes and decodes every JSON document of the proxy path, bytes in and out.
+    """
+
+    name = ""
+
+    def __repr__(self):
+        return f"{type(self).__name__}()"
+
+    @abstractmethod
+    def dumps(self, value: Any, default: Default = None) -> bytes:
+        """default is called for objects the codec can not encode itself."""
+
+    @abstractmethod
+    def loads(self, data: Union[bytes, str]) -> Any:
+        pass
+
+
+class UjsonCodec(JSONCodec):
+    name = "ujson"
+
+    def dumps(self, value, default=None):
+        return ujson.dumps(
+            value, ensure_ascii=False, escape_forward_slashes=False, default=default
+        ).encode()
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """Requires orjson (pip install fastapi_gateway[orjson])."""
+
+    name = "orjson"
+
+    def __init__(self):
+        if orjson is None:
+            raise RuntimeError("OrjsonCodec requires orjson to be installed.")
+
+    def dumps(self, value, default=None):
+        return orjson.dumps(value, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class StdlibJSONCodec(JSONCodec):
+    name = "json"
+
+    def dumps(self, value, default=None):
+        return json.dumps(
+            value, ensure_ascii=False, separators=(",", ":"), default=default
+        ).encode()
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+default_codec = UjsonCodec()
@@ -1,27 +1,146 @@
+import asyncio
 import functools
-from aiohttp import ContentTypeError, ClientConnectorError
-from fastapi import Request, Response, HTTPException, status, params
-from typing import List, Optional, Sequence, Dict, Union, Any, Type
+import time
+from aiohttp import ClientConnectorError
+from fastapi import Depends, Request, Response, HTTPException, status, params
+from typing import List, Optional, Sequence, Dict, Tuple, Union, Any, Type
 from fastapi.datastructures import Default
 from fastapi.encoders import SetIntStr, DictIntStrAny
+from starlette.datastructures import MutableHeaders
 from starlette.responses import JSONResponse
 from starlette.routing import BaseRoute
 
-from .network import make_request
+from .balancing import ServiceURL, UpstreamInstance, UpstreamPool, create_pool
+from .breaker import CircuitBreaker, circuit_open_response
+from .cache import CachePolicy
+from .client import GatewayClient, get_gateway_client
+from .hedging import HedgePolicy
+from .limits import ConcurrencyLimit
+from .metrics import RequestTimer, RouteMetrics
+from .exceptions import (
+    CircuitOpenError,
+    ConcurrencyLimitError,
+    NoAvailableUpstreamError,
+    UpstreamConnectError,
+    UpstreamContentTypeError,
+)
+from .network import make_request, open_stream_request
+from .plan import compile_route_plan
+from .ratelimit import RateLimit
+from .retry import RetryPolicy
+from .singleflight import CoalescePolicy
+from .timeouts import TimeoutValue, Timeouts, create_timeouts, request_arrival
+from .tracing import call_span, phase_span
+from .transforms import ResponseTransform
+from .transports import Transport, register_transport
 from .utils.body import unzip_body_object
 from .utils.form import unzip_form_params
 from .utils.query import unzip_query_params
 from .utils.request import create_request_data
+from .utils.response import (
+    STREAM_CHUNK_SIZE,
+    create_passthrough_response,
+    create_streaming_response,
+    load_json_body,
+)
 from .utils.headers import (
     inheritance_service_headers,
     generate_headers_for_microservice,
+    remove_conditional_headers,
 )
 
+CONNECT_ERRORS = (ClientConnectorError, UpstreamConnectError)
+
+
+async def call_upstream_instance(
+    client: GatewayClient,
+    upstream_pool: UpstreamPool,
+    instance: UpstreamInstance,
+    transport: Optional[Transport],
+    url: str,
+    request_kwargs: Dict[str, Any],
+    call_timeouts: Timeouts,
+    route_metrics: Optional[RouteMetrics],
+    timer: Optional[RequestTimer],
+    upstream_errors: Tuple[Type[BaseException], ...],
+    stream: bool = False,
+    copy_headers: bool = False,
+):
+    """
+    One call to an instance of the pool: waits for the concurrency limit of the pool,
+    tracks the instance, sends a span and metrics and reports the outcome to the pool.
+
+    :param upstream_errors: errors of the call reported as a failure of the instance
+    :param stream: the response is opened as a stream, not read
+    :param copy_headers: the headers are shared with other calls, the span is injected
+        into a copy
+
+    :return: the result of the transport, the status code of the microservice
+        and the duration of the call
+    """
+    if transport is None:
+        open_request = open_stream_request if stream else make_request
+        request_kwargs = dict(request_kwargs, session=client.session(service_url=instance.url))
+    elif stream:
+        open_request = transport.open_stream_request
+    else:
+        open_request = transport.make_request
+    upstream_metrics = route_metrics.upstream(instance.url) if route_metrics else None
+    tracing = client.tracing
+    service_limit = upstream_pool.concurrency_limit
+    if service_limit:
+        await service_limit.acquire()
+    started = time.monotonic()
+    status_code_from_service = None
+    if timer:
+        timer.call_started()
+    try:
+        with instance.track(failure_latency=call_timeouts.total), call_span(
+            tracing, method=request_kwargs["method"], url=url
+        ) as span:
+            if tracing:
+                if copy_headers:
+                    request_kwargs = dict(
+                        request_kwargs, headers=request_kwargs["headers"].mutablecopy()
+                    )
+                tracing.inject(request_kwargs["headers"])
+            result = await open_request(
+                url=url,
+                timeout=call_timeouts,
+                trace_request_ctx=upstream_metrics,
+                **request_kwargs,
+            )
+            status_code_from_service = result.status if stream else result[1]
+            if span is not None:
+                span.set_attribute("http.response.status_code", status_code_from_service)
+    except upstream_errors as error:
+        if upstream_metrics:
+            upstream_metrics.error(error)
+        upstream_pool.report(instance=instance, status_code=None)
+        raise
+    finally:
+        if timer:
+            timer.call_ended()
+        # In stream mode the slot is freed once the headers are received.
+        if service_limit:
+            service_limit.release(
+                latency=time.monotonic() - started,
+                failed=status_code_from_service is None or status_code_from_service >= 500,
+            )
+    duration = time.monotonic() - started
+    if upstream_metrics:
+        upstream_metrics.duration.observe(duration)
+        route_metrics.response_bytes += (
+            (result.content_length or 0) if stream else len(result[0])
+        )
+    upstream_pool.report(instance=instance, status_code=status_code_from_service)
+    return result, status_code_from_service, duration
+
 
 def route(
     request_method,
     gateway_path: str,
-    service_url: str,
+    service_url: ServiceURL,
     service_path: Optional[str] = None,
     query_params: Optional[List[str]] = None,
     form_params: Optional[List[str]] = None,
@@ -48,7 +167,19 @@ def route(
     name: Optional[str] = None,
     callbacks: Optional[List[BaseRoute]] = None,
     openapi_extra: Optional[Dict[str, Any]] = None,
-    timeout: int = 60,
+    timeout: TimeoutValue = None,
+    passthrough: Optional[bool] = None,
+    stream: bool = False,
+    stream_chunk_size: int = STREAM_CHUNK_SIZE,
+    circuit_breaker: Optional[CircuitBreaker] = None,
+    cache: Optional[CachePolicy] = None,
+    coalesce: Optional[CoalescePolicy] = None,
+    response_transform: Optional[ResponseTransform] = None,
+    retry: Optional[RetryPolicy] = None,
+    hedge: Optional[HedgePolicy] = None,
+    concurrency_limit: Optional[ConcurrencyLimit] = None,
+    rate_limit: Optional[RateLimit] = None,
+    transport: Optional[Transport] = None,
 ):
     """
 
@@ -56,6 +187,7 @@ def route(
     :param service_path: the path to the endpoint on another service.
     :param request_method: is a callable (like app.get, app.post and so on.)
     :param service_url: is url path to microservice (like "https://api.example.com/v1")
+        or UpstreamPool with several instances of the microservice
     :param query_params: used to extract query parameters from endpoint and transmission to microservice
     :param form_params: used to extract form model parameters from endpoint and transmission to microservice
     :param body_params: used to extract body model from endpoint and transmission to microservice
@@ -99,10 +231,61 @@ def route(
         https://fastapi.tiangolo.com/advanced/openapi-callbacks/
     :param openapi_extra: See documentation for details -
         https://fastapi.tiangolo.com/advanced/path-operation-advanced-configuration/
+    :param timeout: max seconds to wait for the microservice response or Timeouts
+        with separate connect, time to first byte and read budgets
+        (default - timeouts of the UpstreamPool, else 60 seconds in total)
+    :param passthrough: forward the microservice body, status and headers as is,
+        without decoding and re-encoding JSON (default - when neither response_model
+        nor response_transform is set)
+    :param stream: send the microservice body to the client chunk by chunk while it is
+        being received, timeout then limits only the wait for the response headers
+    :param stream_chunk_size: max size of one chunk read from the microservice in stream mode
+    :param circuit_breaker: fail fast while the microservice keeps failing
+    :param cache: cache microservice responses (GET and HEAD by default)
+    :param coalesce: identical concurrent requests share one call to the microservice
+    :param response_transform: called with the decoded microservice JSON, its result
+        is returned (like unquote_fields("name")), can not be used with passthrough
+        or stream, their bodies are never decoded
+    :param retry: repeat failed calls (connection errors, 502-504 by default) of
+        idempotent requests, on another instance of an UpstreamPool
+    :param hedge: send a second request (GET and HEAD by default) when the first one
+        is slow, the first response wins
+    :param concurrency_limit: max requests of the route handled at once, the rest wait
+        in a bounded queue or are rejected
+    :param rate_limit: requests allowed per client ip, header or dependency result,
+        checked after the other dependencies
+    :param transport: how calls reach the microservice (AiohttpTransport, ASGITransport,
+        UnixSocketTransport, HTTP2Transport), the transport of the UpstreamPool or
+        the sessions of the GatewayClient by default
 
     :return: wrapped endpoint result as is
     """
 
+    if passthrough is None:
+        passthrough = response_model is None and response_transform is None
+    if response_transform and (passthrough or stream):
+        raise ValueError("response_transform can not be used with passthrough or stream.")
+
+    upstream_pool = create_pool(service_url=service_url)
+    if transport:
+        register_transport(transport)
+    else:
+        transport = upstream_pool.transport
+    if timeout is None:
+        timeouts = upstream_pool.timeouts or Timeouts()
+    else:
+        timeouts = create_timeouts(timeout)
+    plan = compile_route_plan(
+        gateway_path=gateway_path,
+        service_path=service_path,
+        query_params=query_params,
+        body_params=body_params,
+        form_params=form_params,
+    )
+
+    if rate_limit:
+        dependencies = [*(dependencies or []), Depends(rate_limit.create_dependency())]
+
     register_endpoint = request_method(
         path=gateway_path,
         response_model=response_model,
@@ -128,71 +311,480 @@ def route(
         openapi_extra=openapi_extra,
     )
 
+    upstream_errors = CONNECT_ERRORS + (asyncio.TimeoutError,)
+    if retry:
+        upstream_errors += retry.exceptions
+
     def wrapper(f):
-        @register_endpoint
-        @functools.wraps(f)
-        async def inner(request: Request, response: Response, **kwargs):
-            scope = request.scope
-            scope_method = scope["method"].lower()
-            content_type = str(request.headers.get('Content-Type'))
-            request_form = (
-                await request.form() if 'x-www-form-urlencoded' in content_type else None
+        def select_instance(
+            request: Request, tried: List[UpstreamInstance]
+        ) -> UpstreamInstance:
+            try:
+                try:
+                    return upstream_pool.select(request=request, exclude=tried)
+                except NoAvailableUpstreamError:
+                    # A retry goes back to a tried instance if there is no other one.
+                    if not tried:
+                        raise
+                    return upstream_pool.select(request=request)
+            except NoAvailableUpstreamError:
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Service is unavailable.",
+                )
+
+        async def call_instance(
+            client: GatewayClient,
+            instance: UpstreamInstance,
+            path: str,
+            request_kwargs: Dict[str, Any],
+            deadline: Optional[float],
+            route_metrics: Optional[RouteMetrics],
+            timer: Optional[RequestTimer],
+        ):
+            url = f"{instance.base_url}{path}"
+            call_timeouts = timeouts.until(deadline)
+            if timeouts.deadline_header and call_timeouts.total is not None:
+                request_kwargs["headers"][timeouts.deadline_header] = str(
+                    int(call_timeouts.total * 1000)
+                )
+            result, status_code_from_service, duration = await call_upstream_instance(
+                client,
+                upstream_pool,
+                instance,
+                transport,
+                url,
+                request_kwargs,
+                call_timeouts,
+                route_metrics,
+                timer,
+                upstream_errors,
+                stream=stream,
+                # Hedged calls share the headers, each one sends its own span.
+                copy_headers=hedge is not None,
             )
+            if hedge:
+                hedge.observe(latency=duration)
+            return result, status_code_from_service
+
+        async def call_hedged(
+            request: Request,
+            client: GatewayClient,
+            instance: UpstreamInstance,
+            path: str,
+            request_kwargs: Dict[str, Any],
+            deadline: Optional[float],
+            route_metrics: Optional[RouteMetrics],
+            timer: Optional[RequestTimer],
+            tried: List[UpstreamInstance],
+        ):
+            calls = [
+                asyncio.ensure_future(
+                    call_instance(
+                        client,
+                        instance,
+                        path,
+                        request_kwargs,
+                        deadline,
+                        route_metrics,
+                        timer,
+                    )
+                )
+            ]
+            winner = calls[0]
+            try:
+                delay = hedge.hedge_delay()
+                done, _ = await asyncio.wait(calls, timeout=delay)
+                if done or delay is None or not hedge.acquire():
+                    return await winner
 
-            prepare_microservice_path = f"{service_url}{gateway_path}"
-            if service_path:
-                prepare_microservice_path = f"{service_url}{service_path}"
+                hedge_instance = select_instance(request=request, tried=tried)
+                tried.append(hedge_instance)
+                calls.append(
+                    asyncio.ensure_future(
+                        call_instance(
+                            client,
+                            hedge_instance,
+                            path,
+                            request_kwargs,
+                            deadline,
+                            route_metrics,
+                            timer,
+                        )
+                    )
+                )
+                pending = calls
+                while True:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    # The first response wins, a failed call waits for the other one.
+                    for call in done:
+                        if call.exception() is None or not pending:
+                            winner = call
+                            hedge.hedge_wins += winner is calls[1]
+                            return winner.result()
+            finally:
+                for call in calls:
+                    if not call.done():
+                        call.cancel()
+                    elif (
+                        stream
+                        and call is not winner
+                        and not call.cancelled()
+                        and call.exception() is None
+                    ):
+                        # Both streams were opened, free the connection of the loser.
+                        loser, _ = call.result()
+                        loser.release()
 
-            microservice_url = prepare_microservice_path.format(**scope["path_params"])
-            request_body = await unzip_body_object(
-                necessary_params=body_params,
-                all_params=kwargs,
+        async def send_upstream(
+            request: Request,
+            method: str,
+            path: str,
+            query: Optional[Dict[str, Any]],
+            data: Any,
+            headers: MutableHeaders,
+            deadline: Optional[float],
+            route_metrics: Optional[RouteMetrics],
+            timer: Optional[RequestTimer],
+        ):
+            if not concurrency_limit:
+                return await send_with_retries(
+                    request,
+                    method,
+                    path,
+                    query,
+                    data,
+                    headers,
+                    deadline,
+                    route_metrics,
+                    timer,
+                )
 
-            )
+            await concurrency_limit.acquire()
+            started = time.monotonic()
+            failed = True
+            try:
+                result = await send_with_retries(
+                    request,
+                    method,
+                    path,
+                    query,
+                    data,
+                    headers,
+                    deadline,
+                    route_metrics,
+                    timer,
+                )
+                failed = (result.status if stream else result[1]) >= 500
+                return result
+            finally:
+                concurrency_limit.release(
+                    latency=time.monotonic() - started, failed=failed
+                )
+
+        async def call_attempt(
+            request: Request,
+            client: GatewayClient,
+            path: str,
+            request_kwargs: Dict[str, Any],
+            deadline: Optional[float],
+            route_metrics: Optional[RouteMetrics],
+            timer: Optional[RequestTimer],
+            tried: List[UpstreamInstance],
+            hedging: bool,
+        ):
+            """One attempt of a call, its outcome is recorded by the circuit breaker."""
+            if deadline is not None and deadline <= time.monotonic():
+                # The client stopped waiting before any call, the circuit learns nothing.
+                raise HTTPException(
+                    status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                    detail="Service timeout.",
+                )
+            circuit = None
+            if circuit_breaker:
+                circuit = circuit_breaker.circuit(name=upstream_pool.name)
+                circuit.before_call()
+            started = time.monotonic()
+            # None - the attempt ended without an answer of the microservice
+            # (no instance, a full concurrency limit, a client that went away).
+            failure = None
+            try:
+                instance = select_instance(request=request, tried=tried)
+                tried.append(instance)
+                try:
+                    if hedging:
+                        result, status_code_from_service = await call_hedged(
+                            request,
+                            client,
+                            instance,
+                            path,
+                            request_kwargs,
+                            deadline,
+                            route_metrics,
+                            timer,
+                            tried,
+                        )
+                    else:
+                        result, status_code_from_service = await call_instance(
+                            client,
+                            instance,
+                            path,
+                            request_kwargs,
+                            deadline,
+                            route_metrics,
+                            timer,
+                        )
+                except (asyncio.CancelledError, ConcurrencyLimitError):
+                    raise
+                except Exception:
+                    failure = True
+                    raise
+                failure = status_code_from_service >= 500
+                return result, status_code_from_service
+            finally:
+                if circuit:
+                    if failure is None:
+                        circuit.release()
+                    else:
+                        circuit.record(
+                            failure=failure, duration=time.monotonic() - started
+                        )
 
-            request_query = await unzip_query_params(
-                necessary_params=query_params, all_params=kwargs
+        async def send_with_retries(
+            request: Request,
+            method: str,
+            path: str,
+            query: Optional[Dict[str, Any]],
+            data: Any,
+            headers: MutableHeaders,
+            deadline: Optional[float],
+            route_metrics: Optional[RouteMetrics],
+            timer: Optional[RequestTimer],
+        ):
+            client = get_gateway_client(request=request)
+            retrying = retry is not None and retry.is_retryable_request(
+                method=method, data=data
             )
-            request_form = await unzip_form_params(
-                necessary_params=form_params,
-                request_form=request_form,
-                all_params=kwargs,
+            if retrying:
+                retry.budget.record_request()
+            hedging = hedge is not None and hedge.is_hedged_request(
+                method=method, data=data
             )
-
-            request_headers = generate_headers_for_microservice(
-                headers=request.headers,
+            if hedging:
+                hedge.record_request()
+            request_kwargs = dict(
+                method=method,
+                data=data,
+                query=query,
+                headers=headers,
             )
+            tried: List[UpstreamInstance] = []
+            attempt = 1
+
+            while True:
+                try:
+                    result, status_code_from_service = await call_attempt(
+                        request,
+                        client,
+                        path,
+                        request_kwargs,
+                        deadline,
+                        route_metrics,
+                        timer,
+                        tried,
+                        hedging,
+                    )
+                except upstream_errors as error:
+                    if (
+                        retrying
+                        and isinstance(error, retry.exceptions)
+                        and retry.can_retry(attempt=attempt)
+                    ):
+                        if route_metrics:
+                            route_metrics.retries += 1
+                        await asyncio.sleep(retry.delay(attempt=attempt))
+                        attempt += 1
+                        continue
+                    if isinstance(error, CONNECT_ERRORS):
+                        raise HTTPException(
+                            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Service is unavailable.",
+                        )
+                    if isinstance(error, asyncio.TimeoutError):
+                        raise HTTPException(
+                            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                            detail="Service timeout.",
+                        )
+                    raise
+
+                if (
+                    retrying
+                    and retry.is_retryable_status(status_code_from_service)
+                    and retry.can_retry(attempt=attempt)
+                ):
+                    if stream:
+                        result.release()
+                    if route_metrics:
+                        route_metrics.retries += 1
+                    await asyncio.sleep(retry.delay(attempt=attempt))
+                    attempt += 1
+                    continue
+                return result
 
-            request_data = create_request_data(
-                form=request_form,
-                body=request_body,
+        async def proxy(
+            request: Request,
+            response: Response,
+            client: GatewayClient,
+            route_metrics: Optional[RouteMetrics],
+            timer: Optional[RequestTimer],
+            kwargs: Dict[str, Any],
+        ):
+            deadline = timeouts.read_deadline(
+                headers=request.headers, started=request_arrival(request.scope)
             )
+            json_codec = client.json_codec
+            tracing = client.tracing
+            if tracing is not None and not tracing.is_recording():
+                # The phases of an unsampled request are not worth a span.
+                tracing = None
+            scope = request.scope
+            scope_method = scope["method"].lower()
+            content_type = request.headers.get("content-type", "")
+            request_form = None
+            if "x-www-form-urlencoded" in content_type:
+                with phase_span(tracing, "form parse"):
+                    request_form = await request.form()
 
-            try:
-                (
-                    resp_data,
-                    status_code_from_service,
-                    microservice_headers,
-                ) = await make_request(
-                    url=microservice_url,
+            microservice_path = plan.path.render(path_params=scope["path_params"])
+            request_body = request_query = None
+            with phase_span(tracing, "unzip params"):
+                if plan.body_params:
+                    request_body = await unzip_body_object(
+                        necessary_params=plan.body_params,
+                        all_params=kwargs,
+                        codec=json_codec,
+                    )
+                if plan.query_params:
+                    request_query = await unzip_query_params(
+                        necessary_params=plan.query_params, all_params=kwargs
+                    )
+                if plan.form_params or request_form:
+                    request_form = await unzip_form_params(
+                        necessary_params=plan.form_params,
+                        request_form=request_form,
+                        all_params=kwargs,
+                    )
+
+            with phase_span(tracing, "generate headers"):
+                request_headers = generate_headers_for_microservice(
+                    headers=request.headers,
+                )
+
+                request_data = create_request_data(
+                    form=request_form,
+                    body=request_body,
+                )
+            if route_metrics and request_body is not None:
+                route_metrics.request_bytes += request_body.size
+
+            async def fetch(etag: Optional[str] = None):
+                headers = request_headers
+                if cache:
+                    headers = remove_conditional_headers(headers=headers, etag=etag)
+                return await send_upstream(
+                    request=request,
                     method=scope_method,
-                    data=request_data,
+                    path=microservice_path,
                     query=request_query,
-                    headers=request_headers,
-                    timeout=timeout,
+                    data=request_data,
+                    headers=headers,
+                    deadline=deadline,
+                    route_metrics=route_metrics,
+                    timer=timer,
                 )
 
-            except ClientConnectorError:
+            try:
+                if cache and not stream and cache.is_cacheable_request(scope_method):
+                    cache_key = cache.create_key(
+                        method=scope_method,
+                        service=upstream_pool.name,
+                        path=microservice_path,
+                        query=request_query,
+                        headers=request.headers,
+                    )
+                    upstream_result = await cache.fetch(
+                        key=cache_key,
+                        fetch=fetch,
+                        authorized="authorization" in request.headers,
+                    )
+                elif (
+                    coalesce and not stream and coalesce.is_coalesced_request(scope_method)
+                ):
+                    coalesce_key = coalesce.create_key(
+                        method=scope_method,
+                        service=upstream_pool.name,
+                        path=microservice_path,
+                        query=request_query,
+                        headers=request.headers,
+                    )
+                    upstream_result = await coalesce.fetch(key=coalesce_key, fetch=fetch)
+                else:
+                    upstream_result = await fetch()
+            except CircuitOpenError:
+                return await circuit_open_response(
+                    breaker=circuit_breaker, request=request
+                )
+            except ConcurrencyLimitError as error:
+                if route_metrics:
+                    route_metrics.reject(
+                        "route" if error.limit is concurrency_limit else "service"
+                    )
                 raise HTTPException(
-                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-                    detail="Service is unavailable.",
+                    status_code=error.limit.status_code,
+                    detail="Service is overloaded.",
+                )
+
+            if stream:
+                return create_streaming_response(
+                    service_response=upstream_result,
+                    gateway_headers=response.headers,
+                    override_headers=override_headers,
+                    chunk_size=stream_chunk_size,
+                )
+
+            (
+                resp_body,
+                status_code_from_service,
+                microservice_headers,
+            ) = upstream_result
+
+            if passthrough:
+                return create_passthrough_response(
+                    body=resp_body,
+                    status_code=status_code_from_service,
+                    service_headers=microservice_headers,
+                    gateway_headers=response.headers,
+                    override_headers=override_headers,
                 )
-            except ContentTypeError:
+
+            try:
+                with phase_span(tracing, "response decode"):
+                    resp_data = load_json_body(
+                        body=resp_body, headers=microservice_headers, codec=json_codec
+                    )
+            except UpstreamContentTypeError as error:
+                if route_metrics:
+                    route_metrics.error(error)
                 raise HTTPException(
                     status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                     detail="Service error.",
                 )
 
+            if response_transform:
+                resp_data = response_transform(resp_data)
+
             if override_headers:
                 service_headers = inheritance_service_headers(
                     gateway_headers=response.headers,
@@ -204,4 +796,49 @@ def route(
 
             return resp_data
 
+        async def measure(
+            request: Request,
+            response: Response,
+            client: GatewayClient,
+            kwargs: Dict[str, Any],
+        ):
+            if client.metrics is None:
+                return await proxy(request, response, client, None, None, kwargs)
+
+            route_metrics = client.metrics.route(request.scope["route"].path, hedge=hedge)
+            timer = RequestTimer()
+            status_code_to_client = status.HTTP_500_INTERNAL_SERVER_ERROR
+            route_metrics.in_flight += 1
+            try:
+                result = await proxy(
+                    request, response, client, route_metrics, timer, kwargs
+                )
+                if isinstance(result, Response):
+                    status_code_to_client = result.status_code
+                else:
+                    status_code_to_client = response.status_code or status_code or 200
+                return result
+            except HTTPException as error:
+                status_code_to_client = error.status_code
+                raise
+            finally:
+                route_metrics.in_flight -= 1
+                route_metrics.observe_request(
+                    method=request.scope["method"],
+                    status_code=status_code_to_client,
+                    duration=time.perf_counter() - timer.started,
+                    upstream_duration=timer.upstream,
+                )
+
+        @register_endpoint
+        @functools.wraps(f)
+        async def inner(request: Request, response: Response, **kwargs):
+            client = get_gateway_client(request=request)
+            if client.tracing is None:
+                return await measure(request, response, client, kwargs)
+
+            span_name = f'{request.scope["method"]} {request.scope["route"].path}'
+            with client.tracing.request_span(name=span_name, headers=request.headers):
+                return await measure(request, response, client, kwargs)
+
     return wrapper
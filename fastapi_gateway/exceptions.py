@@ -0,0 +1,33 @@
+from aiohttp import ClientConnectionError
+
+
+class GatewayError(Exception):
+    pass
+
+
+class UpstreamContentTypeError(GatewayError):
+    def __init__(self, content_type: str):
+        super().__init__(f"Unexpected upstream content type: {content_type!r}")
+        self.content_type = content_type
+
+
+class NoAvailableUpstreamError(GatewayError):
+    def __init__(self, pool):
+        super().__init__(f"No available instances in {pool!r}")
+        self.pool = pool
+
+
+class CircuitOpenError(GatewayError):
+    def __init__(self, name: str):
+        super().__init__(f"Circuit for {name!r} is open")
+        self.name = name
+
+
+class ConcurrencyLimitError(GatewayError):
+    def __init__(self, limit):
+        super().__init__(f"Concurrency limit reached: {limit!r}")
+        self.limit = limit
+
+
+class UpstreamConnectError(GatewayError, ClientConnectionError):
+    """An instance could not be reached by a transport, like aiohttp ClientConnectorError."""
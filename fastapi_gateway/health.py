@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import math
+import time
+from typing import TYPE_CHECKING, Container, Optional
+
+import aiohttp
+import async_timeout
+
+if TYPE_CHECKING:
+    from .balancing import UpstreamInstance, UpstreamPool
+    from .client import GatewayClient
+    from .transports import Transport
+
+logger = logging.getLogger("fastapi_gateway.health")
+
+
+class HealthCheck:
+    """
+    Active probing of every instance in the background (started by setup_gateway).
+
+    :param path: path requested on every instance (like "/health")
+    :param interval: seconds between probes
+    :param timeout: seconds to wait for a probe response
+    :param healthy_threshold: successful probes in a row to readmit an instance
+    :param unhealthy_threshold: failed probes in a row to eject an instance
+    :param expected_statuses: response statuses counted as success
+    """
+
+    def __init__(
+        self,
+        path: str = "/health",
+        interval: float = 10.0,
+        timeout: float = 2.0,
+        healthy_threshold: int = 2,
+        unhealthy_threshold: int = 3,
+        expected_statuses: Container[int] = range(200, 400),
+    ):
+        self.path = path
+        self.interval = interval
+        self.timeout = timeout
+        self.healthy_threshold = healthy_threshold
+        self.unhealthy_threshold = unhealthy_threshold
+        self.expected_statuses = expected_statuses
+
+    def record(self, instance: "UpstreamInstance", success: bool):
+        if success:
+            instance.probe_successes += 1
+            instance.probe_failures = 0
+            if not instance.healthy and instance.probe_successes >= self.healthy_threshold:
+                instance.healthy = True
+                instance.ejected_until = 0.0
+                instance.consecutive_errors = 0
+                instance.consecutive_5xx = 0
+                logger.info("Upstream %s is healthy again", instance.url)
+        else:
+            instance.probe_failures += 1
+            instance.probe_successes = 0
+            if instance.healthy and instance.probe_failures >= self.unhealthy_threshold:
+                instance.healthy = False
+                logger.warning("Upstream %s failed health checks", instance.url)
+
+
+class OutlierDetection:
+    """
+    Passive ejection of instances based on real traffic.
+
+    :param consecutive_errors: connection errors or timeouts in a row to eject an instance
+    :param consecutive_5xx: 5xx responses in a row to eject an instance
+    :param ejection_time: seconds an instance is skipped, without active health checks
+        it is readmitted after that, with them - only after successful probes
+    """
+
+    def __init__(
+        self,
+        consecutive_errors: int = 5,
+        consecutive_5xx: int = 5,
+        ejection_time: float = 30.0,
+    ):
+        self.consecutive_errors = consecutive_errors
+        self.consecutive_5xx = consecutive_5xx
+        self.ejection_time = ejection_time
+
+    def record(
+        self,
+        instance: "UpstreamInstance",
+        status_code: Optional[int],
+        health_check: Optional[HealthCheck] = None,
+    ):
+        if status_code is None:
+            instance.consecutive_errors += 1
+        elif status_code >= 500:
+            instance.consecutive_errors = 0
+            instance.consecutive_5xx += 1
+        else:
+            instance.consecutive_errors = 0
+            instance.consecutive_5xx = 0
+            return
+
+        if (
+            instance.consecutive_errors >= self.consecutive_errors
+            or instance.consecutive_5xx >= self.consecutive_5xx
+        ):
+            self.eject(instance=instance, health_check=health_check)
+
+    def eject(
+        self, instance: "UpstreamInstance", health_check: Optional[HealthCheck] = None
+    ):
+        logger.warning("Upstream %s ejected as an outlier", instance.url)
+        instance.consecutive_errors = 0
+        instance.consecutive_5xx = 0
+        if health_check:
+            instance.healthy = False
+            instance.probe_successes = 0
+            instance.ejected_until = math.inf
+        else:
+            instance.ejected_until = time.monotonic() + self.ejection_time
+
+
+async def probe_instance(
+    instance: "UpstreamInstance",
+    health_check: HealthCheck,
+    session: Optional[aiohttp.ClientSession] = None,
+    transport: Optional["Transport"] = None,
+) -> bool:
+    """
+    Probes go the way the calls of the pool go: through its transport if it has one,
+    otherwise through the session.
+    """
+    url = f"{instance.base_url}{health_check.path}"
+    try:
+        async with async_timeout.timeout(delay=health_check.timeout):
+            if transport is not None:
+                _, status, _ = await transport.make_request(
+                    url=url, method="get", headers={}, timeout=health_check.timeout
+                )
+                return status in health_check.expected_statuses
+            async with session.get(url) as response:
+                return response.status in health_check.expected_statuses
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return False
+
+
+async def probe_pool(pool: "UpstreamPool", client: "GatewayClient"):
+    health_check = pool.health_check
+    results = await asyncio.gather(
+        *(
+            probe_instance(
+                instance=instance,
+                health_check=health_check,
+                session=(
+                    None if pool.transport else client.session(service_url=instance.url)
+                ),
+                transport=pool.transport,
+            )
+            for instance in pool.instances
+        )
+    )
+    for instance, success in zip(pool.instances, results):
+        health_check.record(instance=instance, success=success)
+
+
+async def run_health_checks(pool: "UpstreamPool", client: "GatewayClient"):
+    while True:
+        try:
+            await probe_pool(pool=pool, client=client)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Health check of %r failed", pool)
+        await asyncio.sleep(pool.health_check.interval)
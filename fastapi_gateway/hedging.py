@@ -0,0 +1,91 @@
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Sequence
+
+from aiohttp import FormData
+
+from .breaker import RollingWindow
+
+
+class HedgePolicy:
+    """
+    Sends a second identical request (to another instance of a pool if there is one)
+    when the first one is slow, the first response wins and the other call is cancelled.
+
+    :param delay: seconds to wait for the first call before hedging,
+        by default the observed latency percentile of the route
+    :param percentile: observed latency used as the delay when delay is not set
+    :param min_delay: lower limit of the observed delay
+    :param min_samples: latencies observed before hedging starts when delay is not set
+    :param max_ratio: max share of requests hedged in the last window seconds
+    :param window: seconds the hedge ratio is calculated over
+    :param methods: hedged request methods
+    """
+
+    def __init__(
+        self,
+        delay: Optional[float] = None,
+        percentile: float = 0.95,
+        min_delay: float = 0.005,
+        min_samples: int = 20,
+        max_ratio: float = 0.1,
+        window: float = 10.0,
+        methods: Sequence[str] = ("GET", "HEAD"),
+    ):
+        self.delay = delay
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.max_ratio = max_ratio
+        self.methods = frozenset(method.upper() for method in methods)
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.capped = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self._observed_delay: Optional[float] = None
+        self._observations = 0
+        # Calls are requests, "failures" of the window count hedges.
+        self._calls = RollingWindow(window=window, buckets=10)
+
+    def is_hedged_request(self, method: str, data: Any) -> bool:
+        return method.upper() in self.methods and not isinstance(data, FormData)
+
+    def observe(self, latency: float):
+        self._latencies.append(latency)
+        self._observations += 1
+        # The percentile is refreshed every 50 calls, sorting on every call is too slow.
+        if self._observed_delay is None or self._observations % 50 == 0:
+            if len(self._latencies) >= self.min_samples:
+                latencies = sorted(self._latencies)
+                index = min(int(len(latencies) * self.percentile), len(latencies) - 1)
+                self._observed_delay = max(latencies[index], self.min_delay)
+
+    def hedge_delay(self) -> Optional[float]:
+        """None - the request is not hedged (not enough latencies observed)."""
+        if self.delay is not None:
+            return self.delay
+        return self._observed_delay
+
+    def record_request(self):
+        self.requests += 1
+        self._calls.add(now=time.monotonic(), failure=False, slow=False)
+
+    def acquire(self) -> bool:
+        now = time.monotonic()
+        calls, hedges, _ = self._calls.totals(now=now)
+        if hedges >= self.max_ratio * (calls - hedges):
+            self.capped += 1
+            return False
+        self.hedged += 1
+        self._calls.add(now=now, failure=True, slow=False)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "capped": self.capped,
+            "delay": self.hedge_delay(),
+        }
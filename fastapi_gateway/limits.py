@@ -0,0 +1,117 @@
+import asyncio
+from collections import deque
+from typing import Deque, Optional
+
+from starlette import status
+
+from .exceptions import ConcurrencyLimitError
+
+
+class AdaptiveLimit:
+    """
+    AIMD: the limit grows by one while calls succeed with the limit in use,
+    and is cut by backoff_ratio when a call fails or is slower than latency_threshold.
+
+    :param min_limit: the limit never goes lower
+    :param max_limit: the limit never goes higher
+    :param latency_threshold: seconds after which a call counts as a sign of overload
+    :param backoff_ratio: the limit is multiplied by it on overload
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 1000,
+        latency_threshold: Optional[float] = None,
+        backoff_ratio: float = 0.9,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.backoff_ratio = backoff_ratio
+
+    def update(self, limit: int, in_flight: int, latency: float, failed: bool) -> int:
+        slow = self.latency_threshold is not None and latency > self.latency_threshold
+        if failed or slow:
+            return max(self.min_limit, int(limit * self.backoff_ratio))
+        # Growing while most of the limit is unused would only hide the next overload.
+        if in_flight * 2 >= limit:
+            return min(self.max_limit, limit + 1)
+        return limit
+
+
+class ConcurrencyLimit:
+    """
+    Bulkhead: at most max_in_flight calls at once, the others wait in a bounded queue.
+
+    :param max_in_flight: simultaneous calls (the start value for an adaptive limit)
+    :param max_queue: requests waiting for a free slot, more are rejected at once
+    :param queue_timeout: seconds a request waits in the queue before it is rejected
+    :param status_code: response status of rejected requests (503 or 429)
+    :param adaptive: adjusts max_in_flight by the observed failures and latency
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 100,
+        max_queue: int = 100,
+        queue_timeout: float = 1.0,
+        status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE,
+        adaptive: Optional[AdaptiveLimit] = None,
+    ):
+        self.limit = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.status_code = status_code
+        self.adaptive = adaptive
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def __repr__(self):
+        return f"ConcurrencyLimit(limit={self.limit}, in_flight={self.in_flight})"
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self):
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected += 1
+            raise ConcurrencyLimitError(limit=self)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ConcurrencyLimitError(limit=self)
+        except asyncio.CancelledError:
+            # The slot was handed over just before the cancellation, pass it on.
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def release(self, latency: float, failed: bool):
+        """failed - the call raised an error or the microservice answered 5xx."""
+        if self.adaptive:
+            self.limit = self.adaptive.update(
+                limit=self.limit, in_flight=self.in_flight, latency=latency, failed=failed
+            )
+        self._release_slot()
+
+    def _release_slot(self):
+        self.in_flight -= 1
+        # A released slot goes straight to the oldest waiter.
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
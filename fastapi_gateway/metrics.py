@@ -0,0 +1,417 @@
+import math
+import time
+from bisect import bisect_left
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import aiohttp
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .balancing import registered_pools
+from .breaker import circuit_states
+
+try:
+    import prometheus_client
+    from prometheus_client.core import (
+        CounterMetricFamily,
+        GaugeMetricFamily,
+        HistogramMetricFamily,
+    )
+    from prometheus_client.utils import floatToGoString
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+if TYPE_CHECKING:  # pragma: no cover
+    from .client import GatewayClient
+    from .hedging import HedgePolicy
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+class RequestTimer:
+    """
+    Time of a request in the gateway. upstream is the time at least one call to a
+    microservice was in flight: concurrent calls (hedges, aggregate legs) count once,
+    concurrency limit queues and retry backoff are not counted.
+    """
+
+    __slots__ = ("started", "upstream", "_calls", "_calls_started")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.upstream = 0.0
+        self._calls = 0
+        self._calls_started = 0.0
+
+    def call_started(self):
+        if not self._calls:
+            self._calls_started = time.perf_counter()
+        self._calls += 1
+
+    def call_ended(self):
+        self._calls -= 1
+        if not self._calls:
+            self.upstream += time.perf_counter() - self._calls_started
+
+
+class LatencyHistogram:
+    """
+    Bucket counts kept as plain numbers and exported at scrape time.
+    The gateway updates and scrapes them from the event loop, so they need no lock.
+    """
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (math.inf,), self.counts):
+            total += count
+            result.append((floatToGoString(bound), total))
+        return result
+
+
+class UpstreamMetrics:
+    """Metrics of one route and upstream instance."""
+
+    __slots__ = ("duration", "ttfb", "connect", "errors")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.duration = LatencyHistogram(buckets)
+        self.ttfb = LatencyHistogram(buckets)
+        self.connect = LatencyHistogram(buckets)
+        self.errors: Dict[str, int] = {}
+
+    def error(self, error: BaseException):
+        name = type(error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+
+class RouteMetrics:
+    """Metrics of one route, hedge is the HedgePolicy of the route whose stats are exported."""
+
+    def __init__(self, buckets: Sequence[float], hedge: Optional["HedgePolicy"] = None):
+        self.buckets = buckets
+        self.hedge = hedge
+        self.in_flight = 0
+        self.duration = LatencyHistogram(buckets)
+        self.overhead = LatencyHistogram(buckets)
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.upstreams: Dict[str, UpstreamMetrics] = {}
+        self.errors: Dict[str, int] = {}
+        self.retries = 0
+        # Calls rejected by a concurrency limit, by the limit ("route" or "service").
+        self.rejections: Dict[str, int] = {}
+
+    def upstream(self, url: str) -> UpstreamMetrics:
+        upstream = self.upstreams.get(url)
+        if upstream is None:
+            upstream = self.upstreams[url] = UpstreamMetrics(self.buckets)
+        return upstream
+
+    def observe_request(
+        self, method: str, status_code: int, duration: float, upstream_duration: float
+    ):
+        key = (method, status_code)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        self.duration.observe(duration)
+        self.overhead.observe(max(duration - upstream_duration, 0.0))
+
+    def error(self, error: BaseException):
+        """Errors of the gateway itself, like an unexpected microservice content type."""
+        name = type(error).__name__
+        self.errors[name] = self.errors.get(name, 0) + 1
+
+    def reject(self, limit: str):
+        self.rejections[limit] = self.rejections.get(limit, 0) + 1
+
+
+async def _on_request_start(session, context: SimpleNamespace, params):
+    context.started = time.perf_counter()
+
+
+async def _on_request_end(session, context: SimpleNamespace, params):
+    # Called when the response headers are received.
+    if isinstance(context.trace_request_ctx, UpstreamMetrics):
+        context.trace_request_ctx.ttfb.observe(time.perf_counter() - context.started)
+
+
+async def _on_connection_create_start(session, context: SimpleNamespace, params):
+    context.connect_started = time.perf_counter()
+
+
+async def _on_connection_create_end(session, context: SimpleNamespace, params):
+    if isinstance(context.trace_request_ctx, UpstreamMetrics):
+        context.trace_request_ctx.connect.observe(
+            time.perf_counter() - context.connect_started
+        )
+
+
+class GatewayCollector:
+    """Exports the metrics and reads the gauges of the client at scrape time."""
+
+    def __init__(self, metrics: "GatewayMetrics", client: "GatewayClient"):
+        self.metrics = metrics
+        self.client = client
+
+    def collect(self) -> Iterator[Any]:
+        yield from self.collect_routes()
+        yield from self.collect_upstreams()
+
+    def collect_routes(self) -> Iterable[Any]:
+        name = self.metrics.namespace
+        requests = CounterMetricFamily(
+            f"{name}_requests",
+            "Requests by route, method and status.",
+            labels=["route", "method", "status"],
+        )
+        in_flight = GaugeMetricFamily(
+            f"{name}_requests_in_flight", "Requests being handled.", labels=["route"]
+        )
+        duration = HistogramMetricFamily(
+            f"{name}_request_duration_seconds",
+            "Time of the whole request in the gateway.",
+            labels=["route"],
+        )
+        overhead = HistogramMetricFamily(
+            f"{name}_overhead_seconds",
+            "Request time minus the time waiting for the microservice.",
+            labels=["route"],
+        )
+        request_bytes = CounterMetricFamily(
+            f"{name}_request_bytes",
+            "Request body bytes sent to microservices.",
+            labels=["route"],
+        )
+        response_bytes = CounterMetricFamily(
+            f"{name}_response_bytes",
+            "Response body bytes received from microservices.",
+            labels=["route"],
+        )
+        upstream_duration = HistogramMetricFamily(
+            f"{name}_upstream_duration_seconds",
+            "Time of one call to the microservice.",
+            labels=["route", "upstream"],
+        )
+        upstream_ttfb = HistogramMetricFamily(
+            f"{name}_upstream_ttfb_seconds",
+            "Time from sending a call to the response headers.",
+            labels=["route", "upstream"],
+        )
+        upstream_connect = HistogramMetricFamily(
+            f"{name}_upstream_connect_seconds",
+            "Time to open a new connection to the microservice.",
+            labels=["route", "upstream"],
+        )
+        upstream_errors = CounterMetricFamily(
+            f"{name}_upstream_errors",
+            "Failed calls by error type, upstream is empty for errors of the gateway.",
+            labels=["route", "upstream", "error"],
+        )
+        retries = CounterMetricFamily(
+            f"{name}_retries", "Calls sent again by the retry policy.", labels=["route"]
+        )
+        rejections = CounterMetricFamily(
+            f"{name}_limit_rejections",
+            "Calls rejected by a concurrency limit of the route or the service.",
+            labels=["route", "limit"],
+        )
+        hedge_requests = CounterMetricFamily(
+            f"{name}_hedge_requests",
+            "Requests the hedge policy could hedge.",
+            labels=["route"],
+        )
+        hedges = CounterMetricFamily(
+            f"{name}_hedges", "Hedged calls sent.", labels=["route"]
+        )
+        hedge_wins = CounterMetricFamily(
+            f"{name}_hedge_wins",
+            "Hedged calls answering before the first call.",
+            labels=["route"],
+        )
+        hedges_capped = CounterMetricFamily(
+            f"{name}_hedges_capped",
+            "Hedges not sent because of the max ratio of the policy.",
+            labels=["route"],
+        )
+        hedge_delay = GaugeMetricFamily(
+            f"{name}_hedge_delay_seconds",
+            "Wait for the first call before hedging.",
+            labels=["route"],
+        )
+
+        for route, metrics in list(self.metrics.routes.items()):
+            for (method, status_code), count in list(metrics.requests.items()):
+                requests.add_metric([route, method, str(status_code)], count)
+            in_flight.add_metric([route], metrics.in_flight)
+            add_histogram(duration, [route], metrics.duration)
+            add_histogram(overhead, [route], metrics.overhead)
+            request_bytes.add_metric([route], metrics.request_bytes)
+            response_bytes.add_metric([route], metrics.response_bytes)
+            retries.add_metric([route], metrics.retries)
+            for limit, count in list(metrics.rejections.items()):
+                rejections.add_metric([route, limit], count)
+            if metrics.hedge is not None:
+                stats = metrics.hedge.stats()
+                hedge_requests.add_metric([route], stats["requests"])
+                hedges.add_metric([route], stats["hedged"])
+                hedge_wins.add_metric([route], stats["hedge_wins"])
+                hedges_capped.add_metric([route], stats["capped"])
+                if stats["delay"] is not None:
+                    hedge_delay.add_metric([route], stats["delay"])
+            for error, count in list(metrics.errors.items()):
+                upstream_errors.add_metric([route, "", error], count)
+            for url, upstream in list(metrics.upstreams.items()):
+                add_histogram(upstream_duration, [route, url], upstream.duration)
+                add_histogram(upstream_ttfb, [route, url], upstream.ttfb)
+                add_histogram(upstream_connect, [route, url], upstream.connect)
+                for error, count in list(upstream.errors.items()):
+                    upstream_errors.add_metric([route, url, error], count)
+
+        return (
+            requests,
+            in_flight,
+            duration,
+            overhead,
+            request_bytes,
+            response_bytes,
+            upstream_duration,
+            upstream_ttfb,
+            upstream_connect,
+            upstream_errors,
+            retries,
+            rejections,
+            hedge_requests,
+            hedges,
+            hedge_wins,
+            hedges_capped,
+            hedge_delay,
+        )
+
+    def collect_upstreams(self) -> Iterable[Any]:
+        name = self.metrics.namespace
+        in_flight = GaugeMetricFamily(
+            f"{name}_upstream_in_flight",
+            "Calls in flight per upstream instance.",
+            labels=["upstream"],
+        )
+        available = GaugeMetricFamily(
+            f"{name}_upstream_available",
+            "1 if the upstream instance is healthy and not ejected.",
+            labels=["upstream"],
+        )
+        now = time.monotonic()
+        for pool in registered_pools():
+            for instance in pool.instances:
+                in_flight.add_metric([instance.url], instance.in_flight)
+                available.add_metric([instance.url], int(instance.is_available(now)))
+
+        connections = GaugeMetricFamily(
+            f"{name}_upstream_connections",
+            "Pooled connections per service by state (acquired, idle) and the pool limit.",
+            labels=["upstream", "state"],
+        )
+        for url, (_, session) in list(self.client._sessions.items()):
+            connector = session.connector
+            if connector is None or session.closed:
+                continue
+            counts = connection_counts(connector)
+            if counts is not None:
+                connections.add_metric([url, "acquired"], counts[0])
+                connections.add_metric([url, "idle"], counts[1])
+            connections.add_metric(
+                [url, "limit"], connector.limit_per_host or connector.limit
+            )
+
+        circuits = GaugeMetricFamily(
+            f"{name}_circuit_open",
+            "1 if the circuit breaker of the service is open, 0.5 half-open.",
+            labels=["circuit"],
+        )
+        for circuit, state in circuit_states().items():
+            circuits.add_metric(
+                [circuit], {"closed": 0, "half_open": 0.5, "open": 1}[state.value]
+            )
+
+        return in_flight, available, connections, circuits
+
+
+def connection_counts(connector: aiohttp.BaseConnector) -> Optional[Tuple[int, int]]:
+    """
+    Acquired and idle connections of the connector. aiohttp has no public API for them,
+    None when its internals are not the expected ones (the gauges are left out).
+    """
+    try:
+        acquired = len(connector._acquired)
+        idle = sum(len(connections) for connections in connector._conns.values())
+    except (AttributeError, TypeError):
+        return None
+    return acquired, idle
+
+
+def add_histogram(family: Any, labels: List[str], histogram: LatencyHistogram):
+    family.add_metric(labels, histogram.cumulative(), histogram.sum)
+
+
+class GatewayMetrics:
+    """
+    Prometheus metrics of the gateway, requires prometheus_client
+    (pip install fastapi_gateway[prometheus]).
+
+    The proxy path only adds to plain numbers, prometheus_client reads them at scrape time.
+
+    :param registry: where metrics are registered, the prometheus_client default one by default
+    :param namespace: prefix of the metric names
+    :param buckets: latency histogram buckets in seconds
+    """
+
+    def __init__(
+        self,
+        registry: Any = None,
+        namespace: str = "gateway",
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        if prometheus_client is None:
+            raise RuntimeError("GatewayMetrics requires prometheus_client to be installed.")
+        self.registry = registry or prometheus_client.REGISTRY
+        self.namespace = namespace
+        self.buckets = tuple(sorted(buckets))
+        self.routes: Dict[str, RouteMetrics] = {}
+        self.trace_config = aiohttp.TraceConfig()
+        self.trace_config.on_request_start.append(_on_request_start)
+        self.trace_config.on_request_end.append(_on_request_end)
+        self.trace_config.on_connection_create_start.append(_on_connection_create_start)
+        self.trace_config.on_connection_create_end.append(_on_connection_create_end)
+        self._collector: Optional[GatewayCollector] = None
+
+    def bind(self, client: "GatewayClient"):
+        """Registers the metrics of the client, once."""
+        if self._collector is None:
+            self._collector = GatewayCollector(metrics=self, client=client)
+            self.registry.register(self._collector)
+
+    def route(self, route: str, hedge: Optional["HedgePolicy"] = None) -> RouteMetrics:
+        metrics = self.routes.get(route)
+        if metrics is None:
+            metrics = self.routes[route] = RouteMetrics(self.buckets, hedge=hedge)
+        return metrics
+
+    async def endpoint(self, request: Request) -> Response:
+        return Response(
+            content=prometheus_client.generate_latest(self.registry),
+            media_type=prometheus_client.CONTENT_TYPE_LATEST,
+        )
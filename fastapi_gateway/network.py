@@ -1,29 +1,87 @@
 import aiohttp
 import async_timeout
-from typing import Optional, Union
-from aiohttp import JsonPayload
+from typing import Any, Optional, Union
+from aiohttp import BytesPayload
 from starlette.datastructures import Headers
+from fastapi_gateway.timeouts import TimeoutValue, Timeouts, create_timeouts
 from fastapi_gateway.utils.form import CustomFormData
-from fastapi_gateway.utils.response import decode_json
 from fastapi_gateway.utils.request import create_dict_if_not
 
 
+async def send_request(
+    session: aiohttp.ClientSession,
+    url: str,
+    method: str,
+    headers: Union[Headers, dict],
+    query: Optional[dict],
+    data: Union[CustomFormData, BytesPayload, None],
+    timeouts: Timeouts,
+    trace_request_ctx: Any = None,
+) -> aiohttp.ClientResponse:
+    # Returns as soon as the response headers are received.
+    async with async_timeout.timeout(delay=timeouts.ttfb):
+        return await session.request(
+            method=method,
+            url=url,
+            params=create_dict_if_not(data=query),
+            data=create_dict_if_not(data=data),
+            headers=headers,
+            timeout=timeouts.client_timeout,
+            trace_request_ctx=trace_request_ctx,
+        )
+
+
 async def make_request(
+    session: aiohttp.ClientSession,
     url: str,
     method: str,
     headers: Union[Headers, dict],
     query: Optional[dict] = None,
-    data: Union[CustomFormData, JsonPayload] = None,
-    timeout: int = 60,
+    data: Union[CustomFormData, BytesPayload] = None,
+    timeout: TimeoutValue = 60,
+    trace_request_ctx: Any = None,
 ):
-    data = create_dict_if_not(data=data)
-    query = create_dict_if_not(data=query)
-
-    async with async_timeout.timeout(delay=timeout):
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.request(
-                method=method, url=url, params=query, data=data
-            ) as response:
-                response_json = await response.json()
-                decoded_json = decode_json(data=response_json)
-                return decoded_json, response.status, response.headers
+    timeouts = create_timeouts(timeout)
+
+    async with async_timeout.timeout(delay=timeouts.total):
+        response = await send_request(
+            session=session,
+            url=url,
+            method=method,
+            headers=headers,
+            query=query,
+            data=data,
+            timeouts=timeouts,
+            trace_request_ctx=trace_request_ctx,
+        )
+        async with response:
+            body = await response.read()
+            return body, response.status, response.headers
+
+
+async def open_stream_request(
+    session: aiohttp.ClientSession,
+    url: str,
+    method: str,
+    headers: Union[Headers, dict],
+    query: Optional[dict] = None,
+    data: Union[CustomFormData, BytesPayload] = None,
+    timeout: TimeoutValue = 60,
+    trace_request_ctx: Any = None,
+) -> aiohttp.ClientResponse:
+    timeouts = create_timeouts(timeout)
+
+    # Only waiting for the response headers is limited, the body is read
+    # while the client consumes it and the caller has to release the response.
+    # A stalled body is still cut by the read timeout.
+    async with async_timeout.timeout(delay=timeouts.total):
+        return await send_request(
+            session=session,
+            url=url,
+            method=method,
+            headers=headers,
+            query=query,
+            data=data,
+            timeouts=timeouts,
+            trace_request_ctx=trace_request_ctx,
+        )
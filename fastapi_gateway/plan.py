@@ -0,0 +1,61 @@
+from string import Formatter
+from typing import Any, Mapping, NamedTuple, Optional, Sequence, Tuple
+
+
+class PathTemplate:
+    """
+    A path split once into (literal, field) pairs, rendering only joins them.
+    The format spec of a field is ignored, like the convertor of "{path:path}".
+    """
+
+    __slots__ = ("template", "parts", "fields")
+
+    def __init__(self, template: str):
+        self.template = template
+        self.parts: Tuple[Tuple[str, Optional[str]], ...] = tuple(
+            (literal, field) for literal, field, _, _ in Formatter().parse(template)
+        )
+        self.fields = tuple(field for _, field in self.parts if field is not None)
+
+    def __repr__(self):
+        return f"PathTemplate({self.template!r})"
+
+    def render(self, path_params: Mapping[str, Any]) -> str:
+        if not self.fields:
+            return self.template
+        return "".join(
+            literal + (str(path_params[field]) if field is not None else "")
+            for literal, field in self.parts
+        )
+
+
+class RoutePlan(NamedTuple):
+    """Everything route() needs per request, resolved once at decoration time."""
+
+    path: PathTemplate
+    query_params: Tuple[str, ...]
+    body_params: Tuple[str, ...]
+    form_params: Tuple[str, ...]
+
+
+def compile_route_plan(
+    gateway_path: str,
+    service_path: Optional[str] = None,
+    query_params: Optional[Sequence[str]] = None,
+    body_params: Optional[Sequence[str]] = None,
+    form_params: Optional[Sequence[str]] = None,
+) -> RoutePlan:
+    path = PathTemplate(template=service_path or gateway_path)
+    if service_path:
+        gateway_fields = PathTemplate(template=gateway_path).fields
+        for field in path.fields:
+            if field not in gateway_fields:
+                raise ValueError(
+                    f"Path param {field!r} of {service_path!r} is not in {gateway_path!r}."
+                )
+    return RoutePlan(
+        path=path,
+        query_params=tuple(query_params or ()),
+        body_params=tuple(body_params or ()),
+        form_params=tuple(form_params or ()),
+    )
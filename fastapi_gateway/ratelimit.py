@@ -0,0 +1,265 @@
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+from fastapi import Depends, HTTPException
+from starlette import status
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+KeyFunction = Callable[[Request], str]
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int
+    reset_after: float
+    retry_after: float
+
+
+class RateLimitBackend(ABC):
+    """
+    Stores the theoretical arrival time of every key (GCRA, a token bucket without a timer).
+    """
+
+    @abstractmethod
+    async def hit(self, key: str, interval: float, burst: int) -> RateLimitResult:
+        """
+        :param interval: seconds one request takes from the bucket to refill
+        :param burst: requests allowed at once
+        """
+
+
+def gcra(tat: Optional[float], now: float, interval: float, burst: int):
+    """Returns the result and the new theoretical arrival time (None - unchanged)."""
+    tat = now if tat is None or tat < now else tat
+    new_tat = tat + interval
+    allow_at = new_tat - burst * interval
+    if now < allow_at:
+        return RateLimitResult(False, 0, tat - now, allow_at - now), None
+    remaining = int((now - allow_at) / interval + 1e-9)
+    return RateLimitResult(True, remaining, new_tat - now, 0.0), new_tat
+
+
+class MemoryRateLimitBackend(RateLimitBackend):
+    """
+    Limits of one gateway worker.
+
+    :param max_keys: keys kept at most, the least recently hit buckets are dropped first
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # Ordered from the least to the most recently hit key.
+        self._tats: "OrderedDict[str, float]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._tats)
+
+    async def hit(self, key, interval, burst):
+        now = time.monotonic()
+        result, new_tat = gcra(self._tats.get(key), now, interval, burst)
+        if new_tat is not None:
+            if key in self._tats:
+                self._tats.move_to_end(key)
+            elif len(self._tats) >= self.max_keys:
+                self._evict(now=now)
+            self._tats[key] = new_tat
+        return result
+
+    def _evict(self, now: float):
+        # A bucket whose arrival time has passed is full again, forgetting it changes nothing,
+        # so the refilled buckets at the front go too. Every key is dropped at most once,
+        # eviction costs O(1) per new key on average.
+        tats = self._tats
+        while tats and (len(tats) >= self.max_keys or next(iter(tats.values())) <= now):
+            tats.popitem(last=False)
+
+
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = tonumber(redis.call("GET", KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval
+local allow_at = new_tat - burst * interval
+if now < allow_at then
+    return {0, 0, tostring(tat - now), tostring(allow_at - now)}
+end
+redis.call("SET", KEYS[1], tostring(new_tat), "PX", math.ceil((new_tat - now) * 1000))
+return {1, math.floor((now - allow_at) / interval + 1e-9), tostring(new_tat - now), "0"}
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Limits shared by gateway workers, for a redis.asyncio.Redis compatible client.
+    The check is one atomic script call.
+    """
+
+    def __init__(self, redis: Any, prefix: str = "fastapi_gateway:rate_limit:"):
+        self.redis = redis
+        self.prefix = prefix
+
+    async def hit(self, key, interval, burst):
+        allowed, remaining, reset_after, retry_after = await self.redis.eval(
+            GCRA_SCRIPT, 1, self.prefix + key, time.time(), interval, burst
+        )
+        return RateLimitResult(
+            bool(allowed), int(remaining), float(reset_after), float(retry_after)
+        )
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else ""
+
+
+class RateLimit:
+    """
+    Allows rate requests per period seconds for every key, with bursts up to burst requests.
+
+    :param rate: requests per period
+    :param period: seconds
+    :param burst: requests allowed at once, rate by default
+    :param header: request header used as the key (like "x-api-key"), the client ip by default
+    :param key: function returning the key of a request, instead of the header
+    :param dependency: FastAPI dependency whose result is the key (route limits only)
+    :param name: prefix of the keys, limits with a shared backend need different names
+    :param backend: where buckets are stored, MemoryRateLimitBackend by default
+    :param status_code: response status of rejected requests
+    """
+
+    def __init__(
+        self,
+        rate: int,
+        period: float = 1.0,
+        burst: Optional[int] = None,
+        header: Optional[str] = None,
+        key: Optional[KeyFunction] = None,
+        dependency: Optional[Callable[..., Any]] = None,
+        name: str = "default",
+        backend: Optional[RateLimitBackend] = None,
+        status_code: int = status.HTTP_429_TOO_MANY_REQUESTS,
+    ):
+        self.rate = rate
+        self.period = period
+        self.burst = burst or rate
+        self.interval = period / rate
+        self.header = header.lower() if header else None
+        self._header_bytes = self.header.encode("latin-1") if self.header else None
+        self.key = key
+        self.dependency = dependency
+        self.name = name
+        self.backend = backend or MemoryRateLimitBackend()
+        self.status_code = status_code
+        self._policy = f"{rate};w={period:g}".encode()
+        self._limit = str(self.burst).encode()
+
+    def get_key(self, request: Request) -> str:
+        if self.key:
+            return self.key(request)
+        if self.header:
+            return request.headers.get(self.header, "")
+        return client_ip(request)
+
+    def get_scope_key(self, scope: Scope) -> str:
+        """get_key for an ASGI scope, without creating a Request."""
+        if self.key:
+            return self.key(Request(scope))
+        if self.header:
+            for name, value in scope["headers"]:
+                if name == self._header_bytes:
+                    return value.decode("latin-1")
+            return ""
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    async def hit(self, key: Any) -> RateLimitResult:
+        return await self.backend.hit(
+            key=f"{self.name}:{key}", interval=self.interval, burst=self.burst
+        )
+
+    def raw_headers(self, result: RateLimitResult) -> List[Tuple[bytes, bytes]]:
+        headers = [
+            (b"ratelimit-limit", self._limit),
+            (b"ratelimit-remaining", str(result.remaining).encode()),
+            (b"ratelimit-reset", str(math.ceil(result.reset_after)).encode()),
+            (b"ratelimit-policy", self._policy),
+        ]
+        if not result.allowed:
+            headers.append((b"retry-after", str(math.ceil(result.retry_after)).encode()))
+        return headers
+
+    def rejection(self, result: RateLimitResult) -> HTTPException:
+        return HTTPException(
+            status_code=self.status_code,
+            detail="Too many requests.",
+            headers={
+                key.decode(): value.decode() for key, value in self.raw_headers(result)
+            },
+        )
+
+    async def check(self, key: Any, response: Response):
+        result = await self.hit(key)
+        if not result.allowed:
+            raise self.rejection(result)
+        response.raw_headers.extend(self.raw_headers(result))
+
+    def create_dependency(self) -> Callable[..., Any]:
+        """FastAPI dependency checking the limit, route(rate_limit=...) adds it."""
+        if self.dependency:
+
+            async def check_rate_limit(
+                response: Response, key: Any = Depends(self.dependency)
+            ):
+                await self.check(key=key, response=response)
+
+        else:
+
+            async def check_rate_limit(request: Request, response: Response):
+                await self.check(key=self.get_key(request), response=response)
+
+        return check_rate_limit
+
+
+class RateLimitMiddleware:
+    """
+    Gateway-wide limit, setup_gateway(app, rate_limit=...) adds it.
+    """
+
+    def __init__(self, app: ASGIApp, rate_limit: RateLimit):
+        if rate_limit.dependency:
+            raise ValueError("A gateway-wide rate limit can not use a dependency key.")
+        self.app = app
+        self.rate_limit = rate_limit
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        result = await self.rate_limit.hit(self.rate_limit.get_scope_key(scope))
+        headers = self.rate_limit.raw_headers(result)
+        if not result.allowed:
+            response = JSONResponse(
+                {"detail": "Too many requests."}, status_code=self.rate_limit.status_code
+            )
+            response.raw_headers.extend(headers)
+            await response(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                raw = list(message.get("headers", ()))
+                # Headers of a route limit are kept, they describe the route bucket.
+                if not any(name == b"ratelimit-limit" for name, _ in raw):
+                    message["headers"] = raw + headers
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,94 @@
+import random
+import time
+from typing import Any, Optional, Sequence, Tuple, Type
+
+import aiohttp
+from aiohttp import FormData
+
+from .breaker import RollingWindow
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE")
+
+
+class RetryBudget:
+    """
+    Limits retries to a share of the requests, so retries can not multiply
+    the load on a microservice that is already failing.
+
+    :param ratio: retries allowed per request in the window (0.1 - at most 10% extra load)
+    :param min_retries_per_second: retries always allowed, for services with little traffic
+    :param window: seconds the requests and retries are counted over
+    """
+
+    def __init__(
+        self,
+        ratio: float = 0.1,
+        min_retries_per_second: float = 1.0,
+        window: float = 10.0,
+    ):
+        self.ratio = ratio
+        self.min_retries_per_second = min_retries_per_second
+        self.window = window
+        # Calls are requests and retries, "failures" of the window count retries.
+        self._calls = RollingWindow(window=window, buckets=10)
+
+    def record_request(self):
+        self._calls.add(now=time.monotonic(), failure=False, slow=False)
+
+    def withdraw(self) -> bool:
+        now = time.monotonic()
+        calls, retries, _ = self._calls.totals(now=now)
+        allowed = self.ratio * (calls - retries) + self.min_retries_per_second * self.window
+        if retries >= allowed:
+            return False
+        self._calls.add(now=now, failure=True, slow=False)
+        return True
+
+
+default_budget = RetryBudget()
+
+
+class RetryPolicy:
+    """
+    Repeats failed calls to the microservice, on another instance of a pool if there is one.
+
+    :param attempts: max calls per request, the first one included
+    :param statuses: microservice response statuses that are retried
+    :param exceptions: call errors that are retried
+    :param methods: retried request methods, idempotent ones by default
+    :param backoff: seconds before the first retry, doubled for every next one
+    :param max_backoff: upper limit of the delay, the delay is a random value up to it
+    :param budget: retries allowed across routes, the shared default budget allows 10% extra load
+    """
+
+    def __init__(
+        self,
+        attempts: int = 3,
+        statuses: Sequence[int] = (502, 503, 504),
+        exceptions: Sequence[Type[BaseException]] = (aiohttp.ClientConnectionError,),
+        methods: Sequence[str] = IDEMPOTENT_METHODS,
+        backoff: float = 0.05,
+        max_backoff: float = 1.0,
+        budget: Optional[RetryBudget] = None,
+    ):
+        self.attempts = attempts
+        self.statuses = frozenset(statuses)
+        self.exceptions: Tuple[Type[BaseException], ...] = tuple(exceptions)
+        self.methods = frozenset(method.upper() for method in methods)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budget = budget or default_budget
+
+    def is_retryable_request(self, method: str, data: Any) -> bool:
+        # aiohttp FormData can be sent only once, uploaded files are streamed.
+        return method.upper() in self.methods and not isinstance(data, FormData)
+
+    def is_retryable_status(self, status_code: int) -> bool:
+        return status_code in self.statuses
+
+    def can_retry(self, attempt: int) -> bool:
+        return attempt < self.attempts and self.budget.withdraw()
+
+    def delay(self, attempt: int) -> float:
+        """Full jitter: a random delay up to the exponential backoff."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
@@ -0,0 +1,88 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Mapping, Optional, Sequence, Tuple
+
+from multidict import CIMultiDict
+
+from .utils.request import create_request_key
+
+UpstreamResult = Tuple[bytes, int, CIMultiDict]
+
+
+def _consume_exception(task: asyncio.Future):
+    # Nobody may be waiting anymore, do not log "exception was never retrieved".
+    if not task.cancelled():
+        task.exception()
+
+
+class SingleFlight:
+    """
+    Concurrent calls with the same key share one execution of the function.
+
+    The function runs in its own task, so a caller that gets cancelled
+    (client disconnected) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(function())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key=key, task=done))
+            task.add_done_callback(_consume_exception)
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+
+class CoalescePolicy:
+    """
+    Identical concurrent requests of the route share one call to the microservice,
+    every request gets its own copy of the response.
+
+    :param vary: request headers that must be equal to share a call, by default
+        requests of different users (authorization, cookie) are never merged
+    :param methods: coalesced request methods
+    """
+
+    def __init__(
+        self,
+        vary: Sequence[str] = ("authorization", "cookie"),
+        methods: Sequence[str] = ("GET", "HEAD"),
+    ):
+        self.vary = tuple(header.lower() for header in vary)
+        self.methods = frozenset(method.upper() for method in methods)
+        self.single_flight = SingleFlight()
+
+    def is_coalesced_request(self, method: str) -> bool:
+        return method.upper() in self.methods
+
+    def create_key(
+        self,
+        method: str,
+        service: str,
+        path: str,
+        query: Optional[Mapping[str, Any]],
+        headers: Mapping[str, str],
+    ) -> str:
+        return create_request_key(
+            method=method,
+            service=service,
+            path=path,
+            query=query,
+            headers=headers,
+            vary=self.vary,
+        )
+
+    async def fetch(
+        self, key: str, fetch: Callable[[], Awaitable[UpstreamResult]]
+    ) -> UpstreamResult:
+        body, status_code, headers = await self.single_flight.do(key, fetch)
+        return body, status_code, CIMultiDict(headers)
@@ -0,0 +1,110 @@
+import asyncio
+import time
+from typing import Mapping, Optional, Union
+
+import aiohttp
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+# Monotonic time the request reached the app, set by RequestArrivalMiddleware.
+ARRIVAL_SCOPE_KEY = "fastapi_gateway.arrived_at"
+
+
+class Timeouts:
+    """
+    Time budgets of one call to the microservice, None - no limit.
+
+    :param total: seconds for the whole call, in stream mode until the response headers
+    :param connect: seconds to get a connection (pool wait and connecting included)
+    :param ttfb: seconds from starting the call to the response headers
+        (getting a connection and sending the request included)
+    :param read: max seconds between two reads of the response (a stalled body is abandoned,
+        a slow but streaming one is not)
+    :param deadline_header: request header with the milliseconds the client is going to wait,
+        the gateway never waits longer and forwards the remaining milliseconds in it
+    """
+
+    def __init__(
+        self,
+        total: Optional[float] = 60,
+        connect: Optional[float] = None,
+        ttfb: Optional[float] = None,
+        read: Optional[float] = None,
+        deadline_header: Optional[str] = None,
+    ):
+        self.total = total
+        self.connect = connect
+        self.ttfb = ttfb
+        self.read = read
+        self.deadline_header = deadline_header
+        # total is enforced around the call, it must not limit a streamed body.
+        self.client_timeout = aiohttp.ClientTimeout(
+            total=None, connect=connect, sock_read=read
+        )
+
+    def __repr__(self):
+        return (
+            f"Timeouts(total={self.total}, connect={self.connect}, "
+            f"ttfb={self.ttfb}, read={self.read})"
+        )
+
+    def read_deadline(self, headers: Mapping[str, str], started: float) -> Optional[float]:
+        """
+        Monotonic time the client stops waiting, from the deadline header.
+
+        :param started: when the request arrived, see request_arrival()
+        """
+        if not self.deadline_header:
+            return None
+        value = headers.get(self.deadline_header)
+        if value is None or not value.isdigit():
+            return None
+        return started + int(value) / 1000
+
+    def until(self, deadline: Optional[float]) -> "Timeouts":
+        """
+        Timeouts of a call that has to finish by the deadline.
+        Raises asyncio.TimeoutError when there is no time left.
+        """
+        if deadline is None:
+            return self
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError()
+        if self.total is not None and self.total <= remaining:
+            return self
+        return Timeouts(
+            total=remaining,
+            connect=self.connect,
+            ttfb=self.ttfb,
+            read=self.read,
+            deadline_header=self.deadline_header,
+        )
+
+
+TimeoutValue = Union[float, Timeouts, None]
+
+
+def create_timeouts(timeout: TimeoutValue) -> Timeouts:
+    if isinstance(timeout, Timeouts):
+        return timeout
+    return Timeouts(total=timeout)
+
+
+class RequestArrivalMiddleware:
+    """
+    Notes when a request reaches the app, setup_gateway(app) adds it.
+    Deadlines of the client count from then, not from the start of the route.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "http":
+            scope[ARRIVAL_SCOPE_KEY] = time.monotonic()
+        await self.app(scope, receive, send)
+
+
+def request_arrival(scope: Scope) -> float:
+    """When the request reached the app, now for apps without RequestArrivalMiddleware."""
+    return scope.get(ARRIVAL_SCOPE_KEY) or time.monotonic()
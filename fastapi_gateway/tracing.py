@@ -0,0 +1,127 @@
+from contextlib import nullcontext
+from types import SimpleNamespace
+from typing import Any, ContextManager, Optional
+
+import aiohttp
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.trace import SpanKind
+except ImportError:  # pragma: no cover
+    trace = None
+
+NO_SPAN = nullcontext()
+
+
+async def _on_connection_create_start(session, context: SimpleNamespace, params):
+    context.connect_span = context.tracing.tracer.start_span("connect")
+
+
+async def _on_connection_create_end(session, context: SimpleNamespace, params):
+    context.connect_span.end()
+    context.connect_span = None
+
+
+async def _on_request_headers_sent(session, context: SimpleNamespace, params):
+    context.wait_span = context.tracing.tracer.start_span("upstream wait")
+
+
+async def _on_request_end(session, context: SimpleNamespace, params):
+    # Called when the response headers are received.
+    wait_span = getattr(context, "wait_span", None)
+    if wait_span is not None:
+        wait_span.end()
+        context.wait_span = None
+
+
+async def _on_request_exception(session, context: SimpleNamespace, params):
+    for name in ("connect_span", "wait_span"):
+        span = getattr(context, name, None)
+        if span is not None:
+            span.record_exception(params.exception)
+            span.end()
+            setattr(context, name, None)
+
+
+class GatewayTracing:
+    """
+    OpenTelemetry spans of the proxied requests, requires opentelemetry-api
+    (pip install fastapi_gateway[opentelemetry]).
+
+    Every request gets a span with children for the phases of the gateway (form parse,
+    unzip, headers, response decode) and one client span per call to the microservice,
+    with connect and upstream wait children. The context of the call is sent to the
+    microservice in the W3C traceparent header.
+
+    :param tracer_provider: the global tracer provider by default
+    :param propagator: the global propagator (W3C trace context) by default
+    """
+
+    def __init__(self, tracer_provider: Any = None, propagator: Any = None):
+        if trace is None:
+            raise RuntimeError("GatewayTracing requires opentelemetry-api to be installed.")
+        self.tracer = trace.get_tracer("fastapi_gateway", tracer_provider=tracer_provider)
+        self.propagator = propagator
+        self.trace_config = aiohttp.TraceConfig(
+            trace_config_ctx_factory=self.create_trace_context
+        )
+        self.trace_config.on_connection_create_start.append(_on_connection_create_start)
+        self.trace_config.on_connection_create_end.append(_on_connection_create_end)
+        self.trace_config.on_request_end.append(_on_request_end)
+        self.trace_config.on_request_exception.append(_on_request_exception)
+        # aiohttp < 3.8 has no hook between sending the request and waiting for the response.
+        if hasattr(self.trace_config, "on_request_headers_sent"):
+            self.trace_config.on_request_headers_sent.append(_on_request_headers_sent)
+
+    def create_trace_context(self, trace_request_ctx: Any = None) -> SimpleNamespace:
+        return SimpleNamespace(trace_request_ctx=trace_request_ctx, tracing=self)
+
+    def request_span(self, name: str, headers: Headers) -> ContextManager[Any]:
+        """
+        Span of the whole request, a child of the current span (ASGI instrumentation),
+        otherwise of the trace context sent by the client.
+        """
+        context = None
+        if not trace.get_current_span().get_span_context().is_valid:
+            context = self.get_propagator().extract(carrier=headers)
+        kind = SpanKind.INTERNAL if context is None else SpanKind.SERVER
+        return self.tracer.start_as_current_span(name, context=context, kind=kind)
+
+    def is_recording(self) -> bool:
+        """False in an unsampled request, its spans would never be exported."""
+        return trace.get_current_span().is_recording()
+
+    def span(self, name: str) -> ContextManager[Any]:
+        return self.tracer.start_as_current_span(name)
+
+    def call_span(self, method: str, url: str) -> ContextManager[Any]:
+        return self.tracer.start_as_current_span(
+            f"{method.upper()} upstream",
+            kind=SpanKind.CLIENT,
+            attributes={"http.request.method": method.upper(), "url.full": url},
+        )
+
+    def inject(self, headers: MutableHeaders):
+        """Writes the current trace context (traceparent, tracestate) into the headers."""
+        self.get_propagator().inject(carrier=headers)
+
+    def get_propagator(self) -> Any:
+        return self.propagator or propagate.get_global_textmap()
+
+
+def phase_span(tracing: Optional[GatewayTracing], name: str) -> ContextManager[Any]:
+    """A span of a gateway phase, or a no-op when tracing is off."""
+    if tracing is None:
+        return NO_SPAN
+    return tracing.span(name)
+
+
+def call_span(tracing: Optional[GatewayTracing], method: str, url: str) -> ContextManager[Any]:
+    """
+    The client span of a call to the microservice, or a no-op when tracing is off
+    or the request is not sampled (its trace context is still propagated).
+    """
+    if tracing is None or not tracing.is_recording():
+        return NO_SPAN
+    return tracing.call_span(method=method, url=url)
@@ -0,0 +1,38 @@
+from typing import Any, Callable, Sequence
+from urllib.parse import unquote
+
+ResponseTransform = Callable[[Any], Any]
+
+
+def _unquote_path(value: Any, path: Sequence[str]) -> Any:
+    if not path:
+        return unquote(value) if isinstance(value, str) else value
+
+    key, rest = path[0], path[1:]
+    if key == "*":
+        if isinstance(value, list):
+            for index, item in enumerate(value):
+                value[index] = _unquote_path(item, rest)
+        elif isinstance(value, dict):
+            for item_key, item in value.items():
+                value[item_key] = _unquote_path(item, rest)
+    elif isinstance(value, dict) and key in value:
+        value[key] = _unquote_path(value[key], rest)
+    return value
+
+
+def unquote_fields(*fields: str) -> ResponseTransform:
+    """
+    Response transform decoding %xx escapes of the given string fields only.
+
+    :param fields: dotted paths in the response JSON, "*" matches every item
+        of a list or object (like "name" or "items.*.title")
+    """
+    paths = [tuple(field.split(".")) for field in fields]
+
+    def transform(data: Any) -> Any:
+        for path in paths:
+            data = _unquote_path(data, path)
+        return data
+
+    return transform
@@ -0,0 +1,693 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import urlencode, urlsplit
+
+import aiohttp
+import async_timeout
+from aiohttp import BytesPayload, ClientConnectionError, Payload
+from multidict import CIMultiDict
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message
+
+from .exceptions import UpstreamConnectError
+from .network import make_request, open_stream_request
+from .timeouts import TimeoutValue, Timeouts, create_timeouts
+from .utils.body import JSONBytesPayload
+from .utils.form import CustomFormData
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+logger = logging.getLogger("fastapi_gateway.transports")
+
+RequestData = Union[CustomFormData, BytesPayload, None]
+
+
+class Transport(ABC):
+    """
+    How calls reach the instances of a service, route(transport=...) or
+    UpstreamPool(transport=...). Without a transport the pooled aiohttp sessions
+    of the GatewayClient are used.
+    """
+
+    @abstractmethod
+    async def make_request(
+        self,
+        url: str,
+        method: str,
+        headers: Union[Headers, dict],
+        query: Optional[dict] = None,
+        data: RequestData = None,
+        timeout: TimeoutValue = 60,
+        trace_request_ctx: Any = None,
+    ) -> Tuple[bytes, int, Mapping[str, str]]:
+        """Returns the body, the status and the headers of the response."""
+
+    @abstractmethod
+    async def open_stream_request(
+        self,
+        url: str,
+        method: str,
+        headers: Union[Headers, dict],
+        query: Optional[dict] = None,
+        data: RequestData = None,
+        timeout: TimeoutValue = 60,
+        trace_request_ctx: Any = None,
+    ) -> Any:
+        """
+        Returns once the response headers are received, the response is used like
+        aiohttp.ClientResponse: status, headers, content_length, content.iter_chunked(size)
+        and release().
+        """
+
+    async def close(self):
+        """Closes the pooled connections, GatewayClient.shutdown calls it."""
+
+
+async def iterate_payload(payload: Payload) -> AsyncIterator[bytes]:
+    """Chunks an aiohttp payload (a streamed multipart form too) without buffering it."""
+    chunks: asyncio.Queue = asyncio.Queue(maxsize=1)
+    done = object()
+
+    class QueueWriter:
+        async def write(self, chunk: bytes):
+            await chunks.put(bytes(chunk))
+
+    async def write():
+        try:
+            await payload.write(QueueWriter())
+        finally:
+            await chunks.put(done)
+
+    task = asyncio.ensure_future(write())
+    try:
+        while True:
+            chunk = await chunks.get()
+            if chunk is done:
+                break
+            yield chunk
+        await task
+    finally:
+        task.cancel()
+
+
+def cookieless_jar(http2: bool = False) -> Any:
+    """
+    Sessions and clients are shared between end users, so cookies must never stick.
+    The jar of an aiohttp session, or of an httpx client for http2.
+    """
+    if http2:
+        return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+    return aiohttp.DummyCookieJar()
+
+
+def close_stale(
+    loop: asyncio.AbstractEventLoop, pooled: Any, close: Callable[[], Awaitable[Any]]
+):
+    """
+    Closes a session or client pooled on another event loop. It is closed on its loop when
+    that one still runs (in another thread), its connections can not be closed from here.
+    A session of a stopped loop is detached from its connector and logged.
+    """
+    if loop.is_running():
+        asyncio.run_coroutine_threadsafe(close(), loop)
+        return
+    if isinstance(pooled, aiohttp.ClientSession):
+        pooled.detach()
+    logger.warning("Dropped %r of an event loop that is no longer running", pooled)
+
+
+def is_upstream_metrics(trace_request_ctx: Any) -> bool:
+    # The UpstreamMetrics of the call when metrics are on, metrics.py imports this module.
+    return hasattr(trace_request_ctx, "ttfb")
+
+
+@contextmanager
+def translate_errors() -> Iterator[None]:
+    """httpx errors as the aiohttp ones the gateway handles (503, 504, retries)."""
+    try:
+        yield
+    except httpx.TimeoutException as error:
+        raise asyncio.TimeoutError() from error
+    except httpx.ConnectError as error:
+        raise UpstreamConnectError(str(error)) from error
+    except httpx.TransportError as error:
+        raise ClientConnectionError(str(error)) from error
+
+
+class HTTPXStreamResponse:
+    """An httpx streamed response with the aiohttp.ClientResponse interface the gateway uses."""
+
+    def __init__(self, response: "httpx.Response"):
+        self.response = response
+        self.status = response.status_code
+        self.headers = response.headers
+        content_length = response.headers.get("content-length")
+        self.content_length = int(content_length) if content_length else None
+
+    @property
+    def content(self) -> "HTTPXStreamResponse":
+        return self
+
+    def iter_chunked(self, chunk_size: int) -> AsyncIterator[bytes]:
+        return self.response.aiter_bytes(chunk_size=chunk_size)
+
+    def release(self):
+        if not self.response.is_closed:
+            asyncio.ensure_future(self.response.aclose())
+
+
+class HTTPXCallTrace:
+    """
+    httpcore trace events of one call as the connect metric the aiohttp trace config
+    of GatewayMetrics records: from opening the connection to sending the first request.
+    """
+
+    __slots__ = ("upstream_metrics", "connect_started")
+
+    def __init__(self, upstream_metrics: Any):
+        self.upstream_metrics = upstream_metrics
+        self.connect_started: Optional[float] = None
+
+    async def __call__(self, event_name: str, info: Dict[str, Any]):
+        if event_name in (
+            "connection.connect_tcp.started",
+            "connection.connect_unix_socket.started",
+        ):
+            self.connect_started = time.perf_counter()
+        elif (
+            self.connect_started is not None
+            and event_name.endswith(".send_request_headers.started")
+        ):
+            self.upstream_metrics.connect.observe(time.perf_counter() - self.connect_started)
+            self.connect_started = None
+
+
+class HTTP2Transport(Transport):
+    """
+    HTTP/2 calls multiplexed over a few connections per instance, requires httpx and h2
+    (pip install fastapi_gateway[http2]).
+
+    :param h2c: cleartext HTTP/2 with prior knowledge for http:// services,
+        https:// services negotiate HTTP/2 by ALPN either way
+    :param max_connections: connections per instance, each one carries many concurrent streams
+    :param keepalive_timeout: seconds an idle connection is kept
+    :param verify: TLS verification (False, a path to CA bundle or an ssl.SSLContext)
+    """
+
+    def __init__(
+        self,
+        h2c: bool = False,
+        max_connections: int = 10,
+        keepalive_timeout: float = 15,
+        verify: Any = True,
+    ):
+        if httpx is None:
+            raise RuntimeError("HTTP2Transport requires httpx[http2] to be installed.")
+        self.h2c = h2c
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.verify = verify
+        self._clients: Dict[asyncio.AbstractEventLoop, "httpx.AsyncClient"] = {}
+
+    def __repr__(self):
+        return f"HTTP2Transport(h2c={self.h2c}, max_connections={self.max_connections})"
+
+    def client(self) -> "httpx.AsyncClient":
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None or client.is_closed:
+            client = self._clients[loop] = httpx.AsyncClient(
+                http1=not self.h2c,
+                http2=True,
+                verify=self.verify,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_timeout,
+                ),
+                cookies=cookieless_jar(http2=True),
+                follow_redirects=False,
+                trust_env=False,
+            )
+        return client
+
+    def build_request(
+        self,
+        url: str,
+        method: str,
+        headers: Union[Headers, dict],
+        query: Optional[dict],
+        data: RequestData,
+        timeouts: Timeouts,
+        trace_request_ctx: Any = None,
+    ) -> "httpx.Request":
+        headers = list(headers.items())
+        content = None
+        if data is not None:
+            payload = data if isinstance(data, Payload) else data()
+            headers.append(("content-type", payload.content_type))
+            if isinstance(payload, JSONBytesPayload):
+                content = payload.body
+            else:
+                content = iterate_payload(payload)
+        extensions = {}
+        if is_upstream_metrics(trace_request_ctx):
+            extensions["trace"] = HTTPXCallTrace(upstream_metrics=trace_request_ctx)
+        return self.client().build_request(
+            method=method.upper(),
+            url=url,
+            params=query,
+            headers=headers,
+            content=content,
+            timeout=httpx.Timeout(
+                connect=timeouts.connect,
+                read=timeouts.read,
+                write=None,
+                pool=timeouts.connect,
+            ),
+            extensions=extensions,
+        )
+
+    async def send_request(
+        self, request: "httpx.Request", timeouts: Timeouts, trace_request_ctx: Any = None
+    ):
+        # Returns as soon as the response headers are received.
+        started = time.perf_counter()
+        async with async_timeout.timeout(delay=timeouts.ttfb):
+            with translate_errors():
+                response = await self.client().send(request, stream=True)
+        if is_upstream_metrics(trace_request_ctx):
+            trace_request_ctx.ttfb.observe(time.perf_counter() - started)
+        return response
+
+    async def make_request(
+        self,
+        url,
+        method,
+        headers,
+        query=None,
+        data=None,
+        timeout=60,
+        trace_request_ctx=None,
+    ):
+        timeouts = create_timeouts(timeout)
+        request = self.build_request(
+            url, method, headers, query, data, timeouts, trace_request_ctx
+        )
+        async with async_timeout.timeout(delay=timeouts.total):
+            response = await self.send_request(request, timeouts, trace_request_ctx)
+            try:
+                with translate_errors():
+                    body = await response.aread()
+            finally:
+                await response.aclose()
+        return body, response.status_code, response.headers
+
+    async def open_stream_request(
+        self,
+        url,
+        method,
+        headers,
+        query=None,
+        data=None,
+        timeout=60,
+        trace_request_ctx=None,
+    ):
+        timeouts = create_timeouts(timeout)
+        request = self.build_request(
+            url, method, headers, query, data, timeouts, trace_request_ctx
+        )
+        async with async_timeout.timeout(delay=timeouts.total):
+            response = await self.send_request(request, timeouts, trace_request_ctx)
+        return HTTPXStreamResponse(response)
+
+    async def close(self):
+        clients, self._clients = self._clients, {}
+        loop = asyncio.get_running_loop()
+        for client_loop, client in clients.items():
+            if client_loop is loop:
+                await client.aclose()
+            elif not client.is_closed:
+                close_stale(client_loop, client, client.aclose)
+
+
+_registered_transports: List[Transport] = []
+
+
+def register_transport(transport: Transport) -> Transport:
+    """Transports of routes, GatewayClient.shutdown closes them."""
+    if transport not in _registered_transports:
+        _registered_transports.append(transport)
+    return transport
+
+
+def registered_transports() -> List[Transport]:
+    return list(_registered_transports)
+
+
+class AiohttpTransport(Transport):
+    """
+    Pooled aiohttp session of its own, for services that need other pool settings
+    than the ones of the GatewayClient.
+
+    :param limit: max simultaneous connections (0 - no limit)
+    :param keepalive_timeout: seconds an idle connection is kept in the pool
+    :param ttl_dns_cache: seconds resolved addresses are cached (None - forever)
+    :param ssl_context: TLS context for https services (False disables verification)
+    :param trace_configs: aiohttp trace configs of the session
+    """
+
+    def __init__(
+        self,
+        limit: int = 100,
+        keepalive_timeout: float = 15,
+        ttl_dns_cache: Optional[int] = 10,
+        ssl_context: Any = None,
+        trace_configs: Optional[List[aiohttp.TraceConfig]] = None,
+    ):
+        self.limit = limit
+        self.keepalive_timeout = keepalive_timeout
+        self.ttl_dns_cache = ttl_dns_cache
+        self.ssl_context = ssl_context
+        self.trace_configs = trace_configs
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}(limit={self.limit})"
+
+    def create_connector(self) -> aiohttp.BaseConnector:
+        return aiohttp.TCPConnector(
+            limit=self.limit,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.ttl_dns_cache,
+            ssl=self.ssl_context,
+        )
+
+    def session(self) -> aiohttp.ClientSession:
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = self._sessions[loop] = aiohttp.ClientSession(
+                connector=self.create_connector(),
+                cookie_jar=cookieless_jar(),
+                trace_configs=self.trace_configs,
+            )
+        return session
+
+    async def make_request(self, url, method, headers, **kwargs):
+        return await make_request(
+            session=self.session(), url=url, method=method, headers=headers, **kwargs
+        )
+
+    async def open_stream_request(self, url, method, headers, **kwargs):
+        return await open_stream_request(
+            session=self.session(), url=url, method=method, headers=headers, **kwargs
+        )
+
+    async def close(self):
+        sessions, self._sessions = self._sessions, {}
+        loop = asyncio.get_running_loop()
+        for session_loop, session in sessions.items():
+            if session_loop is loop:
+                await session.close()
+            elif not session.closed:
+                close_stale(session_loop, session, session.close)
+
+
+class UnixSocketTransport(AiohttpTransport):
+    """
+    Pooled HTTP/1.1 connections over a Unix domain socket, for sidecars on the same host.
+    The host of the service url only fills the Host header.
+
+    :param path: path of the socket
+    """
+
+    def __init__(self, path: str, limit: int = 100, keepalive_timeout: float = 15, **kwargs):
+        super().__init__(limit=limit, keepalive_timeout=keepalive_timeout, **kwargs)
+        self.path = path
+
+    def __repr__(self):
+        return f"UnixSocketTransport(path={self.path!r}, limit={self.limit})"
+
+    def create_connector(self) -> aiohttp.BaseConnector:
+        return aiohttp.UnixConnector(
+            path=self.path, limit=self.limit, keepalive_timeout=self.keepalive_timeout
+        )
+
+
+class ASGIResponse:
+    """
+    A response of an in-process ASGI app with the aiohttp.ClientResponse interface
+    the gateway uses, the body is received while the app sends it.
+    """
+
+    def __init__(
+        self,
+        status: int,
+        headers: CIMultiDict,
+        chunks: "asyncio.Queue[Any]",
+        task: "asyncio.Future[None]",
+    ):
+        self.status = status
+        self.headers = headers
+        content_length = headers.get("content-length")
+        self.content_length = int(content_length) if content_length else None
+        self._chunks = chunks
+        self._task = task
+
+    @property
+    def content(self) -> "ASGIResponse":
+        return self
+
+    async def iter_chunked(self, chunk_size: int) -> AsyncIterator[bytes]:
+        # Chunks are passed as the app sends them.
+        while True:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                return
+            if isinstance(chunk, BaseException):
+                raise ClientConnectionError("The ASGI app failed") from chunk
+            yield chunk
+
+    def release(self):
+        if not self._task.done():
+            self._task.cancel()
+
+
+class ASGITransport(Transport):
+    """
+    Calls an ASGI app (like a FastAPI microservice) in the gateway process, without sockets.
+    The lifespan of the app is not run, start it together with the gateway if it needs it.
+
+    :param app: the ASGI application
+    :param client: client address the app sees
+    :param stream_buffer: body chunks buffered ahead of a streaming client
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        client: Tuple[str, int] = ("127.0.0.1", 0),
+        stream_buffer: int = 4,
+    ):
+        self.app = app
+        self.client = client
+        self.stream_buffer = stream_buffer
+
+    def __repr__(self):
+        return f"ASGITransport(app={self.app!r})"
+
+    def create_scope(
+        self,
+        url: str,
+        method: str,
+        headers: Union[Headers, dict],
+        query: Optional[dict],
+        payload: Optional[Payload],
+    ) -> Dict[str, Any]:
+        parts = urlsplit(url)
+        raw_headers = [
+            (key.lower().encode("latin-1"), value.encode("latin-1"))
+            for key, value in headers.items()
+        ]
+        raw_headers.append((b"host", parts.netloc.encode("latin-1")))
+        if payload is not None:
+            raw_headers.append((b"content-type", payload.content_type.encode("latin-1")))
+            if isinstance(payload, BytesPayload):
+                raw_headers.append((b"content-length", str(payload.size).encode()))
+        query_string = parts.query
+        if query:
+            query_string = "&".join(
+                part for part in (query_string, urlencode(query, doseq=True)) if part
+            )
+        return {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method.upper(),
+            "scheme": parts.scheme,
+            "path": parts.path or "/",
+            "raw_path": (parts.path or "/").encode(),
+            "query_string": query_string.encode("latin-1"),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": self.client,
+            "server": (parts.hostname, parts.port),
+        }
+
+    async def call(
+        self,
+        url: str,
+        method: str,
+        headers: Union[Headers, dict],
+        query: Optional[dict],
+        data: RequestData,
+        stream: bool,
+    ) -> Tuple[int, CIMultiDict, "asyncio.Queue[Any]", "asyncio.Future[None]"]:
+        """Runs the app until it starts the response."""
+        payload = None
+        if data is not None:
+            payload = data if isinstance(data, Payload) else data()
+        scope = self.create_scope(url, method, headers, query, payload)
+        if payload is None:
+            body: Any = iter((b"",))
+        elif isinstance(payload, JSONBytesPayload):
+            body = iter((payload.body,))
+        else:
+            body = iterate_payload(payload)
+
+        loop = asyncio.get_running_loop()
+        started = loop.create_future()
+        response_complete = asyncio.Event()
+        chunks: asyncio.Queue = asyncio.Queue(maxsize=self.stream_buffer if stream else 0)
+
+        async def receive() -> Message:
+            if body is None:
+                # Apps wait for a disconnect while they stream.
+                await response_complete.wait()
+                return {"type": "http.disconnect"}
+            return await read_body()
+
+        async def read_body() -> Message:
+            nonlocal body
+            try:
+                if isinstance(body, Iterator):
+                    chunk = next(body)
+                else:
+                    chunk = await body.__anext__()
+            except (StopIteration, StopAsyncIteration):
+                body = None
+                return {"type": "http.request", "body": b"", "more_body": False}
+            return {"type": "http.request", "body": bytes(chunk), "more_body": True}
+
+        async def send(message: Message):
+            if message["type"] == "http.response.start":
+                response_headers = CIMultiDict(
+                    (key.decode("latin-1"), value.decode("latin-1"))
+                    for key, value in message.get("headers", ())
+                )
+                started.set_result((message["status"], response_headers))
+            elif message["type"] == "http.response.body":
+                chunk = message.get("body", b"")
+                if chunk:
+                    await chunks.put(chunk)
+                if not message.get("more_body", False):
+                    response_complete.set()
+                    await chunks.put(None)
+
+        async def run():
+            try:
+                await self.app(scope, receive, send)
+            except Exception as error:
+                if not started.done():
+                    # What a server does for an app failing before its response.
+                    logger.exception("ASGI app %r failed", self.app)
+                    started.set_result((500, CIMultiDict({"content-type": "text/plain"})))
+                    await chunks.put(b"Internal Server Error")
+                    await chunks.put(None)
+                elif response_complete.is_set():
+                    # Like Starlette's error middleware after its 500, the response is sent.
+                    logger.exception("ASGI app %r failed", self.app)
+                else:
+                    await chunks.put(error)
+            finally:
+                response_complete.set()
+                if not started.done():
+                    started.set_exception(
+                        ClientConnectionError("The ASGI app returned without a response")
+                    )
+
+        task = asyncio.ensure_future(run())
+        try:
+            status, response_headers = await started
+        except BaseException:
+            task.cancel()
+            raise
+        return status, response_headers, chunks, task
+
+    async def make_request(
+        self,
+        url,
+        method,
+        headers,
+        query=None,
+        data=None,
+        timeout=60,
+        trace_request_ctx=None,
+    ):
+        timeouts = create_timeouts(timeout)
+        task = None
+        try:
+            async with async_timeout.timeout(delay=timeouts.total):
+                status, response_headers, chunks, task = await self.call(
+                    url, method, headers, query, data, stream=False
+                )
+                await task
+        finally:
+            if task is not None and not task.done():
+                task.cancel()
+        body = []
+        while not chunks.empty():
+            chunk = chunks.get_nowait()
+            if isinstance(chunk, BaseException):
+                raise ClientConnectionError("The ASGI app failed") from chunk
+            if chunk is not None:
+                body.append(chunk)
+        return b"".join(body), status, response_headers
+
+    async def open_stream_request(
+        self,
+        url,
+        method,
+        headers,
+        query=None,
+        data=None,
+        timeout=60,
+        trace_request_ctx=None,
+    ):
+        timeouts = create_timeouts(timeout)
+        async with async_timeout.timeout(delay=timeouts.total):
+            status, response_headers, chunks, task = await self.call(
+                url, method, headers, query, data, stream=True
+            )
+        return ASGIResponse(status, response_headers, chunks, task)
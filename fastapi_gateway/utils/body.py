@@ -1,18 +1,153 @@
-import ujson
-from fastapi.routing import serialize_response
-from typing import Dict, List, Optional, Any
-from aiohttp import JsonPayload
+import functools
+import json
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
+
+from aiohttp import BytesPayload
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from fastapi_gateway.codec import JSONCodec, default_codec
+
+JSON_CONTENT_TYPE = "application/json"
+
+ModelSerializer = Callable[[BaseModel], bytes]
+
+
+class JSONBytesPayload(BytesPayload):
+    """A JSON request body, transports that are not aiohttp send its bytes as they are."""
+
+    def __init__(self, body: bytes):
+        super().__init__(body, content_type=JSON_CONTENT_TYPE)
+        self.body = body
+
+
+@functools.lru_cache(maxsize=None)
+def model_serializer(model_class: Type[BaseModel], codec: JSONCodec) -> ModelSerializer:
+    """
+    JSON export of the model class, with the encoder of its config resolved once.
+    A json_dumps set in the model config is kept, otherwise the codec encodes.
+    """
+    if hasattr(model_class, "model_dump_json"):  # pydantic v2
+        return lambda model: model.model_dump_json(by_alias=True).encode()
+
+    config_dumps = model_class.__config__.json_dumps
+    encoder = model_class.__json_encoder__
+    custom_root = model_class.__custom_root_type__
+    if config_dumps is json.dumps:
+        dumps = codec.dumps
+    else:
+
+        def dumps(data: Any, default: Callable[[Any], Any]) -> bytes:
+            return config_dumps(data, default=default).encode()
+
+    def serialize(model: BaseModel) -> bytes:
+        data = model.dict(by_alias=True)
+        if custom_root:
+            data = data["__root__"]
+        return dumps(data, default=encoder)
+
+    return serialize
+
+
+def encode_default(value: Any) -> Any:
+    # Only objects the codec can not encode itself get here.
+    if isinstance(value, BaseModel):
+        return value.dict(by_alias=True)
+    return jsonable_encoder(value)
+
+
+def serialize_body_content(value: Any, codec: JSONCodec = default_codec) -> bytes:
+    if isinstance(value, BaseModel):
+        return model_serializer(type(value), codec)(value)
+    return codec.dumps(value, default=encode_default)
+
+
+def object_keys(value: Any) -> Optional[Iterable[str]]:
+    """Keys of the JSON object a body value is encoded to, None when they are not known."""
+    if isinstance(value, dict):
+        return value.keys() if all(isinstance(key, str) for key in value) else None
+    model_class = type(value)
+    if (
+        isinstance(value, BaseModel)
+        and not hasattr(model_class, "model_dump_json")
+        and not model_class.__custom_root_type__
+    ):
+        fields = model_class.__fields__
+        # Extra attributes of models allowing them are exported too.
+        return [field.alias for field in fields.values()] + [
+            key for key in value.__dict__ if key not in fields
+        ]
+    return None
+
+
+def merge_json_objects(objects: Sequence[bytes]) -> bytes:
+    # The objects must have distinct keys.
+    members = [obj.strip()[1:-1].strip() for obj in objects]
+    return b"{" + b",".join(member for member in members if member) + b"}"
+
+
+def merge_body_params(
+    params: Sequence[Tuple[str, Any]], codec: JSONCodec = default_codec
+) -> bytes:
+    """
+    One JSON object from several body params, like dict.update of their decoded values:
+    on repeated keys the last one wins. A value that is not an object (like a list) is
+    the member named after its param. Objects with known distinct keys are spliced without
+    decoding them, otherwise the parts are decoded, merged and encoded again.
+    """
+    parts = []
+    seen: Set[str] = set()
+    distinct = True
+    for name, value in params:
+        part = serialize_body_content(value, codec=codec)
+        if part.lstrip().startswith(b"{"):
+            keys = object_keys(value)
+        else:
+            part = b"{" + codec.dumps(name) + b":" + part + b"}"
+            keys = (name,)
+        if keys is None or not seen.isdisjoint(keys):
+            distinct = False
+        else:
+            seen.update(keys)
+        parts.append(part)
+    if distinct:
+        return merge_json_objects(parts)
+
+    merged: Dict[str, Any] = {}
+    for part in parts:
+        merged.update(codec.loads(part))
+    return codec.dumps(merged)
 
 
 async def unzip_body_object(
     all_params: Dict[str, Any],
     necessary_params: Optional[List[str]] = None,
-) -> Optional[JsonPayload]:
+    codec: JSONCodec = default_codec,
+) -> Optional[BytesPayload]:
     if necessary_params:
-        response_body_dict = {}
-        for key in necessary_params:
-            value = all_params.get(key)
-            _body_dict = await serialize_response(response_content=value)
-            response_body_dict.update(_body_dict)
-        return JsonPayload(value=response_body_dict, dumps=ujson.dumps)
+        if len(necessary_params) == 1:
+            body = serialize_body_content(
+                all_params.get(necessary_params[0]), codec=codec
+            )
+        else:
+            body = merge_body_params(
+                [
+                    (key, all_params[key])
+                    for key in necessary_params
+                    if all_params.get(key) is not None
+                ],
+                codec=codec,
+            )
+        return JSONBytesPayload(body)
     return None
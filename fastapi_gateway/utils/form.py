@@ -1,4 +1,5 @@
 from typing import Any
+from typing import AsyncIterator
 from typing import Dict
 from typing import List
 from typing import Optional
@@ -8,6 +9,19 @@ from aiohttp import FormData
 from starlette.datastructures import FormData as FormDataStarlette
 from starlette.datastructures import UploadFile
 
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+async def iterate_upload_file(
+    file: UploadFile, chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> AsyncIterator[bytes]:
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
 
 class CustomFormDataStorage(FormData):
     def add_www_form(self, name: str, value: Any):
@@ -26,13 +40,18 @@ class CustomFormDataStorage(FormData):
 
 
 class CustomFormData(CustomFormDataStorage):
+    def __init__(self, *args, chunk_size: int = UPLOAD_CHUNK_SIZE, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.chunk_size = chunk_size
+
     async def upload(self, key, value: Union[UploadFile, str]):
         if isinstance(value, UploadFile):
-            bytes_file = await value.read()
+            # Sent as a chunked part read straight from the spooled file,
+            # so only one chunk per file is held in memory.
             self.add_multipart_form(
                 name=key,
                 filename=value.filename,
-                value=bytes_file,
+                value=iterate_upload_file(file=value, chunk_size=self.chunk_size),
                 content_type=value.content_type,
             )
         elif isinstance(value, str):
@@ -1,36 +1,82 @@
 from starlette.datastructures import MutableHeaders, Headers
-from typing import Dict, Any
+from typing import Dict, Any, FrozenSet, Mapping, Optional
 
 
-def inheritance_service_headers(
-    gateway_headers: MutableHeaders,
-    service_headers: MutableHeaders,
-) -> Dict[str, Any]:
-    forced_gateway_headers = [
+# Headers of a single connection (RFC 9110 7.6.1), a proxy never forwards them.
+HOP_BY_HOP_HEADERS = frozenset(
+    {
+        "connection",
+        "keep-alive",
+        "transfer-encoding",
+        "te",
+        "trailer",
+        "upgrade",
+        "proxy-connection",
+        "proxy-authenticate",
+        "proxy-authorization",
+    }
+)
+FORCED_GATEWAY_HEADERS = frozenset(
+    {
         "server",
         "date",
         "content-encoding",
         "content-type",
         "content-length",
-    ]
+    }
+)
+NOT_FORWARDED_HEADERS = frozenset(
+    {
+        b"host",
+        b"content-type",
+        b"accept-encoding",
+        b"content-length",
+    }
+)
+
+
+def hop_by_hop_headers(headers: Mapping[str, str]) -> FrozenSet[str]:
+    """The hop-by-hop headers of a message, with the ones its Connection header names."""
+    named = {
+        name.strip().lower()
+        for name in headers.get("connection", "").split(",")
+        if name.strip()
+    }
+    return HOP_BY_HOP_HEADERS.union(named)
+
+
+def inheritance_service_headers(
+    gateway_headers: MutableHeaders,
+    service_headers: MutableHeaders,
+) -> Dict[str, Any]:
+    excluded_headers = FORCED_GATEWAY_HEADERS.union(
+        hop_by_hop_headers(service_headers),
+        (key.decode("latin-1") for key, _ in gateway_headers.raw),
+    )
     return {
-        key: service_headers[key]
-        for key in service_headers
-        if key not in gateway_headers and key.lower() not in forced_gateway_headers
+        key: value
+        for key, value in service_headers.items()
+        if key.lower() not in excluded_headers
     }
 
 
 def generate_headers_for_microservice(headers: Headers) -> MutableHeaders:
-    new_headers = headers.mutablecopy()
+    raw_headers = [
+        (key, value) for key, value in headers.raw if key not in NOT_FORWARDED_HEADERS
+    ]
     gateway_host = headers.get("host")
-    new_headers.append("gateway_host", gateway_host)
+    if gateway_host is not None:
+        raw_headers.append((b"gateway_host", gateway_host.encode("latin-1")))
+    return MutableHeaders(raw=raw_headers)
 
-    forced_gateway_headers = [
-        "host",
-        "content-type",
-        "accept-encoding",
-        "content-length",
-    ]
-    [new_headers.__delitem__(key_header) for key_header in forced_gateway_headers]
 
+def remove_conditional_headers(
+    headers: MutableHeaders, etag: Optional[str] = None
+) -> MutableHeaders:
+    new_headers = headers.mutablecopy()
+    for key_header in ("if-none-match", "if-modified-since"):
+        if key_header in new_headers:
+            del new_headers[key_header]
+    if etag:
+        new_headers["if-none-match"] = etag
     return new_headers
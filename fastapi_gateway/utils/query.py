@@ -1,9 +1,17 @@
+from enum import Enum
 from typing import List, Any, Dict, Optional
 
 from fastapi.routing import serialize_response
 
+PRIMITIVE_QUERY_TYPES = frozenset({str, int, float, type(None)})
+
 
 async def serialize_query_content(key, value) -> dict:
+    if type(value) in PRIMITIVE_QUERY_TYPES:
+        return {key: value}
+    if isinstance(value, Enum) and type(value.value) in PRIMITIVE_QUERY_TYPES:
+        return {key: value.value}
+
     serialized_data = await serialize_response(response_content=value)
     if isinstance(serialized_data, dict):
         serialized = serialized_data
@@ -21,6 +29,9 @@ async def unzip_query_params(
         response_query_params = {}
         for key in necessary_params:
             value = all_params.get(key)
+            if type(value) in PRIMITIVE_QUERY_TYPES:
+                response_query_params[key] = value
+                continue
             serialized_dict = await serialize_query_content(key=key, value=value)
             response_query_params.update(serialized_dict)
         return response_query_params
@@ -1,8 +1,9 @@
-from typing import Union, Any, Dict, Optional
-from aiohttp import JsonPayload
+from typing import Union, Any, Dict, Optional, Mapping, Sequence
+from urllib.parse import urlencode
+from aiohttp import BytesPayload
 from fastapi_gateway.utils.form import CustomFormData
 
-T = Union[Dict[str, Any], CustomFormData, JsonPayload]
+T = Union[Dict[str, Any], CustomFormData, BytesPayload]
 
 
 def create_dict_if_not(data: Optional[T] = None) -> Union[dict, T]:
@@ -12,9 +13,25 @@ def create_dict_if_not(data: Optional[T] = None) -> Union[dict, T]:
 
 
 def create_request_data(
-    form: Optional[CustomFormData], body: Optional[JsonPayload]
-) -> Optional[Union[CustomFormData, JsonPayload]]:
+    form: Optional[CustomFormData], body: Optional[BytesPayload]
+) -> Optional[Union[CustomFormData, BytesPayload]]:
 
     if form:
         return form
     return body
+
+
+def create_request_key(
+    method: str,
+    service: str,
+    path: str,
+    query: Optional[Mapping[str, Any]],
+    headers: Mapping[str, str],
+    vary: Sequence[str] = (),
+) -> str:
+    key = f"{method.upper()} {service}{path}"
+    if query:
+        key += "?" + urlencode(sorted(query.items()), doseq=True)
+    for header in vary:
+        key += f"\n{header}:{headers.get(header, '')}"
+    return key
@@ -1,10 +1,97 @@
-from typing import List, Union, Any, Dict
-from ujson import dumps, loads
-from urllib.parse import unquote
+from typing import Any, Dict, Mapping, AsyncIterator
+from aiohttp import ClientResponse
+from starlette.background import BackgroundTask
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response, StreamingResponse
 
+from fastapi_gateway.codec import JSONCodec, default_codec
+from fastapi_gateway.exceptions import UpstreamContentTypeError
+from fastapi_gateway.utils.headers import inheritance_service_headers
 
-def decode_json(data: Union[List, Dict[str, Any]]):
-    data_dumps = dumps(data, ensure_ascii=False)
-    decoded_data_str = unquote(data_dumps)
-    data_data_json = loads(decoded_data_str)
-    return data_data_json
+JSON_CONTENT_TYPE = "application/json"
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def load_json_body(
+    body: bytes, headers: Mapping[str, str], codec: JSONCodec = default_codec
+) -> Any:
+    content_type = headers.get("Content-Type", "")
+    if content_type.split(";")[0].strip().lower() != JSON_CONTENT_TYPE:
+        raise UpstreamContentTypeError(content_type=content_type)
+    if not body.strip():
+        return None
+    return codec.loads(body)
+
+
+def create_response_headers(
+    service_headers: Mapping[str, str],
+    gateway_headers: MutableHeaders,
+    override_headers: bool = True,
+) -> Dict[str, Any]:
+    if override_headers:
+        return inheritance_service_headers(
+            gateway_headers=gateway_headers,
+            service_headers=service_headers,
+        )
+    return {}
+
+
+def create_passthrough_response(
+    body: bytes,
+    status_code: int,
+    service_headers: Mapping[str, str],
+    gateway_headers: MutableHeaders,
+    override_headers: bool = True,
+) -> Response:
+    headers = create_response_headers(
+        service_headers=service_headers,
+        gateway_headers=gateway_headers,
+        override_headers=override_headers,
+    )
+    response = Response(
+        content=body,
+        status_code=status_code,
+        headers=headers,
+        media_type=service_headers.get("Content-Type"),
+    )
+    response.raw_headers.extend(gateway_headers.raw)
+    return response
+
+
+async def iterate_response_body(
+    response: ClientResponse,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    # The next chunk is read from the socket only after the previous one has
+    # been sent to the client, so a slow client slows down the microservice
+    # instead of growing the gateway memory.
+    try:
+        async for chunk in response.content.iter_chunked(chunk_size):
+            yield chunk
+    finally:
+        response.release()
+
+
+def create_streaming_response(
+    service_response: ClientResponse,
+    gateway_headers: MutableHeaders,
+    override_headers: bool = True,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> StreamingResponse:
+    headers = create_response_headers(
+        service_headers=service_response.headers,
+        gateway_headers=gateway_headers,
+        override_headers=override_headers,
+    )
+    response = StreamingResponse(
+        content=iterate_response_body(
+            response=service_response, chunk_size=chunk_size
+        ),
+        status_code=service_response.status,
+        headers=headers,
+        media_type=service_response.headers.get("Content-Type"),
+        # Returns the connection even if the body was never iterated.
+        background=BackgroundTask(service_response.release),
+    )
+    response.raw_headers.extend(gateway_headers.raw)
+    return response
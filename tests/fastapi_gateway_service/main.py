@@ -1,3 +1,5 @@
+import asyncio
+from typing import Dict
 from typing import List
 
 from fastapi import APIRouter
@@ -12,17 +14,63 @@ from starlette import status
 from starlette.requests import Request
 from starlette.responses import Response
 
+from fastapi_gateway import ASGITransport
+from fastapi_gateway import BatchPolicy
+from fastapi_gateway import CachePolicy
+from fastapi_gateway import CircuitBreaker
+from fastapi_gateway import CoalescePolicy
+from fastapi_gateway import ConcurrencyLimit
+from fastapi_gateway import HedgePolicy
+from fastapi_gateway import HTTP2Transport
+from fastapi_gateway import Leg
+from fastapi_gateway import OutlierDetection
+from fastapi_gateway import PowerOfTwoChoices
+from fastapi_gateway import RateLimit
+from fastapi_gateway import RetryPolicy
+from fastapi_gateway import Timeouts
+from fastapi_gateway import UnixSocketTransport
+from fastapi_gateway import UpstreamPool
+from fastapi_gateway import aggregate
 from fastapi_gateway import route
+from fastapi_gateway import setup_gateway
+from fastapi_gateway import unquote_fields
 from tests.fastapi_gateway_service.depends import check_api_key
 from tests.fastapi_gateway_service.models import FooList
 from tests.fastapi_gateway_service.models import FooModel
 from tests.fastapi_gateway_service.models import ModelCheckPath
+from tests.fastapi_microservice.main import app as app_microservice
 
 app = FastAPI(title="API Gateway")
+gateway_client = setup_gateway(app, batch=BatchPolicy(max_calls=20, max_concurrency=4))
 router1 = APIRouter(prefix="/gateway_endpoint")
 router2 = APIRouter(tags=["Without service path"])
 
 SERVICE_URL = "http://microservice.localtest.me:8002"
+SERVICE_POOL = UpstreamPool(urls=[SERVICE_URL, "http://127.0.0.1:8002"])
+DEAD_SERVICE_URL = "http://127.0.0.1:1"
+SERVICE_POOL_WITH_DEAD = UpstreamPool(
+    urls=[DEAD_SERVICE_URL, SERVICE_URL],
+    outlier_detection=OutlierDetection(consecutive_errors=1),
+)
+RETRY_POOL_WITH_DEAD = UpstreamPool(urls=[DEAD_SERVICE_URL, SERVICE_URL])
+FAST_FAILING_POOL = UpstreamPool(
+    urls=[DEAD_SERVICE_URL, SERVICE_URL],
+    strategy=PowerOfTwoChoices(),
+    timeouts=Timeouts(total=5),
+)
+SLOW_SERVICE_POOL = UpstreamPool(urls=[SERVICE_URL], timeouts=Timeouts(total=0.2))
+LIMITED_SERVICE_POOL = UpstreamPool(
+    urls=[SERVICE_URL], concurrency_limit=ConcurrencyLimit(max_in_flight=1, max_queue=0)
+)
+HEDGE_POLICY = HedgePolicy(delay=0.05, max_ratio=1.0)
+PROBE_BREAKER = CircuitBreaker(open_duration=0, half_open_max_calls=1)
+DEADLINE_BREAKER = CircuitBreaker(minimum_calls=4)
+HTTP2_SERVICE_URL = "http://127.0.0.1:8003"
+HTTP2_SERVICE_POOL = UpstreamPool(
+    urls=[HTTP2_SERVICE_URL], transport=HTTP2Transport(h2c=True, max_connections=1)
+)
+ASGI_TRANSPORT = ASGITransport(app=app_microservice)
+UNIX_SOCKET_PATH = "/tmp/fastapi_gateway_microservice.sock"
 
 test_auth = OAuth2PasswordBearer(tokenUrl="/api/login", scheme_name="JWT")
 
@@ -186,6 +234,24 @@ async def check_form_data(
     pass
 
 
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.post,
+    service_url=SERVICE_URL,
+    gateway_path="/upload_file_checksum",
+    service_path="/v1/upload_file_checksum",
+    status_code=status.HTTP_200_OK,
+    form_params=["file"],
+    tags=["File", "Form"],
+)
+async def check_upload_file_checksum(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+):
+    pass
+
+
 # noinspection PyUnusedLocal
 @route(
     request_method=router1.post,
@@ -241,5 +307,707 @@ async def check_depends_header(
     pass
 
 
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/plain_text",
+    service_path="/v1/plain_text",
+    status_code=status.HTTP_200_OK,
+    tags=["Passthrough"],
+)
+async def check_passthrough(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/binary",
+    service_path="/v1/binary",
+    status_code=status.HTTP_200_OK,
+    tags=["Passthrough"],
+)
+async def check_passthrough_binary(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/download_file",
+    service_path="/v1/download_file",
+    status_code=status.HTTP_200_OK,
+    stream=True,
+    stream_chunk_size=1024,
+    tags=["Stream"],
+)
+async def check_stream(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/chunked",
+    service_path="/v1/chunked",
+    status_code=status.HTTP_200_OK,
+    tags=["Passthrough"],
+)
+async def check_passthrough_chunked(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/chunked/stream",
+    service_path="/v1/chunked",
+    status_code=status.HTTP_200_OK,
+    stream=True,
+    tags=["Stream"],
+)
+async def check_stream_chunked(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_POOL,
+    gateway_path="/pool/list_model",
+    service_path="/v1/list_model",
+    status_code=status.HTTP_200_OK,
+    tags=["Pool"],
+)
+async def check_upstream_pool(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=FAST_FAILING_POOL,
+    gateway_path="/fast_failing_pool/list_model",
+    service_path="/v1/list_model",
+    status_code=status.HTTP_200_OK,
+    tags=["Pool"],
+)
+async def check_fast_failing_pool(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_POOL_WITH_DEAD,
+    gateway_path="/pool_with_dead/list_model",
+    service_path="/v1/list_model",
+    status_code=status.HTTP_200_OK,
+    tags=["Pool"],
+)
+async def check_upstream_pool_with_dead(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=DEAD_SERVICE_URL,
+    gateway_path="/circuit_breaker",
+    service_path="/v1/list_model",
+    status_code=status.HTTP_200_OK,
+    circuit_breaker=CircuitBreaker(
+        minimum_calls=2,
+        fallback=lambda request: {"fallback": True},
+    ),
+    tags=["Circuit breaker"],
+)
+async def check_circuit_breaker(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/circuit_breaker/sleep",
+    service_path="/v1/sleep",
+    query_params=["delay"],
+    status_code=status.HTTP_200_OK,
+    circuit_breaker=PROBE_BREAKER,
+    tags=["Circuit breaker"],
+)
+async def check_circuit_breaker_probe(
+    request: Request, response: Response, delay: float = 0
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/circuit_breaker/deadline",
+    service_path="/v1/list_model",
+    status_code=status.HTTP_200_OK,
+    circuit_breaker=DEADLINE_BREAKER,
+    timeout=Timeouts(total=5, deadline_header="x-request-timeout"),
+    tags=["Circuit breaker"],
+)
+async def check_circuit_breaker_deadline(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/cache/counter",
+    service_path="/v1/counter",
+    query_params=["key", "delay"],
+    status_code=status.HTTP_200_OK,
+    cache=CachePolicy(ttl=60),
+    tags=["Cache"],
+)
+async def check_cache(
+    request: Request, response: Response, key: str, delay: float = 0
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/cache/whoami",
+    service_path="/v1/whoami",
+    query_params=["key", "public"],
+    status_code=status.HTTP_200_OK,
+    cache=CachePolicy(ttl=60),
+    tags=["Cache"],
+)
+async def check_cache_whoami(
+    request: Request, response: Response, key: str, public: int = 0
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/cache/revalidate_counter",
+    service_path="/v1/counter",
+    query_params=["key"],
+    status_code=status.HTTP_200_OK,
+    cache=CachePolicy(ttl=0, stale_ttl=60),
+    tags=["Cache"],
+)
+async def check_cache_revalidation(request: Request, response: Response, key: str):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/coalesce/counter",
+    service_path="/v1/counter",
+    query_params=["key", "delay"],
+    status_code=status.HTTP_200_OK,
+    coalesce=CoalescePolicy(),
+    tags=["Coalesce"],
+)
+async def check_coalesce(
+    request: Request, response: Response, key: str, delay: float = 0
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/encoded_text",
+    service_path="/v1/encoded_text",
+    status_code=status.HTTP_200_OK,
+    response_model=Dict[str, str],
+    tags=["Transform"],
+)
+async def check_encoded_text(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/encoded_text/unquoted",
+    service_path="/v1/encoded_text",
+    status_code=status.HTTP_200_OK,
+    response_transform=unquote_fields("name"),
+    tags=["Transform"],
+)
+async def check_unquoted_text(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=RETRY_POOL_WITH_DEAD,
+    gateway_path="/retry/pool_with_dead/list_model",
+    service_path="/v1/list_model",
+    status_code=status.HTTP_200_OK,
+    retry=RetryPolicy(attempts=2, backoff=0),
+    tags=["Retry"],
+)
+async def check_retry_pool_with_dead(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/retry/flaky",
+    service_path="/v1/flaky",
+    query_params=["key", "failures"],
+    status_code=status.HTTP_200_OK,
+    retry=RetryPolicy(attempts=3, backoff=0),
+    tags=["Retry"],
+)
+async def check_retry_flaky(
+    request: Request, response: Response, key: str, failures: int
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.post,
+    service_url=SERVICE_URL,
+    gateway_path="/retry/flaky",
+    service_path="/v1/flaky",
+    query_params=["key", "failures"],
+    status_code=status.HTTP_200_OK,
+    retry=RetryPolicy(attempts=3, backoff=0),
+    tags=["Retry"],
+)
+async def check_retry_flaky_post(
+    request: Request, response: Response, key: str, failures: int
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_POOL,
+    gateway_path="/hedge/slow_first",
+    service_path="/v1/slow_first",
+    query_params=["key", "delay"],
+    status_code=status.HTTP_200_OK,
+    hedge=HEDGE_POLICY,
+    tags=["Hedging"],
+)
+async def check_hedge(request: Request, response: Response, key: str, delay: float):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/timeouts/sleep",
+    service_path="/v1/sleep",
+    query_params=["delay"],
+    status_code=status.HTTP_200_OK,
+    timeout=Timeouts(total=5, ttfb=0.3, deadline_header="x-request-timeout"),
+    tags=["Timeouts"],
+)
+async def check_timeouts(request: Request, response: Response, delay: float = 0):
+    pass
+
+
+async def slow_dependency():
+    await asyncio.sleep(0.3)
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/timeouts/slow_dependency",
+    service_path="/v1/sleep",
+    status_code=status.HTTP_200_OK,
+    dependencies=[Depends(slow_dependency)],
+    timeout=Timeouts(total=5, deadline_header="x-request-timeout"),
+    tags=["Timeouts"],
+)
+async def check_timeouts_slow_dependency(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SLOW_SERVICE_POOL,
+    gateway_path="/timeouts/pool_sleep",
+    service_path="/v1/sleep",
+    query_params=["delay"],
+    status_code=status.HTTP_200_OK,
+    tags=["Timeouts"],
+)
+async def check_pool_timeouts(request: Request, response: Response, delay: float = 0):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/limits/route_sleep",
+    service_path="/v1/sleep",
+    query_params=["delay"],
+    status_code=status.HTTP_200_OK,
+    concurrency_limit=ConcurrencyLimit(
+        max_in_flight=1, max_queue=1, queue_timeout=5, status_code=429
+    ),
+    tags=["Limits"],
+)
+async def check_route_limit(request: Request, response: Response, delay: float = 0):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=LIMITED_SERVICE_POOL,
+    gateway_path="/limits/service_sleep",
+    service_path="/v1/sleep",
+    query_params=["delay"],
+    status_code=status.HTTP_200_OK,
+    tags=["Limits"],
+)
+async def check_service_limit(request: Request, response: Response, delay: float = 0):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/rate_limit/plain_text",
+    service_path="/v1/plain_text",
+    status_code=status.HTTP_200_OK,
+    rate_limit=RateLimit(rate=2, period=60, dependency=check_api_key),
+    tags=["Rate limit"],
+)
+async def check_rate_limit(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/tracing/traceparent",
+    service_path="/v1/traceparent",
+    query_params=["key"],
+    status_code=status.HTTP_200_OK,
+    response_model=Dict[str, str],
+    tags=["Tracing"],
+)
+async def check_tracing(request: Request, response: Response, key: str):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=HTTP2_SERVICE_POOL,
+    gateway_path="/http2/http_version",
+    service_path="/v1/http_version",
+    status_code=status.HTTP_200_OK,
+    response_model=Dict[str, str],
+    tags=["Transports"],
+)
+async def check_http2_version(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.post,
+    service_url=HTTP2_SERVICE_POOL,
+    gateway_path="/http2/query_and_body",
+    service_path="/v1/query_and_body",
+    query_params=["query_int", "query_str"],
+    body_params=["test_body"],
+    status_code=status.HTTP_200_OK,
+    tags=["Transports"],
+)
+async def check_http2_query_and_body(
+    query_int: int,
+    query_str: str,
+    test_body: FooModel,
+    request: Request,
+    response: Response,
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.post,
+    service_url=HTTP2_SERVICE_POOL,
+    gateway_path="/http2/form_data",
+    service_path="/v1/form_data",
+    status_code=status.HTTP_200_OK,
+    form_params=["username", "password"],
+    tags=["Transports"],
+)
+async def check_http2_form_data(
+    request: Request,
+    response: Response,
+    username: str = Form(...),
+    password: str = Form(...),
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=HTTP2_SERVICE_POOL,
+    gateway_path="/http2/download_file",
+    service_path="/v1/download_file",
+    status_code=status.HTTP_200_OK,
+    stream=True,
+    stream_chunk_size=1024,
+    tags=["Transports"],
+)
+async def check_http2_stream(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/asgi/http_version",
+    service_path="/v1/http_version",
+    status_code=status.HTTP_200_OK,
+    response_model=Dict[str, str],
+    tags=["Transports"],
+    transport=ASGI_TRANSPORT,
+)
+async def check_asgi_version(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.post,
+    service_url=SERVICE_URL,
+    gateway_path="/asgi/query_and_body",
+    service_path="/v1/query_and_body",
+    query_params=["query_int", "query_str"],
+    body_params=["test_body"],
+    status_code=status.HTTP_200_OK,
+    tags=["Transports"],
+    transport=ASGI_TRANSPORT,
+)
+async def check_asgi_query_and_body(
+    query_int: int,
+    query_str: str,
+    test_body: FooModel,
+    request: Request,
+    response: Response,
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.post,
+    service_url=SERVICE_URL,
+    gateway_path="/asgi/upload_file_checksum",
+    service_path="/v1/upload_file_checksum",
+    status_code=status.HTTP_200_OK,
+    form_params=["file"],
+    tags=["Transports"],
+    transport=ASGI_TRANSPORT,
+)
+async def check_asgi_upload_file(
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=SERVICE_URL,
+    gateway_path="/asgi/download_file",
+    service_path="/v1/download_file",
+    status_code=status.HTTP_200_OK,
+    stream=True,
+    stream_chunk_size=1024,
+    tags=["Transports"],
+    transport=ASGI_TRANSPORT,
+)
+async def check_asgi_stream(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.post,
+    service_url=SERVICE_URL,
+    gateway_path="/unix/query_and_body",
+    service_path="/v1/query_and_body",
+    query_params=["query_int", "query_str"],
+    body_params=["test_body"],
+    status_code=status.HTTP_200_OK,
+    tags=["Transports"],
+    transport=UnixSocketTransport(path=UNIX_SOCKET_PATH),
+)
+async def check_unix_query_and_body(
+    query_int: int,
+    query_str: str,
+    test_body: FooModel,
+    request: Request,
+    response: Response,
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@route(
+    request_method=router1.get,
+    service_url=f"unix://{UNIX_SOCKET_PATH}",
+    gateway_path="/unix/path_param/{random_int}",
+    service_path="/v1/path_param/{random_int}",
+    status_code=status.HTTP_200_OK,
+    response_model=ModelCheckPath,
+    tags=["Transports"],
+)
+async def check_unix_url(random_int: int, request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@aggregate(
+    request_method=router1.get,
+    gateway_path="/aggregate/item/{item_id}",
+    legs=[
+        Leg(name="item", service_url=SERVICE_URL, service_path="/v1/path_param/{item_id}"),
+        Leg(
+            name="query",
+            service_url=SERVICE_URL,
+            service_path="/v1/query",
+            query_params={"query_int": "item.custom_int", "query_str": "item.foo"},
+        ),
+        Leg(name="list", service_url=SERVICE_URL, service_path="/v1/list_model"),
+        Leg(
+            name="slow",
+            service_url=SERVICE_URL,
+            service_path="/v1/sleep",
+            query_params=["delay"],
+            timeout=0.3,
+            required=False,
+            default={"deadline": None},
+        ),
+    ],
+    tags=["Aggregate"],
+)
+async def check_aggregate(item_id: int, delay: float, request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@aggregate(
+    request_method=router1.get,
+    gateway_path="/aggregate/required_failure/{item_id}",
+    legs=[
+        Leg(name="item", service_url=SERVICE_URL, service_path="/v1/path_param/{item_id}"),
+        Leg(name="slow", service_url=SERVICE_URL, service_path="/v1/sleep?delay=1"),
+    ],
+    merge=lambda results: {"foo": results["item"]["foo"]},
+    tags=["Aggregate"],
+)
+async def check_aggregate_required_failure(
+    item_id: str, request: Request, response: Response
+):
+    pass
+
+
+# noinspection PyUnusedLocal
+@aggregate(
+    request_method=router1.get,
+    gateway_path="/aggregate/dead",
+    legs=[
+        Leg(name="dead", service_url=DEAD_SERVICE_URL, service_path="/v1/list_model"),
+        Leg(name="slow", service_url=SERVICE_URL, service_path="/v1/sleep?delay=1"),
+    ],
+    timeout=2,
+    tags=["Aggregate"],
+)
+async def check_aggregate_dead(request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@aggregate(
+    request_method=router1.get,
+    gateway_path="/aggregate/route_timeout",
+    legs=[
+        Leg(name="list", service_url=SERVICE_URL, service_path="/v1/list_model"),
+        Leg(
+            name="slow",
+            service_url=SERVICE_URL,
+            service_path="/v1/sleep",
+            query_params=["delay"],
+            required=False,
+        ),
+        Leg(
+            name="after_slow",
+            service_url=SERVICE_URL,
+            service_path="/v1/list_model",
+            depends_on=["slow"],
+            required=False,
+        ),
+    ],
+    timeout=0.3,
+    tags=["Aggregate"],
+)
+async def check_aggregate_route_timeout(delay: float, request: Request, response: Response):
+    pass
+
+
+# noinspection PyUnusedLocal
+@aggregate(
+    request_method=router1.get,
+    gateway_path="/aggregate/required_timeout",
+    legs=[
+        Leg(name="list", service_url=SERVICE_URL, service_path="/v1/list_model"),
+        Leg(name="slow", service_url=SERVICE_URL, service_path="/v1/sleep?delay=1"),
+    ],
+    timeout=0.3,
+    tags=["Aggregate"],
+)
+async def check_aggregate_required_timeout(request: Request, response: Response):
+    pass
+
+
 app.include_router(router1)
 app.include_router(router2)
@@ -1,9 +1,25 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
 from fastapi import FastAPI, Form, UploadFile, File, Body, Header
 from starlette.requests import Request
+from starlette.responses import (
+    FileResponse,
+    JSONResponse,
+    PlainTextResponse,
+    Response,
+    StreamingResponse,
+)
 from tests.fastapi_microservice.models import ExampleModel
 
 app = FastAPI(title="Microservice #1")
 
+PHOTO_PATH = Path(__file__).parent.parent / "src" / "photo.jpg"
+COUNTER_ETAG = '"counter"'
+counter = {"calls": 0}
+flaky_calls = {}
+
 
 @app.get(
     path="/v1/path_param/{random_int}",
@@ -99,6 +115,15 @@ async def form_and_upload_file(
     }
 
 
+@app.post(
+    path="/v1/upload_file_checksum",
+    tags=["Form", "File"],
+)
+async def upload_file_checksum(file: UploadFile = File(...)):
+    content = await file.read()
+    return {"size": len(content), "md5": hashlib.md5(content).hexdigest()}
+
+
 @app.get(path="/v1/check_dependency_header")
 async def check_dependency(request: Request):
     return {"header": request.headers.get("x-api-key"), "foo": "bar"}
@@ -107,3 +132,94 @@ async def check_dependency(request: Request):
 @app.post(path="/v1/check_dependency_header")
 async def check_dependency(username: str = Form(...), password: str = Form(...)):
     return {"username": username, "password": password}
+
+
+@app.get(path="/v1/plain_text", tags=["Passthrough"])
+async def plain_text():
+    return PlainTextResponse("raw %20 text", headers={"x-service": "microservice"})
+
+
+@app.get(path="/v1/binary", tags=["Passthrough"])
+async def binary():
+    return Response(bytes(range(256)), media_type="application/octet-stream")
+
+
+@app.get(path="/v1/encoded_text", tags=["Transform"])
+async def encoded_text():
+    return {"name": "John%20Doe", "note": "100%25 done"}
+
+
+@app.api_route(path="/v1/flaky", methods=["GET", "POST"], tags=["Retry"])
+async def flaky(key: str, failures: int):
+    flaky_calls[key] = flaky_calls.get(key, 0) + 1
+    if flaky_calls[key] <= failures:
+        return JSONResponse({"calls": flaky_calls[key]}, status_code=503)
+    return {"calls": flaky_calls[key]}
+
+
+@app.get(path="/v1/slow_first", tags=["Hedging"])
+async def slow_first(key: str, delay: float):
+    flaky_calls[key] = flaky_calls.get(key, 0) + 1
+    if flaky_calls[key] == 1:
+        await asyncio.sleep(delay)
+    return {"calls": flaky_calls[key]}
+
+
+@app.get(path="/v1/sleep", tags=["Timeouts"])
+async def sleep(request: Request, delay: float = 0):
+    await asyncio.sleep(delay)
+    return {"deadline": request.headers.get("x-request-timeout")}
+
+
+@app.get(path="/v1/http_version", tags=["Transports"])
+async def http_version(request: Request):
+    return {"http_version": request.scope["http_version"]}
+
+
+@app.get(path="/v1/traceparent", tags=["Tracing"])
+async def traceparent(request: Request, key: str):
+    return {"key": key, "traceparent": request.headers.get("traceparent")}
+
+
+@app.get(path="/v1/download_file", tags=["Stream"])
+async def download_file():
+    return FileResponse(PHOTO_PATH, filename="photo.jpg")
+
+
+@app.get(path="/v1/chunked", tags=["Stream"])
+async def chunked():
+    async def chunks():
+        for chunk in (b"first,", b"second"):
+            yield chunk
+
+    return StreamingResponse(
+        chunks(),
+        media_type="text/plain",
+        headers={
+            "Connection": "keep-alive, x-hop",
+            "Keep-Alive": "timeout=5",
+            "X-Hop": "1",
+            "X-Kept": "1",
+        },
+    )
+
+
+@app.get(path="/v1/whoami", tags=["Cache"])
+async def whoami(request: Request, public: int = 0):
+    counter["calls"] += 1
+    headers = {"Cache-Control": "public, max-age=60"} if public else {}
+    return JSONResponse(
+        {"authorization": request.headers.get("authorization"), "calls": counter["calls"]},
+        headers=headers,
+    )
+
+
+@app.get(path="/v1/counter", tags=["Cache"])
+async def get_counter(request: Request, key: str = "", delay: float = 0):
+    if request.headers.get("if-none-match") == COUNTER_ETAG:
+        return Response(status_code=304, headers={"ETag": COUNTER_ETAG})
+    await asyncio.sleep(delay)
+    counter["calls"] += 1
+    return JSONResponse(
+        {"key": key, "calls": counter["calls"]}, headers={"ETag": COUNTER_ETAG}
+    )
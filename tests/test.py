@@ -1,6 +1,81 @@
+import asyncio
+import base64
+import datetime
+import hashlib
+import json
+import threading
+import time
+import uuid
+
 import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from aiohttp import FormData
+from aiohttp import UnixConnector
 from httpx import AsyncClient
+from pydantic import BaseModel, Field
+from starlette.datastructures import Headers
+from starlette.requests import Request
+from starlette.responses import Response
+
+from fastapi_gateway import AdaptiveLimit
+from fastapi_gateway import AiohttpTransport
+from fastapi_gateway import ASGITransport
+from fastapi_gateway import CachePolicy
+from fastapi_gateway import CircuitBreaker
+from fastapi_gateway import CircuitState
+from fastapi_gateway import ConcurrencyLimit
+from fastapi_gateway import ConsistentHash
+from fastapi_gateway import GatewayClient
+from fastapi_gateway import GatewayMetrics
+from fastapi_gateway import GatewayTracing
+from fastapi_gateway import HealthCheck
+from fastapi_gateway import Leg
+from fastapi_gateway import HedgePolicy
+from fastapi_gateway import HTTP2Transport
+from fastapi_gateway import LeastOutstanding
+from fastapi_gateway import MemoryCache
+from fastapi_gateway import MemoryRateLimitBackend
+from fastapi_gateway import OrjsonCodec
+from fastapi_gateway import RateLimit
+from fastapi_gateway import RedisCache
+from fastapi_gateway import RetryBudget
+from fastapi_gateway import RetryPolicy
+from fastapi_gateway import StdlibJSONCodec
+from fastapi_gateway import UjsonCodec
+from fastapi_gateway import UpstreamPool
+from fastapi_gateway import aggregate
+from fastapi_gateway import circuit_states
+from fastapi_gateway import route
+from fastapi_gateway import setup_gateway
+from fastapi_gateway import unquote_fields
+from fastapi_gateway.balancing import UpstreamInstance
+from fastapi_gateway.cache import CacheEntry
+from fastapi_gateway.exceptions import CircuitOpenError
+from fastapi_gateway.exceptions import ConcurrencyLimitError
+from fastapi_gateway.health import probe_pool
+from fastapi_gateway.metrics import LATENCY_BUCKETS
+from fastapi_gateway.metrics import RequestTimer
+from fastapi_gateway.metrics import UpstreamMetrics
+from fastapi_gateway.metrics import connection_counts
+from fastapi_gateway.plan import compile_route_plan
+from fastapi_gateway.ratelimit import gcra
+from fastapi_gateway.utils.body import unzip_body_object
+from fastapi_gateway.utils.headers import generate_headers_for_microservice
+from fastapi_gateway.utils.query import unzip_query_params
 from tests.fastapi_gateway_service.main import app as app_gateway
+from tests.fastapi_gateway_service.main import ASGI_TRANSPORT
+from tests.fastapi_gateway_service.main import DEAD_SERVICE_URL
+from tests.fastapi_gateway_service.main import DEADLINE_BREAKER
+from tests.fastapi_gateway_service.main import FAST_FAILING_POOL
+from tests.fastapi_gateway_service.main import gateway_client
+from tests.fastapi_gateway_service.main import HEDGE_POLICY
+from tests.fastapi_gateway_service.main import HTTP2_SERVICE_URL
+from tests.fastapi_gateway_service.main import PROBE_BREAKER
+from tests.fastapi_gateway_service.main import router1
+from tests.fastapi_gateway_service.main import SERVICE_POOL
+from tests.fastapi_gateway_service.main import SERVICE_URL
+from tests.fastapi_gateway_service.main import UNIX_SOCKET_PATH
 
 BASE_URL_MICROSERVICE = "http://gateway.localtest.me:8001"
 PREFIX_GATEWAY = "/gateway_endpoint"
@@ -209,6 +284,21 @@ async def test_upload_file_post():
     assert response_success.json() == {"detail": "There was an error parsing the body"}
 
 
+@pytest.mark.asyncio
+async def test_upload_file_checksum_post():
+    with open("src/photo.jpg", "rb") as photo:
+        content = photo.read()
+    file = {"file": ("example_photo.jpg", content, "image/jpeg")}
+
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.post("/upload_file_checksum", files=file)
+    assert response.status_code == 200
+    assert response.json() == {
+        "size": len(content),
+        "md5": hashlib.md5(content).hexdigest(),
+    }
+
+
 @pytest.mark.asyncio
 async def test_upload_file_form_data_post():
     form_data = {"username": "ivanov124", "password": "pwd123456789"}
@@ -251,3 +341,1294 @@ async def test_unpack_dependency_form_2():
         )
     assert response_success.status_code == 200
     assert response_success.json() == form_data
+
+
+@pytest.mark.asyncio
+async def test_gateway_client_reuses_session():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        await client.get("/list_model")
+        session = gateway_client.session(service_url=SERVICE_URL)
+        await client.get("/list_model")
+    assert gateway_client.session(service_url=SERVICE_URL) is session
+
+    await gateway_client.shutdown()
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_gateway_client_session_per_service():
+    client = GatewayClient(limit_per_host=5)
+    first = client.session(service_url="http://first.localtest.me")
+    second = client.session(service_url="http://second.localtest.me")
+    assert first is not second
+    assert first.connector.limit_per_host == 5
+    await client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_passthrough_response_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get("/plain_text")
+    assert response.status_code == 200
+    assert response.content == b"raw %20 text"
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.headers["x-service"] == "microservice"
+
+
+@pytest.mark.asyncio
+async def test_stream_download_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        async with client.stream("GET", "/download_file") as response:
+            chunks = [chunk async for chunk in response.aiter_raw()]
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "photo.jpg" in response.headers["content-disposition"]
+    with open("src/photo.jpg", "rb") as photo:
+        assert b"".join(chunks) == photo.read()
+
+
+@pytest.mark.asyncio
+async def test_hop_by_hop_headers_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get("/chunked")
+        async with client.stream("GET", "/chunked/stream") as response_stream:
+            await response_stream.aread()
+
+    # The connection headers of the microservice are not the ones of the client.
+    for gateway_response in (response, response_stream):
+        assert gateway_response.status_code == 200
+        assert gateway_response.content == b"first,second"
+        assert gateway_response.headers["x-kept"] == "1"
+        for header in ("transfer-encoding", "connection", "keep-alive", "x-hop"):
+            assert header not in gateway_response.headers
+    assert response.headers["content-length"] == "12"
+
+
+@pytest.mark.asyncio
+async def test_upstream_pool_round_robin_get():
+    before = [instance.requests for instance in SERVICE_POOL.instances]
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        for _ in range(4):
+            response = await client.get("/pool/list_model")
+            assert response.status_code == 200
+            assert response.json() == [{"foo_key": "foo"}, {"foo_key": "bar"}]
+
+    after = [instance.requests for instance in SERVICE_POOL.instances]
+    assert [a - b for a, b in zip(after, before)] == [2, 2]
+    assert all(instance.in_flight == 0 for instance in SERVICE_POOL.instances)
+
+
+def test_upstream_pool_strategies():
+    urls = ["http://first:8000", "http://second:8000", "http://third:8000"]
+
+    pool = UpstreamPool(urls=urls, strategy=LeastOutstanding())
+    pool.instances[0].in_flight = 3
+    pool.instances[1].in_flight = 1
+    pool.instances[2].in_flight = 2
+    assert pool.select().url == "http://second:8000"
+    assert pool.select(exclude=[pool.instances[1]]).url == "http://third:8000"
+
+    pool = UpstreamPool(urls=urls, strategy=ConsistentHash(header="x-api-key"))
+
+    def select_for(key):
+        scope = {"type": "http", "headers": [(b"x-api-key", key.encode())]}
+        return pool.select(request=Request(scope)).url
+
+    assert len({select_for("user-1") for _ in range(10)}) == 1
+    assert len({select_for(f"user-{i}") for i in range(100)}) == 3
+
+
+@pytest.mark.asyncio
+async def test_outlier_ejection_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response_dead = await client.get("/pool_with_dead/list_model")
+        responses = [await client.get("/pool_with_dead/list_model") for _ in range(3)]
+
+    assert response_dead.status_code == 503
+    assert response_dead.json() == {"detail": "Service is unavailable."}
+    assert [response.status_code for response in responses] == [200, 200, 200]
+
+
+@pytest.mark.asyncio
+async def test_fast_failing_instance_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        responses = [await client.get("/fast_failing_pool/list_model") for _ in range(10)]
+
+    dead, alive = FAST_FAILING_POOL.instances
+    # A refused connection counts as a call taking the timeout, the dead instance is not
+    # chosen again for answering fast.
+    assert [response.status_code for response in responses].count(503) <= 1
+    assert dead.requests <= 1
+    assert dead.latency in (0, 5)
+    assert alive.requests >= 9
+
+
+def test_track_failed_call():
+    instance = UpstreamInstance(url=SERVICE_URL)
+    with pytest.raises(ConnectionRefusedError):
+        with instance.track(failure_latency=5):
+            raise ConnectionRefusedError()
+    assert instance.latency == 5
+    with pytest.raises(asyncio.CancelledError):
+        with instance.track(failure_latency=5):
+            raise asyncio.CancelledError()
+    assert instance.requests == 1
+    assert instance.in_flight == 0
+
+
+def test_stale_loop_sessions_closed():
+    client = GatewayClient()
+    transport = AiohttpTransport()
+
+    async def open_sessions():
+        return client.session(service_url=SERVICE_URL), transport.session()
+
+    # A session of a stopped loop can not be closed any more, it is detached.
+    stopped_loop = asyncio.new_event_loop()
+    stopped_session, stopped_transport_session = stopped_loop.run_until_complete(
+        open_sessions()
+    )
+    stopped_loop.close()
+
+    # A session of a loop running in another thread is closed on its loop.
+    running_loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=running_loop.run_forever)
+    thread.start()
+    running_session, running_transport_session = asyncio.run_coroutine_threadsafe(
+        open_sessions(), running_loop
+    ).result()
+
+    async def reopen():
+        session = client.session(service_url=SERVICE_URL)
+        await transport.close()
+        await client.shutdown()
+        return session
+
+    try:
+        session = asyncio.run(reopen())
+        time.sleep(0.1)
+    finally:
+        running_loop.call_soon_threadsafe(running_loop.stop)
+        thread.join()
+        running_loop.close()
+
+    assert session is not running_session
+    assert stopped_session.closed and stopped_transport_session.closed
+    assert running_session.closed and running_transport_session.closed
+
+
+@pytest.mark.asyncio
+async def test_active_health_check():
+    pool = UpstreamPool(
+        urls=[DEAD_SERVICE_URL, SERVICE_URL],
+        health_check=HealthCheck(
+            path="/v1/list_model", healthy_threshold=1, unhealthy_threshold=1
+        ),
+    )
+    dead, alive = pool.instances
+    client = GatewayClient()
+
+    await probe_pool(pool=pool, client=client)
+    assert not dead.healthy
+    assert alive.healthy
+    assert {pool.select().url for _ in range(4)} == {SERVICE_URL}
+
+    dead.url = SERVICE_URL
+    await probe_pool(pool=pool, client=client)
+    assert dead.healthy
+    await client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_active_health_check_transport():
+    # The host only exists for the transport, a probe over TCP would fail.
+    pool = UpstreamPool(
+        urls=["http://microservice.invalid"],
+        transport=ASGI_TRANSPORT,
+        health_check=HealthCheck(path="/v1/list_model", unhealthy_threshold=1),
+    )
+    client = GatewayClient()
+
+    await probe_pool(pool=pool, client=client)
+    assert pool.instances[0].healthy
+
+    pool.health_check.path = "/v1/missing"
+    await probe_pool(pool=pool, client=client)
+    assert not pool.instances[0].healthy
+    await client.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_fallback_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        responses = [await client.get("/circuit_breaker") for _ in range(2)]
+        response_open = await client.get("/circuit_breaker")
+
+    assert [response.status_code for response in responses] == [503, 503]
+    assert response_open.status_code == 200
+    assert response_open.json() == {"fallback": True}
+    assert circuit_states()[DEAD_SERVICE_URL] is CircuitState.OPEN
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_expired_deadline_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        responses_expired = [
+            await client.get(
+                "/circuit_breaker/deadline", headers={"x-request-timeout": "0"}
+            )
+            for _ in range(5)
+        ]
+        response = await client.get("/circuit_breaker/deadline")
+
+    # No call was made for the expired requests, they are not failures of the service.
+    assert [response.status_code for response in responses_expired] == [504] * 5
+    assert response.status_code == 200
+    assert DEADLINE_BREAKER.states()[SERVICE_URL] is CircuitState.CLOSED
+
+
+def test_circuit_breaker_states():
+    breaker = CircuitBreaker(minimum_calls=4, failure_rate_threshold=0.5, open_duration=0)
+    circuit = breaker.circuit(name="service")
+
+    for failure in (False, False, True):
+        circuit.before_call()
+        circuit.record(failure=failure, duration=0.1)
+    assert circuit.state is CircuitState.CLOSED
+
+    circuit.record(failure=True, duration=0.1)
+    assert circuit.state is CircuitState.OPEN
+
+    circuit.before_call()
+    assert circuit.state is CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+    circuit.record(failure=False, duration=0.1)
+    assert circuit.state is CircuitState.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_cancelled_probe():
+    circuit = PROBE_BREAKER.circuit(name=SERVICE_URL)
+    circuit.open(now=time.monotonic())
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        probe = asyncio.ensure_future(
+            client.get("/circuit_breaker/sleep", params={"delay": 1})
+        )
+        await asyncio.sleep(0.2)
+        assert circuit.state is CircuitState.HALF_OPEN
+        assert circuit.half_open_calls == 1
+
+        # The client went away, its trial slot is given back.
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert circuit.half_open_calls == 0
+        response = await client.get("/circuit_breaker/sleep")
+
+    assert response.status_code == 200
+    assert circuit.state is CircuitState.CLOSED
+
+
+def test_circuit_breaker_release():
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=0, half_open_max_calls=1)
+    circuit = breaker.circuit(name="service")
+    circuit.open(now=time.monotonic())
+
+    circuit.before_call()
+    with pytest.raises(CircuitOpenError):
+        circuit.before_call()
+    circuit.release()
+    circuit.before_call()
+    assert circuit.state is CircuitState.HALF_OPEN
+
+
+@pytest.mark.asyncio
+async def test_cache_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        first = await client.get("/cache/counter", params={"key": "sequential"})
+        second = await client.get("/cache/counter", params={"key": "sequential"})
+        other = await client.get("/cache/counter", params={"key": "other"})
+
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert other.json()["calls"] != first.json()["calls"]
+
+
+@pytest.mark.asyncio
+async def test_cache_coalesces_concurrent_misses_get():
+    params = {"key": "concurrent", "delay": 0.2}
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        responses = await asyncio.gather(
+            *(client.get("/cache/counter", params=params) for _ in range(5))
+        )
+    assert len({response.content for response in responses}) == 1
+
+
+@pytest.mark.asyncio
+async def test_cache_per_user_get():
+    params = {"key": str(uuid.uuid4()), "public": 1}
+    alice = {"authorization": "Bearer alice"}
+    bob = {"authorization": "Bearer bob"}
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        first_alice = await client.get("/cache/whoami", params=params, headers=alice)
+        first_bob = await client.get("/cache/whoami", params=params, headers=bob)
+        second_alice = await client.get("/cache/whoami", params=params, headers=alice)
+        private = [
+            await client.get("/cache/whoami", params={"key": params["key"]}, headers=alice)
+            for _ in range(2)
+        ]
+
+    assert first_alice.json()["authorization"] == "Bearer alice"
+    assert first_bob.json()["authorization"] == "Bearer bob"
+    assert second_alice.json() == first_alice.json()
+    # Not marked public: a response to an authorized request is never stored.
+    assert private[0].json()["calls"] != private[1].json()["calls"]
+
+
+@pytest.mark.asyncio
+async def test_cache_revalidation_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        first = await client.get("/cache/revalidate_counter", params={"key": "etag"})
+        second = await client.get("/cache/revalidate_counter", params={"key": "etag"})
+
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert second.headers["etag"] == '"counter"'
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, px):
+        self.data[key] = value
+
+    async def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.mark.asyncio
+async def test_cache_backends():
+    def create_entry(body):
+        return CacheEntry(
+            body=body,
+            status_code=200,
+            headers=[("content-type", "application/json")],
+            expires_at=4102444800.0,
+            etag='"v1"',
+        )
+
+    memory = MemoryCache(max_bytes=150)
+    await memory.set("first", create_entry(b"1" * 40), ttl=60)
+    await memory.set("second", create_entry(b"2" * 40), ttl=60)
+    assert await memory.get("first") is not None
+    await memory.set("third", create_entry(b"3" * 40), ttl=60)
+    assert await memory.get("second") is None
+    assert await memory.get("first") is not None
+    assert memory.size <= 150
+
+    redis = RedisCache(redis=FakeRedis())
+    await redis.set("key", create_entry(b'{"a": 1}'), ttl=60)
+    entry = await redis.get("key")
+    assert entry.body == b'{"a": 1}'
+    assert entry.headers == [("content-type", "application/json")]
+    assert entry.etag == '"v1"'
+
+    policy = CachePolicy(ttl=60, backend=memory)
+    assert policy.create_entry(
+        body=b"", status_code=200, headers={"cache-control": "no-store"}, now=0
+    ) is None
+    assert policy.create_entry(
+        body=b"", status_code=200, headers={"cache-control": "max-age=5"}, now=0
+    ).expires_at == 5
+
+
+@pytest.mark.asyncio
+async def test_coalesce_get():
+    params = {"key": "coalesce", "delay": 0.2}
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        responses = await asyncio.gather(
+            *(client.get("/coalesce/counter", params=params) for _ in range(5))
+        )
+        other_user = client.get(
+            "/coalesce/counter", params=params, headers={"authorization": "other"}
+        )
+        responses_users = await asyncio.gather(
+            client.get("/coalesce/counter", params=params), other_user
+        )
+        response_later = await client.get("/coalesce/counter", params=params)
+
+    assert len({response.content for response in responses}) == 1
+    assert all(response.status_code == 200 for response in responses)
+    assert responses_users[0].content != responses_users[1].content
+    assert response_later.content != responses[0].content
+
+
+def test_route_plan_and_headers():
+    plan = compile_route_plan(
+        gateway_path="/items/{kind}/{item_id:int}",
+        service_path="/v1/items/{item_id}/{kind}",
+        query_params=["query_int"],
+    )
+    assert plan.path.render({"item_id": 1, "kind": "full"}) == "/v1/items/1/full"
+    assert plan.query_params == ("query_int",)
+    assert plan.body_params == plan.form_params == ()
+    assert compile_route_plan(gateway_path="/static").path.render({}) == "/static"
+    files = compile_route_plan(gateway_path="/files/{file_path:path}")
+    assert files.path.render({"file_path": "a/b.txt"}) == "/files/a/b.txt"
+    with pytest.raises(ValueError):
+        compile_route_plan(gateway_path="/items", service_path="/v1/items/{item_id}")
+
+    headers = generate_headers_for_microservice(
+        headers=Headers(
+            raw=[
+                (b"host", b"gateway.example.com"),
+                (b"content-type", b"application/json"),
+                (b"content-length", b"12"),
+                (b"x-api-key", b"secret"),
+            ]
+        )
+    )
+    assert headers.items() == [
+        ("x-api-key", "secret"),
+        ("gateway_host", "gateway.example.com"),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_response_transform_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get(url="/encoded_text")
+        response_unquoted = await client.get(url="/encoded_text/unquoted")
+    assert response.json() == {"name": "John%20Doe", "note": "100%25 done"}
+    assert response_unquoted.json() == {"name": "John Doe", "note": "100%25 done"}
+
+    transform = unquote_fields("items.*.title")
+    assert transform({"items": [{"title": "a%2Fb"}, {"id": 1}]}) == {
+        "items": [{"title": "a/b"}, {"id": 1}]
+    }
+
+
+def test_response_transform_without_decoding():
+    for mode in ({"passthrough": True}, {"stream": True}):
+        with pytest.raises(ValueError):
+            route(
+                request_method=FastAPI().get,
+                service_url=SERVICE_URL,
+                gateway_path="/encoded_text",
+                service_path="/v1/encoded_text",
+                response_transform=unquote_fields("name"),
+                **mode,
+            )
+
+
+@pytest.mark.asyncio
+async def test_retry_get():
+    key = uuid.uuid4().hex
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        pool_responses = [
+            await client.get("/retry/pool_with_dead/list_model") for _ in range(4)
+        ]
+        flaky = await client.get("/retry/flaky", params={"key": key, "failures": 2})
+        exhausted = await client.get(
+            "/retry/flaky", params={"key": key + "exhausted", "failures": 5}
+        )
+        not_idempotent = await client.post(
+            "/retry/flaky", params={"key": key + "post", "failures": 1}
+        )
+
+    assert [response.status_code for response in pool_responses] == [200] * 4
+    assert (flaky.status_code, flaky.json()) == (200, {"calls": 3})
+    assert (exhausted.status_code, exhausted.json()) == (503, {"calls": 3})
+    assert (not_idempotent.status_code, not_idempotent.json()) == (503, {"calls": 1})
+
+
+def test_retry_budget():
+    budget = RetryBudget(ratio=0.5, min_retries_per_second=0)
+    for _ in range(4):
+        budget.record_request()
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+
+    policy = RetryPolicy(attempts=2, backoff=0.1, max_backoff=0.15, budget=budget)
+    assert policy.is_retryable_request(method="get", data=None)
+    assert not policy.is_retryable_request(method="post", data=None)
+    assert not policy.is_retryable_request(method="put", data=FormData())
+    assert not policy.can_retry(attempt=2)
+    assert 0 <= policy.delay(attempt=3) <= 0.15
+
+
+@pytest.mark.asyncio
+async def test_hedge_get():
+    started = time.monotonic()
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get(
+            "/hedge/slow_first", params={"key": uuid.uuid4().hex, "delay": 5}
+        )
+    assert time.monotonic() - started < 2
+    assert response.json() == {"calls": 2}
+    assert HEDGE_POLICY.stats()["hedge_wins"] == HEDGE_POLICY.stats()["hedged"] == 1
+
+
+def test_hedge_policy():
+    policy = HedgePolicy(min_samples=20, min_delay=0.001, max_ratio=0.5)
+    for latency in range(1, 20):
+        policy.observe(latency / 100)
+    assert policy.hedge_delay() is None
+    policy.observe(0.2)
+    assert policy.hedge_delay() == 0.2
+
+    for _ in range(2):
+        policy.record_request()
+    assert [policy.acquire(), policy.acquire()] == [True, False]
+    assert policy.stats()["capped"] == 1
+
+
+@pytest.mark.asyncio
+async def test_timeouts_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get("/timeouts/sleep")
+        response_ttfb = await client.get("/timeouts/sleep", params={"delay": 1})
+        response_deadline = await client.get(
+            "/timeouts/sleep", headers={"x-request-timeout": "1000"}
+        )
+        response_expired = await client.get(
+            "/timeouts/sleep", headers={"x-request-timeout": "0"}
+        )
+        response_pool = await client.get("/timeouts/pool_sleep", params={"delay": 1})
+
+    assert response.json() == {"deadline": "5000"}
+    assert response_ttfb.status_code == 504
+    assert 900 < int(response_deadline.json()["deadline"]) <= 1000
+    assert response_expired.status_code == 504
+    assert response_expired.json() == {"detail": "Service timeout."}
+    assert response_pool.status_code == 504
+
+
+@pytest.mark.asyncio
+async def test_deadline_from_arrival_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get(
+            "/timeouts/slow_dependency", headers={"x-request-timeout": "1000"}
+        )
+
+    # The 300 ms spent in the dependency are taken from the deadline of the client.
+    assert 600 < int(response.json()["deadline"]) <= 700
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limits_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        route_responses = await asyncio.gather(
+            *[client.get("/limits/route_sleep", params={"delay": 0.3}) for _ in range(3)]
+        )
+        service_responses = await asyncio.gather(
+            *[client.get("/limits/service_sleep", params={"delay": 0.3}) for _ in range(2)]
+        )
+
+    assert sorted(response.status_code for response in route_responses) == [200, 200, 429]
+    assert sorted(response.status_code for response in service_responses) == [200, 503]
+    assert {"detail": "Service is overloaded."} in [
+        response.json() for response in service_responses
+    ]
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit_queue():
+    limit = ConcurrencyLimit(max_in_flight=1, max_queue=2, queue_timeout=0.05)
+    await limit.acquire()
+    with pytest.raises(ConcurrencyLimitError):
+        await limit.acquire()
+
+    cancelled = asyncio.ensure_future(limit.acquire())
+    waiting = asyncio.ensure_future(limit.acquire())
+    await asyncio.sleep(0)
+    cancelled.cancel()
+    await asyncio.sleep(0)
+    limit.release(latency=0.01, failed=False)
+    await waiting
+    assert cancelled.cancelled()
+    assert (limit.in_flight, limit.queued, limit.rejected) == (1, 0, 1)
+
+    adaptive = AdaptiveLimit(min_limit=2, max_limit=11, latency_threshold=1)
+    assert adaptive.update(limit=10, in_flight=5, latency=0.1, failed=False) == 11
+    assert adaptive.update(limit=11, in_flight=9, latency=0.1, failed=False) == 11
+    assert adaptive.update(limit=10, in_flight=1, latency=0.1, failed=False) == 10
+    assert adaptive.update(limit=10, in_flight=9, latency=2, failed=False) == 9
+    assert adaptive.update(limit=2, in_flight=2, latency=0.1, failed=True) == 2
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_get():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        first_key = [
+            await client.get("/rate_limit/plain_text", headers={"x-api-key": "first"})
+            for _ in range(3)
+        ]
+        second_key = await client.get(
+            "/rate_limit/plain_text", headers={"x-api-key": "second"}
+        )
+
+    assert [response.status_code for response in first_key] == [200, 200, 429]
+    assert first_key[0].content == b"raw %20 text"
+    assert first_key[0].headers["ratelimit-limit"] == "2"
+    assert first_key[0].headers["ratelimit-remaining"] == "1"
+    assert first_key[2].headers["ratelimit-remaining"] == "0"
+    assert first_key[2].headers["retry-after"] == "30"
+    assert first_key[2].json() == {"detail": "Too many requests."}
+    assert second_key.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_gateway_rate_limit():
+    app = FastAPI()
+    setup_gateway(app, rate_limit=RateLimit(rate=1, period=10, header="x-api-key"))
+
+    @app.get("/ping")
+    async def ping():
+        return {"ping": "pong"}
+
+    async with AsyncClient(app=app, base_url="http://gateway") as client:
+        responses = [await client.get("/ping") for _ in range(2)]
+        other_key = await client.get("/ping", headers={"x-api-key": "other"})
+
+    assert [response.status_code for response in responses] == [200, 429]
+    assert responses[0].headers["ratelimit-policy"] == "1;w=10"
+    assert responses[1].headers["retry-after"] == "10"
+    assert other_key.status_code == 200
+
+
+def test_gcra():
+    result, tat = gcra(tat=None, now=100.0, interval=1.0, burst=3)
+    assert (result.allowed, result.remaining, tat) == (True, 2, 101.0)
+    result, tat = gcra(tat=102.0, now=100.0, interval=1.0, burst=3)
+    assert (result.allowed, result.remaining, tat) == (True, 0, 103.0)
+    result, tat = gcra(tat=103.0, now=100.0, interval=1.0, burst=3)
+    assert (result.allowed, result.retry_after, tat) == (False, 1.0, None)
+
+
+@pytest.mark.asyncio
+async def test_memory_rate_limit_backend_eviction():
+    backend = MemoryRateLimitBackend(max_keys=2)
+    await backend.hit("a", interval=60, burst=5)
+    await backend.hit("b", interval=60, burst=5)
+    await backend.hit("a", interval=60, burst=5)
+    await backend.hit("c", interval=60, burst=5)
+    # b is the least recently hit key.
+    assert list(backend._tats) == ["a", "c"]
+
+    backend = MemoryRateLimitBackend(max_keys=3)
+    await backend.hit("a", interval=60, burst=5)
+    await backend.hit("refilled", interval=0.001, burst=1)
+    await backend.hit("b", interval=60, burst=5)
+    await asyncio.sleep(0.01)
+    await backend.hit("c", interval=60, burst=5)
+    # A full bucket next in line goes with the one making room.
+    assert list(backend._tats) == ["b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_metrics_get():
+    prometheus_client = pytest.importorskip("prometheus_client")
+    app = FastAPI()
+    gateway = setup_gateway(
+        app,
+        client=GatewayClient(
+            metrics=GatewayMetrics(registry=prometheus_client.CollectorRegistry())
+        ),
+    )
+    app.include_router(router1)
+
+    async with AsyncClient(app=app, base_url=URL) as client:
+        assert (await client.get("/list_model")).status_code == 200
+        assert (await client.get("/plain_text")).status_code == 200
+        response = await client.get("/timeouts/pool_sleep", params={"delay": 1})
+        assert response.status_code == 504
+        response = await client.get(
+            "/retry/flaky", params={"key": uuid.uuid4().hex, "failures": 1}
+        )
+        assert response.status_code == 200
+        response = await client.get(
+            "/hedge/slow_first", params={"key": uuid.uuid4().hex, "delay": 5}
+        )
+        assert response.status_code == 200
+        responses = await asyncio.gather(
+            *[client.get("/limits/service_sleep", params={"delay": 0.3}) for _ in range(2)]
+        )
+        assert sorted(response.status_code for response in responses) == [200, 503]
+        metrics = (await client.get(BASE_URL_MICROSERVICE + "/metrics")).text
+    await gateway.shutdown()
+
+    route = f'route="{PREFIX_GATEWAY}/list_model"'
+    upstream = f'upstream="{SERVICE_URL}"'
+    assert f'gateway_requests_total{{method="GET",{route},status="200"}} 1.0' in metrics
+    assert f"gateway_upstream_ttfb_seconds_count{{{route},{upstream}}} 1.0" in metrics
+    assert f"gateway_upstream_connect_seconds_count{{{route},{upstream}}}" in metrics
+    assert f"gateway_overhead_seconds_count{{{route}}} 1.0" in metrics
+    assert f"gateway_response_bytes_total{{{route}}}" in metrics
+    assert 'status="504"' in metrics
+    assert 'error="TimeoutError"' in metrics
+    assert f'gateway_upstream_connections{{state="limit",{upstream}}}' in metrics
+    assert f'gateway_retries_total{{route="{PREFIX_GATEWAY}/retry/flaky"}} 1.0' in metrics
+    hedge_route = f'route="{PREFIX_GATEWAY}/hedge/slow_first"'
+    stats = HEDGE_POLICY.stats()
+    assert f"gateway_hedges_total{{{hedge_route}}} {float(stats['hedged'])}" in metrics
+    assert f"gateway_hedge_wins_total{{{hedge_route}}} {float(stats['hedge_wins'])}" in metrics
+    assert stats["hedge_wins"] >= 1
+    assert f"gateway_hedge_delay_seconds{{{hedge_route}}} 0.05" in metrics
+    limit_route = f'route="{PREFIX_GATEWAY}/limits/service_sleep"'
+    assert f'gateway_limit_rejections_total{{limit="service",{limit_route}}} 1.0' in metrics
+
+
+def test_request_timer():
+    timer = RequestTimer()
+    timer.call_started()
+    time.sleep(0.05)
+    # A hedge overlapping the first call does not add its own time.
+    timer.call_started()
+    time.sleep(0.05)
+    timer.call_ended()
+    timer.call_ended()
+    # Waits between calls, like a retry backoff, are not upstream time.
+    time.sleep(0.1)
+    timer.call_started()
+    time.sleep(0.05)
+    timer.call_ended()
+    assert 0.15 <= timer.upstream < 0.2
+
+
+def test_connection_counts():
+    assert connection_counts(object()) is None
+
+
+@pytest.mark.asyncio
+async def test_tracing_get():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+        InMemorySpanExporter,
+    )
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    app = FastAPI()
+    gateway = setup_gateway(
+        app, client=GatewayClient(tracing=GatewayTracing(tracer_provider=provider))
+    )
+    app.include_router(router1)
+
+    client_trace_id = "4bf92f3577b34da6a3ce929d0e0e4736"
+    async with AsyncClient(app=app, base_url=URL) as client:
+        response = await client.get(
+            "/tracing/traceparent",
+            params={"key": "foo"},
+            headers={"traceparent": f"00-{client_trace_id}-00f067aa0ba902b7-01"},
+        )
+    await gateway.shutdown()
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    assert set(spans) == {
+        f"GET {PREFIX_GATEWAY}/tracing/traceparent",
+        "unzip params",
+        "generate headers",
+        "GET upstream",
+        "connect",
+        "upstream wait",
+        "response decode",
+    }
+    request_span = spans[f"GET {PREFIX_GATEWAY}/tracing/traceparent"]
+    call_span = spans["GET upstream"]
+    assert format(request_span.context.trace_id, "032x") == client_trace_id
+    assert {span.context.trace_id for span in spans.values()} == {
+        request_span.context.trace_id
+    }
+    assert call_span.parent.span_id == request_span.context.span_id
+    assert spans["connect"].parent.span_id == call_span.context.span_id
+    assert spans["upstream wait"].parent.span_id == call_span.context.span_id
+    assert call_span.attributes["http.response.status_code"] == 200
+
+    # The microservice continues the trace from the call span.
+    _, trace_id, parent_id, _ = response.json()["traceparent"].split("-")
+    assert trace_id == client_trace_id
+    assert parent_id == format(call_span.context.span_id, "016x")
+
+
+def test_tracing_disabled():
+    from fastapi_gateway.tracing import NO_SPAN, call_span, phase_span
+
+    assert phase_span(None, "unzip params") is NO_SPAN
+    assert call_span(None, method="get", url="http://service") is NO_SPAN
+
+
+@pytest_asyncio.fixture
+async def http2_microservice():
+    pytest.importorskip("h2")
+    hypercorn_asyncio = pytest.importorskip("hypercorn.asyncio")
+    from hypercorn.config import Config
+    from tests.fastapi_microservice.main import app as app_microservice
+
+    config = Config()
+    config.bind = [HTTP2_SERVICE_URL.split("//")[1]]
+    config.loglevel = "WARNING"
+    shutdown = asyncio.Event()
+    server = asyncio.ensure_future(
+        hypercorn_asyncio.serve(app_microservice, config, shutdown_trigger=shutdown.wait)
+    )
+    await asyncio.sleep(0.5)
+    yield
+    shutdown.set()
+    await server
+
+
+@pytest.mark.asyncio
+async def test_http2_transport(http2_microservice):
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        # One connection carries all of the concurrent calls.
+        versions = await asyncio.gather(
+            *(client.get("/http2/http_version") for _ in range(20))
+        )
+        query_and_body = await client.post(
+            "/http2/query_and_body",
+            params={"query_int": 1, "query_str": "foo"},
+            json={"example_int": 2, "example_str": "bar"},
+        )
+        form = await client.post(
+            "/http2/form_data", data={"username": "ivanov124", "password": "pwd"}
+        )
+        async with client.stream("GET", "/http2/download_file") as response:
+            chunks = [chunk async for chunk in response.aiter_raw()]
+
+    assert {response.json()["http_version"] for response in versions} == {"2"}
+    assert query_and_body.json() == {
+        "example_int": 2,
+        "example_str": "bar",
+        "query_int": 1,
+        "query_str": "foo",
+    }
+    assert form.json() == {"foo": "bar", "password": "pwd", "username": "ivanov124"}
+    assert response.headers["content-type"] == "image/jpeg"
+    with open("src/photo.jpg", "rb") as photo:
+        assert b"".join(chunks) == photo.read()
+
+
+@pytest.mark.asyncio
+async def test_http2_transport_metrics(http2_microservice):
+    transport = HTTP2Transport(h2c=True)
+    upstream_metrics = UpstreamMetrics(buckets=LATENCY_BUCKETS)
+    for _ in range(2):
+        body, status_code, _ = await transport.make_request(
+            url=HTTP2_SERVICE_URL + "/v1/http_version",
+            method="get",
+            headers={},
+            trace_request_ctx=upstream_metrics,
+        )
+        assert status_code == 200
+    await transport.close()
+
+    assert sum(upstream_metrics.ttfb.counts) == 2
+    # The second call reuses the connection.
+    assert sum(upstream_metrics.connect.counts) == 1
+
+
+@pytest.mark.asyncio
+async def test_http2_transport_unavailable():
+    pytest.importorskip("h2")
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get("/http2/http_version")
+    assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_asgi_transport():
+    with open("src/photo.jpg", "rb") as photo:
+        content = photo.read()
+
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        version = await client.get("/asgi/http_version")
+        query_and_body = await client.post(
+            "/asgi/query_and_body",
+            params={"query_int": 1, "query_str": "foo"},
+            json={"example_int": 2, "example_str": "bar"},
+        )
+        upload = await client.post(
+            "/asgi/upload_file_checksum",
+            files={"file": ("example_photo.jpg", content, "image/jpeg")},
+        )
+        async with client.stream("GET", "/asgi/download_file") as response:
+            chunks = [chunk async for chunk in response.aiter_raw()]
+
+    assert version.json() == {"http_version": "1.1"}
+    assert query_and_body.json() == {
+        "example_int": 2,
+        "example_str": "bar",
+        "query_int": 1,
+        "query_str": "foo",
+    }
+    assert upload.json() == {"size": len(content), "md5": hashlib.md5(content).hexdigest()}
+    assert response.headers["content-type"] == "image/jpeg"
+    assert b"".join(chunks) == content
+
+
+@pytest.mark.asyncio
+async def test_asgi_transport_app_error():
+    async def failing_app(scope, receive, send):
+        raise RuntimeError("boom")
+
+    async def streaming_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        for chunk in (b"a", b"b", b"c"):
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    body, status, headers = await ASGITransport(app=failing_app).make_request(
+        url="http://service/", method="get", headers={}
+    )
+    assert (status, body) == (500, b"Internal Server Error")
+
+    response = await ASGITransport(app=streaming_app).open_stream_request(
+        url="http://service/", method="get", headers={}
+    )
+    assert [chunk async for chunk in response.content.iter_chunked(1024)] == [b"a", b"b", b"c"]
+    response.release()
+
+
+@pytest_asyncio.fixture
+async def unix_microservice():
+    import uvicorn
+    from tests.fastapi_microservice.main import app as app_microservice
+
+    server = uvicorn.Server(
+        uvicorn.Config(app_microservice, uds=UNIX_SOCKET_PATH, log_level="warning")
+    )
+    task = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    yield
+    server.should_exit = True
+    await task
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_transport(unix_microservice):
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        responses = await asyncio.gather(
+            *(
+                client.post(
+                    "/unix/query_and_body",
+                    params={"query_int": number, "query_str": "foo"},
+                    json={"example_int": 2, "example_str": "bar"},
+                )
+                for number in range(10)
+            )
+        )
+    assert [response.json()["query_int"] for response in responses] == list(range(10))
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_service_url(unix_microservice):
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        responses = await asyncio.gather(
+            *(client.get(f"/unix/path_param/{number}") for number in range(10))
+        )
+    assert [response.json() for response in responses] == [
+        {"foo": "bar", "custom_int": str(number)} for number in range(10)
+    ]
+    session = gateway_client.session(service_url=f"unix://{UNIX_SOCKET_PATH}")
+    assert isinstance(session.connector, UnixConnector)
+    # Concurrent calls reuse the pooled keep-alive connections.
+    assert sum(len(idle) for idle in session.connector._conns.values()) >= 1
+
+
+@pytest.mark.asyncio
+async def test_unix_socket_service_url_unavailable():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get("/unix/path_param/1")
+    assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_aggregate():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        started = time.monotonic()
+        response = await client.get("/aggregate/item/7", params={"delay": 0.2})
+        elapsed = time.monotonic() - started
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "item": {"foo": "bar", "custom_int": 7},
+        "query": {"query_int": 7, "query_str": "bar"},
+        "list": [{"foo_key": "foo"}, {"foo_key": "bar"}],
+        "slow": {"deadline": None},
+    }
+    assert "x-gateway-partial" not in response.headers
+    # The slow leg runs next to the item and query legs, not after them.
+    assert elapsed < 0.35
+
+
+@pytest.mark.asyncio
+async def test_aggregate_optional_leg_timeout():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        response = await client.get("/aggregate/item/7", params={"delay": 1})
+
+    assert response.status_code == 200
+    assert response.json()["slow"] == {"deadline": None}
+    assert response.json()["query"] == {"query_int": 7, "query_str": "bar"}
+    assert response.headers["x-gateway-partial"] == "slow"
+
+
+@pytest.mark.asyncio
+async def test_aggregate_required_leg_failure():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        started = time.monotonic()
+        unprocessable = await client.get("/aggregate/required_failure/abc")
+        unavailable = await client.get("/aggregate/dead")
+        elapsed = time.monotonic() - started
+        merged = await client.get("/aggregate/required_failure/1")
+
+    # Client errors of a required leg are passed on, the other legs are cancelled.
+    assert unprocessable.status_code == 422
+    assert unprocessable.json()["detail"][0]["loc"] == ["path", "random_int"]
+    assert unavailable.status_code == 503
+    assert elapsed < 1
+    assert merged.json() == {"foo": "bar"}
+
+
+@pytest.mark.asyncio
+async def test_aggregate_route_timeout():
+    async with AsyncClient(app=app_gateway, base_url=URL) as client:
+        started = time.monotonic()
+        partial = await client.get("/aggregate/route_timeout", params={"delay": 1})
+        timed_out = await client.get("/aggregate/required_timeout")
+        elapsed = time.monotonic() - started
+
+    # Optional legs running at the deadline are cancelled and listed as failed.
+    assert partial.status_code == 200
+    assert partial.json() == {
+        "list": [{"foo_key": "foo"}, {"foo_key": "bar"}],
+        "slow": None,
+        "after_slow": None,
+    }
+    assert partial.headers["x-gateway-partial"] == "slow,after_slow"
+    assert timed_out.status_code == 504
+    assert elapsed < 1
+
+
+def test_aggregate_invalid_legs():
+    with pytest.raises(ValueError):
+        aggregate(
+            request_method=FastAPI().get,
+            gateway_path="/cycle",
+            legs=[
+                Leg(name="a", service_url=SERVICE_URL, service_path="/{b.id}"),
+                Leg(name="b", service_url=SERVICE_URL, service_path="/{a.id}"),
+            ],
+        )
+    with pytest.raises(ValueError):
+        aggregate(
+            request_method=FastAPI().get,
+            gateway_path="/unknown",
+            legs=[Leg(name="a", service_url=SERVICE_URL, service_path="/", depends_on=["b"])],
+        )
+
+    async def endpoint(item_id: int, request: Request, response: Response):
+        pass
+
+    register = aggregate(
+        request_method=FastAPI().get,
+        gateway_path="/typo/{item_id}",
+        legs=[Leg(name="a", service_url=SERVICE_URL, service_path="/fast/{typo}")],
+    )
+    with pytest.raises(ValueError):
+        register(endpoint)
+    register = aggregate(
+        request_method=FastAPI().get,
+        gateway_path="/typo/{item_id}",
+        legs=[Leg(name="a", service_url=SERVICE_URL, service_path="/", query_params=["q"])],
+    )
+    with pytest.raises(ValueError):
+        register(endpoint)
+
+
+BATCH_CALLS = [
+    {"path": PREFIX_GATEWAY + "/path_param/1"},
+    {
+        "method": "POST",
+        "path": PREFIX_GATEWAY + "/query_and_body",
+        "query": {"query_int": 2, "query_str": "foo"},
+        "body": {"example_int": 3, "example_str": "bar"},
+    },
+    {"path": PREFIX_GATEWAY + "/check_depends_header"},
+    {"path": PREFIX_GATEWAY + "/check_depends_header", "headers": {"x-api-key": "CALL"}},
+    {"path": PREFIX_GATEWAY + "/timeouts/sleep", "query": {"delay": 0.2}},
+    {"path": "/not_found"},
+    {"method": "POST", "path": "/batch", "body": []},
+]
+
+
+@pytest.mark.asyncio
+async def test_batch():
+    headers = {"x-api-key": "BATCH"}
+    async with AsyncClient(app=app_gateway, base_url=BASE_URL_MICROSERVICE) as client:
+        response = await client.post("/batch", json=BATCH_CALLS, headers=headers)
+
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["index"] for result in results] == list(range(len(BATCH_CALLS)))
+    assert [result["status"] for result in results] == [200, 200, 200, 200, 200, 404, 400]
+    assert results[0]["body"] == {"foo": "bar", "custom_int": "1"}
+    assert results[1]["body"] == {
+        "example_int": 3,
+        "example_str": "bar",
+        "query_int": 2,
+        "query_str": "foo",
+    }
+    assert results[2]["body"]["header"] == "BATCH"
+    assert results[3]["body"]["header"] == "CALL"
+    assert results[1]["headers"]["content-type"] == "application/json"
+
+
+@pytest.mark.asyncio
+async def test_batch_call_headers():
+    calls = [
+        {"path": PREFIX_GATEWAY + "/cache/whoami", "query": {"key": "batch"}},
+        {
+            "path": PREFIX_GATEWAY + "/cache/whoami",
+            "query": {"key": "batch"},
+            "headers": {"Authorization": "Bearer CALL"},
+        },
+    ]
+    headers = {"authorization": "Bearer BATCH"}
+    async with AsyncClient(app=app_gateway, base_url=BASE_URL_MICROSERVICE) as client:
+        response = await client.post("/batch", json=calls, headers=headers)
+
+    batch_result, call_result = response.json()
+    assert batch_result["body"]["authorization"] == "Bearer BATCH"
+    # The header of the call replaces the forwarded one whatever its case.
+    assert call_result["body"]["authorization"] == "Bearer CALL"
+
+
+@pytest.mark.asyncio
+async def test_batch_bodies():
+    calls = [
+        {
+            "method": "POST",
+            "path": PREFIX_GATEWAY + "/query_and_body",
+            "query": {"query_int": 2, "query_str": "foo"},
+            "headers": {"Content-Type": "text/plain", "content-length": "1"},
+            "body": {"example_int": 3, "example_str": "bar"},
+        },
+        {"path": PREFIX_GATEWAY + "/binary"},
+        {"path": PREFIX_GATEWAY + "/plain_text"},
+    ]
+    async with AsyncClient(app=app_gateway, base_url=BASE_URL_MICROSERVICE) as client:
+        response = await client.post("/batch", json=calls)
+
+    json_result, binary_result, text_result = response.json()
+    # Headers describing another body do not replace the JSON one of the call.
+    assert json_result["status"] == 200
+    assert json_result["body"]["example_int"] == 3
+    assert "encoding" not in json_result
+    assert binary_result["encoding"] == "base64"
+    assert base64.b64decode(binary_result["body"]) == bytes(range(256))
+    assert text_result["body"] == "raw %20 text"
+    assert "encoding" not in text_result
+
+
+@pytest.mark.asyncio
+async def test_batch_ndjson():
+    async with AsyncClient(app=app_gateway, base_url=BASE_URL_MICROSERVICE) as client:
+        async with client.stream(
+            "POST",
+            "/batch",
+            json=BATCH_CALLS[:2] + [BATCH_CALLS[4]],
+            headers={"accept": "application/x-ndjson"},
+        ) as response:
+            lines = [json.loads(line) async for line in response.aiter_lines() if line]
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    # The slow call is the last one to complete.
+    assert lines[-1]["index"] == 2
+    assert sorted(line["index"] for line in lines) == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_batch_limits():
+    async with AsyncClient(app=app_gateway, base_url=BASE_URL_MICROSERVICE) as client:
+        too_many = await client.post("/batch", json=[BATCH_CALLS[0]] * 21)
+        started = time.monotonic()
+        concurrent = await client.post("/batch", json=[BATCH_CALLS[4]] * 8)
+        elapsed = time.monotonic() - started
+
+    assert too_many.status_code == 413
+    assert [result["status"] for result in concurrent.json()] == [200] * 8
+    # max_concurrency=4: two rounds of 0.2 seconds.
+    assert 0.4 <= elapsed < 0.8
+
+
+class NestedBodyModel(BaseModel):
+    created: datetime.date
+    tags: list = []
+
+
+class AliasedBodyModel(BaseModel):
+    item_id: int = Field(alias="itemId")
+    nested: NestedBodyModel
+
+
+@pytest.mark.asyncio
+async def test_body_and_query_serialization():
+    model = AliasedBodyModel(itemId=1, nested={"created": "2024-01-02", "tags": ["a"]})
+    payload = await unzip_body_object(
+        all_params={"model": model, "extra": {"itemId": 2, "note": "x"}, "empty": None},
+        necessary_params=["model", "extra", "empty"],
+    )
+    assert payload.content_type == "application/json"
+    assert json.loads(payload.body) == {
+        "itemId": 2,
+        "nested": {"created": "2024-01-02", "tags": ["a"]},
+        "note": "x",
+    }
+
+    # Objects with distinct keys are spliced, a list is the member named after its param.
+    payload = await unzip_body_object(
+        all_params={"model": model, "tags": ["a", "b"], "extra": {"note": "x"}},
+        necessary_params=["model", "tags", "extra"],
+    )
+    assert json.loads(payload.body) == {
+        "itemId": 1,
+        "nested": {"created": "2024-01-02", "tags": ["a"]},
+        "tags": ["a", "b"],
+        "note": "x",
+    }
+    payload = await unzip_body_object(
+        all_params={"extra": {"itemId": 2}, "model": model},
+        necessary_params=["extra", "model"],
+    )
+    assert json.loads(payload.body)["itemId"] == 1
+    assert payload.body.count(b"itemId") == 1
+
+    query = await unzip_query_params(
+        all_params={"limit": 10, "name": "foo", "day": datetime.date(2024, 1, 2)},
+        necessary_params=["limit", "name", "day"],
+    )
+    assert query == {"limit": 10, "name": "foo", "day": "2024-01-02"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("codec", [UjsonCodec(), OrjsonCodec(), StdlibJSONCodec()])
+async def test_json_codecs(codec):
+    model = AliasedBodyModel(itemId=1, nested={"created": "2024-01-02", "tags": ["ю/"]})
+    payload = await unzip_body_object(
+        all_params={"model": model}, necessary_params=["model"], codec=codec
+    )
+    assert isinstance(payload.body, bytes)
+    assert codec.loads(payload.body) == {
+        "itemId": 1,
+        "nested": {"created": "2024-01-02", "tags": ["ю/"]},
+    }
+    assert codec.loads(codec.dumps({1: "a"})) == {"1": "a"}